@@ -1,8 +1,15 @@
 import streamlit as st
 from prompt_flow import execute_rag_flow
+from coderag.query_cache import query_cache
 
 st.title("CodeRAG: Your Coding Assistant")
 
+# The query cache lives in the server process and is shared by all sessions
+if query_cache() is not None:
+    cache_stats = query_cache().stats()
+    st.sidebar.caption(f"Query cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits, "
+                       f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)")
+
 # Initialize chat history
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -0,0 +1,379 @@
+import time
+import atexit
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from coderag.config import (
+    MODEL_PROVIDER,
+    OPENAI_API_KEY,
+    OPENAI_EMBEDDING_MODEL,
+    OLLAMA_BASE_URL,
+    OLLAMA_EMBEDDING_MODEL,
+    EMBEDDING_MAX_IN_FLIGHT,
+    EMBEDDING_RPM,
+    EMBEDDING_TPM,
+    EMBEDDING_RATE_LIMIT_RETRIES,
+    PROVIDER_RETRIES,
+    HTTP_POOL_SIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT
+)
+from coderag.embedding_decoding import json_embeddings, loads_json
+from coderag.resilience import (
+    CircuitOpenError,
+    RateLimitedError,
+    circuit_breaker,
+    is_transient_error,
+    backoff_delay
+)
+
+BACKOFF_BASE = 1.0  # Seconds to wait after a 429 without Retry-After, doubled per retry
+BACKOFF_MAX = 60.0
+
+class TokenBucket:
+    """Allows per_minute units per minute on average, in bursts of at most one minute's worth.
+
+    Waiters are served in arrival order: each reserves its amount at once and then sleeps until it is
+    covered. It is thread-safe and not bound to an event loop. A per_minute of 0 disables the limit.
+    """
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Take amount from the bucket; returns the seconds to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)  # A request larger than the quota waits for a full bucket
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - amount
+            self.updated = now
+            return max(-self.tokens / self.rate, 0.0)
+
+    async def acquire(self, amount=1):
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+class Limiter:
+    """Quota and concurrency state shared by every request to one provider in the process.
+
+    At most max_in_flight requests run at once, and token buckets hold requests and estimated tokens
+    to the per-minute quota. A 429 pauses all requests for the Retry-After time (or an exponential
+    backoff) and halves the concurrency, which then grows back by one request per success. The state
+    outlives single embed_batches() calls, so a backoff is kept by the next one.
+    Asynchronous requests take their turn with acquire_slot() and wait_turn(), synchronous ones (of
+    any thread) with turn(), so all of them count against the same limits.
+    """
+
+    def __init__(self, max_in_flight=EMBEDDING_MAX_IN_FLIGHT, requests_per_minute=EMBEDDING_RPM,
+                 tokens_per_minute=EMBEDDING_TPM, clock=time.monotonic):
+        self.max_in_flight = max(max_in_flight, 1)
+        self.limit = self.max_in_flight
+        self.in_flight = 0
+        self.clock = clock
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.resume_at = 0.0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._waiters = []  # Requests waiting for a slot: futures on their event loop, or threading.Events
+
+    def _take_slot(self, new_waiter):
+        """Take a free slot and return None, or register and return new_waiter() to wait for one."""
+        with self._lock:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return None
+            waiter = new_waiter()
+            self._waiters.append(waiter)
+            return waiter
+
+    async def acquire_slot(self):
+        while True:
+            waiter = self._take_slot(lambda: asyncio.get_running_loop().create_future())
+            if waiter is None:
+                return
+            await waiter
+
+    def release_slot(self):
+        with self._lock:
+            self.in_flight -= 1
+            waiters, self._waiters = self._waiters, []
+        for waiter in waiters:  # They compete for the slot again
+            if isinstance(waiter, threading.Event):
+                waiter.set()
+            else:
+                waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    def _reserve(self, texts):
+        """Seconds until a 429 pause ends and one request and the estimated tokens of texts fit in the quota."""
+        from coderag.embeddings import estimate_tokens
+        pause = self.resume_at - self.clock()
+        return max(pause, self.requests.reserve(1), self.tokens.reserve(sum(estimate_tokens(text) for text in texts)))
+
+    async def wait_turn(self, texts):
+        """Wait out a 429 pause, then for one request and the estimated tokens of texts."""
+        wait = self._reserve(texts)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.resume_at - self.clock()  # A 429 meanwhile extends the pause
+
+    @contextmanager
+    def turn(self, texts):
+        """Blocking counterpart of acquire_slot() and wait_turn(), held while a synchronous request runs."""
+        waiter = self._take_slot(threading.Event)
+        while waiter is not None:
+            waiter.wait()
+            waiter = self._take_slot(threading.Event)
+        try:
+            wait = self._reserve(texts)
+            while wait > 0:
+                time.sleep(wait)
+                wait = self.resume_at - self.clock()
+            yield
+        finally:
+            self.release_slot()
+
+    def back_off(self, retry_after, attempt):
+        delay = retry_after if retry_after is not None else min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+        delay *= random.uniform(1.0, 1.2)  # Keeps the paused requests from retrying in lockstep
+        with self._lock:
+            self.resume_at = max(self.resume_at, self.clock() + delay)
+            self.limit = max(1, self.limit // 2)
+            self.rate_limited += 1
+
+    def succeeded(self):
+        with self._lock:
+            if self.limit < self.max_in_flight:
+                self.limit += 1
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def rate_limiter(provider):
+    """Shared Limiter of the process for a provider, configured from EMBEDDING_MAX_IN_FLIGHT / RPM / TPM."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = Limiter()
+        return _limiters[provider]
+
+class AsyncEmbedder:
+    """Sends embedding requests concurrently while staying inside the provider's quota.
+
+    embed is a coroutine function embedding a list of texts with one request. limiter (a Limiter,
+    by default a new one from max_in_flight, requests_per_minute and tokens_per_minute) bounds the
+    requests in flight and holds them to the quota and to 429 backoffs.
+    """
+
+    def __init__(self, embed, max_in_flight=EMBEDDING_MAX_IN_FLIGHT, requests_per_minute=EMBEDDING_RPM,
+                 tokens_per_minute=EMBEDDING_TPM, max_retries=EMBEDDING_RATE_LIMIT_RETRIES, breaker=None,
+                 retries=PROVIDER_RETRIES, clock=time.monotonic, limiter=None):
+        self.embed = embed
+        self.breaker = breaker
+        self.retries = retries
+        self.max_retries = max_retries
+        self.limiter = limiter or Limiter(max_in_flight, requests_per_minute, tokens_per_minute, clock)
+
+    @property
+    def rate_limited(self):
+        return self.limiter.rate_limited
+
+    async def request(self, texts):
+        """Embed texts with one request, retrying it while the provider answers 429 or fails transiently.
+
+        Transient failures (see resilience.is_transient_error) are retried PROVIDER_RETRIES times with
+        jittered backoff and counted by the circuit breaker, which refuses requests while it is open.
+        429s are retried after the limiter's backoff and leave the breaker's failure count unchanged.
+        """
+        rate_limited = failed = 0
+        last_error = None
+        while True:
+            if last_error is not None:
+                await asyncio.sleep(backoff_delay(failed - 1))
+            if self.breaker is not None and not self.breaker.allow():
+                raise last_error if last_error is not None else CircuitOpenError(self.breaker)
+            await self.limiter.acquire_slot()
+            try:
+                await self.limiter.wait_turn(texts)
+                embeddings = await self.embed(texts)
+            except RateLimitedError as e:
+                if self.breaker is not None:
+                    self.breaker.record_rate_limited()
+                if rate_limited == self.max_retries:
+                    raise RateLimitedError(None, f"Still rate limited after {self.max_retries} retries") from e
+                self.limiter.back_off(e.retry_after, rate_limited)
+                rate_limited += 1
+                last_error = None  # The 429 pause replaces the failure backoff
+                continue
+            except Exception as e:
+                transient = is_transient_error(e)
+                self._record(success=not transient)
+                if not transient or failed == self.retries:
+                    raise
+                last_error = e
+                failed += 1
+                continue
+            finally:
+                self.limiter.release_slot()
+            self._record(success=True)
+            self.limiter.succeeded()
+            return embeddings
+
+    def _record(self, success):
+        if self.breaker is not None:
+            self.breaker.record_success() if success else self.breaker.record_failure()
+
+    async def embed_isolating_failures(self, texts):
+        """Async counterpart of embeddings._embed_isolating_failures()."""
+        from coderag.embeddings import _is_connection_error
+        try:
+            embeddings = await self.request(texts)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            return list(embeddings)
+        except Exception as e:
+            # Splitting only helps when the request failed because of its content
+            if len(texts) == 1 or isinstance(e, RateLimitedError) or _is_connection_error(e):
+                print(f"Error generating embeddings with {MODEL_PROVIDER} for {len(texts)} text(s): {e}")
+                return [None] * len(texts)
+        middle = len(texts) // 2
+        left, right = await asyncio.gather(self.embed_isolating_failures(texts[:middle]),
+                                           self.embed_isolating_failures(texts[middle:]))
+        return left + right
+
+    async def embed_all(self, batches):
+        """Embed a list of text batches concurrently; returns one list of embeddings (or None) per batch."""
+        return await asyncio.gather(*(self.embed_isolating_failures(batch) for batch in batches))
+
+def _retry_after(headers):
+    """Seconds to wait according to a 429 response's Retry-After (or OpenAI's retry-after-ms) header."""
+    if headers is None:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _openai_client():
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    return AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        max_retries=0,  # 429s are retried by AsyncEmbedder, which knows about the other requests
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE
+        ))
+    )
+
+def _openai_embed(client):
+    import openai
+    from coderag.embeddings import _decode_openai_response
+
+    async def embed(texts):
+        try:
+            response = await client.embeddings.create(model=OPENAI_EMBEDDING_MODEL, input=texts,
+                                                      encoding_format="base64")
+        except openai.RateLimitError as e:
+            raise RateLimitedError(_retry_after(e.response.headers), str(e)) from e
+        return _decode_openai_response(response)
+    return embed
+
+def _ollama_client():
+    import httpx
+    return httpx.AsyncClient(
+        base_url=OLLAMA_BASE_URL,
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+    )
+
+def _ollama_embed(client):
+    from coderag.embeddings import _ollama_embed as ollama_embed_sync
+
+    async def embed(texts):
+        response = await client.post("/api/embed", json={"model": OLLAMA_EMBEDDING_MODEL, "input": texts})
+        if response.status_code in (429, 503):  # Ollama answers 503 when its request queue is full
+            raise RateLimitedError(_retry_after(response.headers), f"HTTP {response.status_code}")
+        if response.status_code == 404 and "model" not in response.text.lower():
+            # Ollama before 0.3 has no batch endpoint; the synchronous path falls back per text
+            return await asyncio.to_thread(ollama_embed_sync, texts)
+        response.raise_for_status()
+        embeddings = loads_json(response.content).get("embeddings", [])
+        if not embeddings:
+            raise ValueError("No embeddings returned from Ollama")
+        return json_embeddings(embeddings)
+    return embed
+
+# Async clients are bound to the event loop that uses them, so every call runs on one loop of the process,
+# in a background thread, and shares its client and connection pool per provider
+_loop = None
+_loop_lock = threading.Lock()
+_clients = {}  # Provider -> async client, only used from _loop
+
+def _event_loop():
+    """Shared event loop of the process for embedding requests, started on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="embedding-requests", daemon=True).start()
+        return _loop
+
+def _client(provider):
+    """Pooled async client of a provider, created on first use; call from the shared event loop."""
+    if provider not in _clients:
+        _clients[provider] = _ollama_client() if provider == "ollama" else _openai_client()
+    return _clients[provider]
+
+async def _close_clients():
+    while _clients:
+        _, client = _clients.popitem()
+        await (client.aclose() if hasattr(client, "aclose") else client.close())
+
+@atexit.register
+def close_clients():
+    """Close the pooled connections and stop the shared event loop; both are recreated if used again."""
+    global _loop
+    with _loop_lock:
+        loop, _loop = _loop, None
+    if loop is not None:
+        asyncio.run_coroutine_threadsafe(_close_clients(), loop).result(timeout=HTTP_CONNECT_TIMEOUT)
+        loop.call_soon_threadsafe(loop.stop)
+
+async def embed_batches_async(batches):
+    """Embed text batches concurrently with the configured provider, in-flight limit and quota.
+
+    Runs on the shared event loop; see embed_batches().
+    """
+    provider = MODEL_PROVIDER.lower()
+    client = _client(provider)
+    # The limiter is shared by every call, so quota, 429 backoff and reduced concurrency carry over
+    embedder = AsyncEmbedder(_ollama_embed(client) if provider == "ollama" else _openai_embed(client),
+                             breaker=circuit_breaker("embeddings"), limiter=rate_limiter(provider))
+    return await embedder.embed_all(batches)
+
+def embed_batches(batches):
+    """Synchronous entry point, safe to call from any thread: run embed_batches_async() on the shared loop."""
+    return asyncio.run_coroutine_threadsafe(embed_batches_async(batches), _event_loop()).result()
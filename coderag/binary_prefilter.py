@@ -0,0 +1,105 @@
+import os
+import faiss
+import numpy as np
+
+PREFILTER_TYPES = ("none", "flat", "hnsw")
+CODE_TYPES = ("sign", "itq")
+ITQ_ITERATIONS = 50
+
+class BinaryPrefilter:
+    """First search stage over one-bit-per-dimension codes of the vectors, compared by Hamming distance.
+
+    Codes are the sign bits of the centered vectors ("sign") or of the centered vectors projected on a
+    rotation learned with iterative quantization ("itq"), which spreads variance evenly over the bits.
+    The codes are 32x smaller than float32 vectors and compared with popcounts, so narrowing a large
+    shard down to a few thousand candidates is fast; the candidates are then re-ranked exactly.
+    """
+
+    def __init__(self, dim, index_type="flat", code_type="sign", hnsw_m=32):
+        if index_type not in PREFILTER_TYPES[1:]:
+            raise ValueError(f"Unknown binary prefilter type '{index_type}', expected one of {PREFILTER_TYPES}")
+        if code_type not in CODE_TYPES:
+            raise ValueError(f"Unknown binary code type '{code_type}', expected one of {CODE_TYPES}")
+        self.dim = dim
+        self.index_type = index_type
+        self.code_type = code_type
+        self.nbits = (dim + 7) // 8 * 8  # Binary indexes need whole bytes; padding bits are always 0
+        self.mean = np.zeros(dim, dtype=np.float32)
+        self.projection = np.eye(dim, self.nbits, dtype=np.float32)
+        base = faiss.IndexBinaryFlat(self.nbits) if index_type == "flat" else faiss.IndexBinaryHNSW(self.nbits, hnsw_m)
+        self.index = faiss.IndexBinaryIDMap(base)
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def train(self, vectors):
+        """Learn the centering (and for itq the rotation) from a sample of the vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.mean = vectors.mean(axis=0)
+        if self.code_type == "itq":
+            rotation = _itq_rotation(vectors - self.mean)
+            self.projection = np.zeros((self.dim, self.nbits), dtype=np.float32)
+            self.projection[:, :self.dim] = rotation
+
+    def encode(self, vectors):
+        """Binary codes of the vectors as a (n, nbits / 8) uint8 array."""
+        projected = (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.projection
+        return np.packbits(projected > 0, axis=1)
+
+    def add(self, ids, vectors):
+        self.index.add_with_ids(self.encode(vectors), np.ascontiguousarray(ids, dtype=np.int64))
+
+    def remove_range(self, start, end):
+        """Remove codes with start <= id < end; returns None if the index cannot remove (HNSW)."""
+        try:
+            return self.index.remove_ids(faiss.IDSelectorRange(start, end))
+        except RuntimeError:
+            return None
+
+    def search(self, queries, n_candidates):
+        """Return the ids of the n_candidates nearest codes per query (-1 padded)."""
+        base = faiss.downcast_IndexBinary(self.index.index)
+        if isinstance(base, faiss.IndexBinaryHNSW):
+            base.hnsw.efSearch = max(base.hnsw.efSearch, n_candidates)
+        _, ids = self.index.search(self.encode(queries), n_candidates)
+        return ids
+
+    def save(self, base_path):
+        faiss.write_index_binary(self.index, base_path + ".binary")
+        with open(base_path + ".binary.npz", "wb") as f:
+            np.savez(f, mean=self.mean, projection=self.projection,
+                     index_type=self.index_type, code_type=self.code_type)
+
+    @classmethod
+    def load(cls, base_path):
+        with np.load(base_path + ".binary.npz") as data:
+            prefilter = cls(len(data["mean"]), str(data["index_type"]), str(data["code_type"]))
+            prefilter.mean, prefilter.projection = data["mean"], data["projection"]
+        prefilter.index = faiss.read_index_binary(base_path + ".binary")
+        return prefilter
+
+def prefilter_exists(base_path):
+    return os.path.exists(base_path + ".binary") and os.path.exists(base_path + ".binary.npz")
+
+def remove_prefilter_files(base_path):
+    """Delete the files of a binary prefilter; returns the paths that were removed."""
+    removed = []
+    for suffix in (".binary", ".binary.npz"):
+        if os.path.exists(base_path + suffix):
+            os.remove(base_path + suffix)
+            removed.append(base_path + suffix)
+    return removed
+
+def _itq_rotation(centered, iterations=ITQ_ITERATIONS):
+    """PCA followed by an ITQ rotation (Gong & Lazebnik) minimizing the binarization error."""
+    _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+    pca = eigenvectors[:, ::-1]
+    projected = centered @ pca
+    rotation, _ = np.linalg.qr(np.random.default_rng(1234).standard_normal((pca.shape[1], pca.shape[1])))
+    for _ in range(iterations):
+        codes = np.where(projected @ rotation >= 0, 1.0, -1.0)
+        # Orthogonal Procrustes: the rotation that best maps the projected vectors onto their codes
+        u, _, vt = np.linalg.svd(projected.T @ codes)
+        rotation = u @ vt
+    return (pca @ rotation).astype(np.float32)
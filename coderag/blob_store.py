@@ -0,0 +1,195 @@
+import os
+import glob
+import mmap
+import zlib
+import hashlib
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; zlib frames are written without it
+    zstandard = None
+
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+
+def content_hash(text):
+    """SHA-256 hex digest identifying a piece of content in the blob store."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _compress(data):
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), "zstd"
+    return zlib.compress(data, ZLIB_LEVEL), "zlib"
+
+def _decompress(frame, codec, size):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("The blob store contains zstd frames; install the 'zstandard' package to read them.")
+        return zstandard.ZstdDecompressor().decompress(frame, max_output_size=size)
+    if codec == "zlib":
+        return zlib.decompress(frame)
+    raise ValueError(f"Unknown blob codec '{codec}'")
+
+class BlobStore:
+    """Content-addressed, append-only file of compressed text frames.
+
+    Each distinct content is compressed once and appended to the file; its location is recorded in the
+    catalog (the metadata store) under its SHA-256. Reads go through a read-only mmap of the file, so
+    only the frames of the requested hashes are touched and decompressed.
+
+    compact() writes the live frames to a new generation of the file, named in the catalog together
+    with their new locations; the old file is deleted by remove_replaced() once the catalog is committed.
+    """
+
+    def __init__(self, path, catalog):
+        self.base_path = path
+        self.catalog = catalog
+        self._lock = threading.RLock()
+        self._map = None
+        self._map_key = None  # (path, inode) of the mapped file
+        self._dirty = False  # Frames were appended since the last flush
+        self._file = None  # Append handle of the current blob file, kept open between puts
+        self._replaced = []  # Files of earlier generations to delete after the next catalog commit
+
+    @property
+    def path(self):
+        """The blob file of the catalog's generation (the writer sees its own uncommitted switch)."""
+        return _generation_path(self.base_path, self.catalog.blob_generation())
+
+    def put(self, text):
+        """Store text if it is not stored yet; returns its content hash."""
+        return self.put_many([text])[0]
+
+    def put_many(self, texts):
+        """Store the texts that are not stored yet; returns their content hashes, in order.
+
+        The catalog is asked about all of them with one query, and new frames are appended through the
+        open handle of the blob file.
+        """
+        digests = [content_hash(text) for text in texts]
+        with self._lock:
+            # The catalog connection also sees its own uncommitted rows, so earlier batches are found
+            stored = set(self.catalog.blob_locations(digests))
+            rows = []
+            for digest, text in zip(digests, texts):
+                if digest in stored:
+                    continue
+                stored.add(digest)  # Repeats within the batch are written once
+                data = text.encode("utf-8")
+                frame, codec = _compress(data)
+                f = self._append_handle()
+                rows.append((digest, f.tell(), len(frame), len(data), codec))
+                f.write(frame)
+            if rows:
+                self._file.flush()  # Readers map the file, so the frames must reach it; fsync waits for flush()
+                self._dirty = True
+                self.catalog.add_blobs(rows)
+        return digests
+
+    def _append_handle(self):
+        path = self.path
+        if self._file is None or self._file.name != path:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(path, "ab")
+        return self._file
+
+    def flush(self):
+        """Make appended frames durable; called before the catalog rows referencing them are committed."""
+        with self._lock:
+            if self._dirty and self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def get_many(self, hashes):
+        """Return {hash: text} for the given content hashes, decompressing only those frames."""
+        for attempt in range(2):
+            generation, locations = self.catalog.blob_snapshot(hashes)
+            if not locations:
+                return {}
+            path = _generation_path(self.base_path, generation)
+            with self._lock:
+                try:
+                    data = self._mapping(path, max(offset + length for offset, length, _, _ in locations.values()))
+                except FileNotFoundError:
+                    if attempt:
+                        raise
+                    continue  # Compacted and deleted since the catalog was read; read it again
+                return {
+                    digest: _decompress(data[offset:offset + length], codec, size).decode("utf-8")
+                    for digest, (offset, length, size, codec) in locations.items()
+                }
+
+    def _mapping(self, path, required_size):
+        """Return a read-only mmap of a blob file covering at least required_size bytes."""
+        stat = os.stat(path)
+        # Remap when the file grew past the current mapping or another generation is read
+        if self._map is None or len(self._map) < required_size or self._map_key != (path, stat.st_ino):
+            with open(path, "rb") as f:
+                new_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map is not None:
+                self._map.close()
+            self._map, self._map_key = new_map, (path, stat.st_ino)
+        return self._map
+
+    def compact(self):
+        """Copy the frames still referenced by a chunk to a new generation of the blob file.
+
+        Returns (bytes_before, bytes_after). The catalog switches to the new file when the caller commits
+        it; until then other processes keep reading the old file, which remove_replaced() deletes after.
+        """
+        with self._lock:
+            generation = self.catalog.blob_generation()
+            old_path = _generation_path(self.base_path, generation)
+            if not os.path.exists(old_path):
+                return 0, 0
+            bytes_before = os.path.getsize(old_path)
+            live = self.catalog.referenced_blobs()
+            new_path = _generation_path(self.base_path, generation + 1)
+            rows = []
+            with open(old_path, "rb") as src, open(new_path, "wb") as dst:
+                for digest, offset, length, size, codec in live:
+                    src.seek(offset)
+                    rows.append((digest, dst.tell(), length, size, codec))
+                    dst.write(src.read(length))
+                dst.flush()
+                os.fsync(dst.fileno())
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.catalog.replace_blobs(rows, generation + 1)
+            self._replaced.append(old_path)
+            self._dirty = False
+            return bytes_before, os.path.getsize(new_path)
+
+    def remove_replaced(self):
+        """Delete blob files of earlier generations; call once the catalog switch is committed."""
+        with self._lock:
+            for path in self._replaced:
+                if os.path.exists(path):
+                    os.remove(path)
+            self._replaced = []
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+def _generation_path(base_path, generation):
+    """Blob file of a generation; generation 0 keeps the name of earlier versions."""
+    return base_path if generation == 0 else f"{base_path}.g{generation}"
+
+def remove_blob_files(base_path):
+    """Delete the blob files of every generation; returns the paths that were removed."""
+    removed = []
+    for path in [base_path] + sorted(glob.glob(glob.escape(base_path) + ".g*")):
+        if os.path.exists(path):
+            os.remove(path)
+            removed.append(path)
+    return removed
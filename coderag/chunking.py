@@ -0,0 +1,113 @@
+import ast
+from collections import namedtuple
+from coderag.config import CHUNK_MAX_LINES, CHUNK_MAX_CHARS, CHUNK_OVERLAP_LINES
+
+# A region of a file; lines are 1-based and inclusive
+Chunk = namedtuple("Chunk", ["content", "start_line", "end_line"])
+
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+def chunking_signature():
+    """The settings chunks depend on; files chunked with other settings are chunked again on startup."""
+    return f"ast-v1:{CHUNK_MAX_LINES}:{CHUNK_MAX_CHARS}:{CHUNK_OVERLAP_LINES}"
+
+def chunk_file(filepath, content):
+    """Split a file into chunks of at most CHUNK_MAX_LINES lines and CHUNK_MAX_CHARS characters.
+
+    Python files are split along their syntax tree: each function and class is a chunk, classes too
+    large for one chunk are split into their header and methods, and the statements between
+    definitions are grouped. Definitions that are still too large, files that do not parse and other
+    languages are cut into windows overlapping by CHUNK_OVERLAP_LINES lines. Blank files have no chunks.
+    """
+    lines = content.splitlines(keepends=True)
+    if not content.strip():
+        return []
+    if filepath.endswith(".py"):
+        try:
+            tree = ast.parse(content)
+        except (SyntaxError, ValueError):
+            pass
+        else:
+            return _chunk_statements(tree.body, lines, 1)
+    return _windows(lines, 1, len(lines))
+
+def _chunk(lines, start, end):
+    """Chunk of lines start..end with surrounding blank lines trimmed, or None if they are all blank."""
+    while start <= end and not lines[start - 1].strip():
+        start += 1
+    while end >= start and not lines[end - 1].strip():
+        end -= 1
+    if start > end:
+        return None
+    return Chunk("".join(lines[start - 1:end]), start, end)
+
+def _fits(lines, start, end):
+    return end - start + 1 <= CHUNK_MAX_LINES and sum(len(line) for line in lines[start - 1:end]) <= CHUNK_MAX_CHARS
+
+def _node_start(node, lines, first_line):
+    """First line of a statement, including its decorators and the comment lines right above it."""
+    start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+    while start > first_line and lines[start - 2].lstrip().startswith("#"):
+        start -= 1
+    return start
+
+def _chunk_statements(body, lines, first_line):
+    """Chunks of a sequence of statements starting at first_line: one per definition, others grouped."""
+    chunks = []
+    group = None  # (start, end) of the statements collected since the last definition
+
+    def flush():
+        if group is not None:
+            chunks.extend(_span(lines, *group))
+
+    for node in body:
+        start, end = _node_start(node, lines, first_line), node.end_lineno
+        first_line = end + 1
+        if isinstance(node, DEFINITIONS):
+            flush()
+            group = None
+            chunks.extend(_chunk_definition(node, lines, start, end))
+        elif group is not None and _fits(lines, group[0], end):
+            group = (group[0], end)
+        else:
+            flush()
+            group = (start, end)
+    flush()
+    return chunks
+
+def _chunk_definition(node, lines, start, end):
+    if _fits(lines, start, end):
+        return _span(lines, start, end)
+    if not isinstance(node, ast.ClassDef):
+        return _windows(lines, start, end)
+    # The class line, docstring and attributes up to the first method form the header
+    first_definition = next((i for i, child in enumerate(node.body) if isinstance(child, DEFINITIONS)), None)
+    if first_definition is None:
+        return _windows(lines, start, end)
+    header_end = _node_start(node.body[first_definition], lines, start + 1) - 1
+    return _span(lines, start, header_end) + _chunk_statements(node.body[first_definition:], lines, header_end + 1)
+
+def _span(lines, start, end):
+    """One chunk for lines start..end if they fit, sliding windows otherwise."""
+    if _fits(lines, start, end):
+        chunk = _chunk(lines, start, end)
+        return [chunk] if chunk is not None else []
+    return _windows(lines, start, end)
+
+def _windows(lines, start, end):
+    """Cut lines start..end into windows that fit and overlap by CHUNK_OVERLAP_LINES lines."""
+    chunks = []
+    first = start
+    while first <= end:
+        last, size = first - 1, 0
+        # A window always takes at least one line, even a line longer than CHUNK_MAX_CHARS
+        while last < end and last - first + 1 < CHUNK_MAX_LINES and (last < first or size + len(lines[last]) <= CHUNK_MAX_CHARS):
+            size += len(lines[last])
+            last += 1
+        chunk = _chunk(lines, first, last)
+        if chunk is not None:
+            chunks.append(chunk)
+        if last >= end:
+            break
+        first = max(last - CHUNK_OVERLAP_LINES + 1, first + 1)
+    return chunks
@@ -6,7 +6,7 @@ load_dotenv()
 
 # === Environment Variables ===
 # Model provider settings (loaded from .env)
-MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "ollama")  # "openai" or "ollama"
+MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "ollama")  # "openai", "ollama" or "local"
 
 # OpenAI API key and model settings (loaded from .env)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -18,18 +18,135 @@ OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")  # Defa
 OLLAMA_CHAT_MODEL = os.getenv("OLLAMA_CHAT_MODEL", "llama2")  # Default Ollama model
 OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "llama2")  # Default Ollama embedding model
 
+# The "local" provider embeds in-process by feature hashing (no server, no answers from a chat model);
+# more than 0 workers spreads large batches over that many processes
+LOCAL_EMBEDDING_WORKERS = int(os.getenv("LOCAL_EMBEDDING_WORKERS", 0))
+
 # Embedding dimension (from .env or fallback)
 # Note: Different models have different embedding dimensions
 # OpenAI text-embedding-ada-002: 1536
 # Ollama llama2: 4096 (may vary by model)
 EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 1536))  # Default to 1536 if not in .env
 
+# Texts per embedding request, and the estimated tokens (about 4 characters each) one request may carry
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 128))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 100000))
+# Embedding requests sent concurrently when many texts are embedded at once (1 = one after another),
+# the provider quota in requests and estimated tokens per minute (0 = unlimited), and how often a
+# rate-limited (HTTP 429) request is retried
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", 4))
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", 0))
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", 0))
+EMBEDDING_RATE_LIMIT_RETRIES = int(os.getenv("EMBEDDING_RATE_LIMIT_RETRIES", 6))
+
+# Reindexing pipeline: threads reading and chunking files, threads sending embedding requests
+# (0 = EMBEDDING_MAX_IN_FLIGHT), items each queue between the stages may hold, and files indexed
+# between commits of the index
+REINDEX_READERS = int(os.getenv("REINDEX_READERS", 2))
+REINDEX_EMBED_WORKERS = int(os.getenv("REINDEX_EMBED_WORKERS", 0))
+REINDEX_QUEUE_SIZE = int(os.getenv("REINDEX_QUEUE_SIZE", 256))
+REINDEX_COMMIT_FILES = int(os.getenv("REINDEX_COMMIT_FILES", 500))
+
+# Files are embedded in chunks of at most CHUNK_MAX_LINES lines and CHUNK_MAX_CHARS characters
+# (about 4 characters per token); Python files are split by function and class, oversized
+# definitions and other files by windows overlapping by CHUNK_OVERLAP_LINES lines
+CHUNK_MAX_LINES = int(os.getenv("CHUNK_MAX_LINES", 120))
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", 6000))
+CHUNK_OVERLAP_LINES = int(os.getenv("CHUNK_OVERLAP_LINES", 10))
+
+# HTTP connections kept open per provider (shared by the indexer, the monitor and the RAG flow),
+# and the timeouts in seconds for connecting and for waiting on a response
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 300))
+
+# Provider calls that fail with a connection error, timeout or 502/503/504 are retried PROVIDER_RETRIES
+# times with jittered exponential backoff (PROVIDER_RETRY_BASE doubling up to PROVIDER_RETRY_MAX seconds).
+# After CIRCUIT_FAILURE_THRESHOLD consecutive failures calls fail fast for CIRCUIT_RESET_TIMEOUT seconds,
+# and the indexer pauses and requeues its files instead of waiting out a timeout per file.
+PROVIDER_RETRIES = int(os.getenv("PROVIDER_RETRIES", 3))
+PROVIDER_RETRY_BASE = float(os.getenv("PROVIDER_RETRY_BASE", 0.5))
+PROVIDER_RETRY_MAX = float(os.getenv("PROVIDER_RETRY_MAX", 8))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+
 # Project directory (from .env)
 WATCHED_DIR = os.getenv("WATCHED_DIR", os.path.join(os.getcwd(), 'CodeRAG'))
 
 # Path to FAISS index (from .env or fallback)
 FAISS_INDEX_FILE = os.getenv("FAISS_INDEX_FILE", os.path.join(WATCHED_DIR, 'coderag_index.faiss'))
 
+# SQLite cache of embeddings by provider, model, dimension and text hash, so unchanged files are not
+# embedded again after a restart; least recently used entries go beyond EMBEDDING_CACHE_MAX_MB (0 = off)
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", os.path.splitext(FAISS_INDEX_FILE)[0] + ".embeddings.sqlite")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", 1024))
+
+# In-memory cache of search query embeddings shared by the serving process: entries kept
+# (0 = off) and seconds before an entry expires (0 = never)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 3600))
+
+# FAISS index type: "flat" (exact search), "hnsw", "ivf", "ivfpq", or scalar-quantized "sq8" / "fp16"
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+
+# HNSW parameters (neighbors per node, build-time and query-time beam width)
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", 200))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", 64))
+
+# IVF parameters (number of coarse clusters and clusters visited per query)
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", 1024))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", 16))
+
+# Product quantization parameters for "ivfpq" (EMBEDDING_DIM must be divisible by FAISS_PQ_M)
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", 64))
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", 8))
+
+# Optional reduction of stored embeddings to EMBEDDING_REDUCED_DIM dimensions: "none", "truncate"
+# (keep the leading dimensions, for Matryoshka-trained models), "pca" or "opq" (trained on the indexed
+# vectors once EMBEDDING_REDUCTION_MIN_VECTORS are stored; until then full embeddings are kept).
+# The reduction is saved with the index and also applied to queries.
+EMBEDDING_REDUCTION = os.getenv("EMBEDDING_REDUCTION", "none").lower()
+EMBEDDING_REDUCED_DIM = int(os.getenv("EMBEDDING_REDUCED_DIM", 512))
+EMBEDDING_REDUCTION_MIN_VECTORS = int(os.getenv("EMBEDDING_REDUCTION_MIN_VECTORS", 10000))
+
+# Maximum number of vectors sampled to train IVF and scalar quantizers
+FAISS_TRAIN_SAMPLE_SIZE = int(os.getenv("FAISS_TRAIN_SAMPLE_SIZE", 100000))
+
+# Lossy index types (ivfpq, sq8, fp16) keep full-precision vectors on disk and re-rank
+# FAISS_RERANK_FACTOR * k candidates exactly; 0 disables the on-disk copy and re-ranking
+FAISS_RERANK_FACTOR = int(os.getenv("FAISS_RERANK_FACTOR", 4))
+
+# Optional first search stage over binary codes: "none", "flat" (exhaustive Hamming scan) or "hnsw".
+# Codes are sign bits ("sign") or sign bits after a learned ITQ rotation ("itq"). A shard gets a
+# prefilter once it holds FAISS_BINARY_MIN_VECTORS vectors; each query re-ranks
+# FAISS_BINARY_CANDIDATES candidates with exact vectors kept on disk.
+FAISS_BINARY_PREFILTER = os.getenv("FAISS_BINARY_PREFILTER", "none").lower()
+FAISS_BINARY_CODES = os.getenv("FAISS_BINARY_CODES", "sign").lower()
+FAISS_BINARY_CANDIDATES = int(os.getenv("FAISS_BINARY_CANDIDATES", 2000))
+FAISS_BINARY_MIN_VECTORS = int(os.getenv("FAISS_BINARY_MIN_VECTORS", 50000))
+
+# Split the index into shards: "none" (single index) or "top_dir" (one shard per top-level directory
+# of WATCHED_DIR, e.g. per repository). Changing it requires `python scripts/compact_index.py`.
+INDEX_SHARD_BY = os.getenv("INDEX_SHARD_BY", "none").lower()
+# Threads used to search the shards concurrently (0 = Python's default pool size)
+INDEX_SEARCH_THREADS = int(os.getenv("INDEX_SEARCH_THREADS", 0))
+
+# Memory-map the index read-only when loading it for queries, so processes share one page-cache copy
+FAISS_MMAP = os.getenv("FAISS_MMAP", "false").lower() in ("1", "true", "yes")
+# Ask the OS to read the whole index file into the page cache when it is memory-mapped
+FAISS_MMAP_PREFAULT = os.getenv("FAISS_MMAP_PREFAULT", "false").lower() in ("1", "true", "yes")
+
+# Write-ahead log of index changes: fsync each commit, and fold the log into a new snapshot
+# once it reaches WAL_CHECKPOINT_BYTES or WAL_CHECKPOINT_INTERVAL seconds after the last snapshot
+WAL_FSYNC = os.getenv("WAL_FSYNC", "true").lower() in ("1", "true", "yes")
+WAL_CHECKPOINT_BYTES = int(os.getenv("WAL_CHECKPOINT_BYTES", 64 * 1024 * 1024))
+WAL_CHECKPOINT_INTERVAL = float(os.getenv("WAL_CHECKPOINT_INTERVAL", 300))
+
+# Index snapshots are written as numbered generations; older generations are kept a little while so
+# query processes still loading one are not cut off
+SNAPSHOT_KEEP_GENERATIONS = int(os.getenv("SNAPSHOT_KEEP_GENERATIONS", 2))
+
 # === Project-Specific Configuration ===
 # Define the root directory of the project
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
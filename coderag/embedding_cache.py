@@ -0,0 +1,136 @@
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from coderag.config import EMBEDDING_CACHE_FILE, EMBEDDING_CACHE_MAX_MB
+
+class EmbeddingCache:
+    """Disk-backed cache of embeddings keyed by (provider, model, dim, sha256(text)).
+
+    Embeddings are stored as float32 blobs in SQLite. Each hit refreshes the entry's last use, and
+    once the stored vectors exceed max_bytes the least recently used entries are evicted. Last uses
+    are kept in memory and written with the next put_many() (or every TOUCH_BATCH hits), so lookups
+    do not commit. The hit and miss counters cover this process.
+    """
+
+    TOUCH_BATCH = 10000  # Pending last-use updates written without waiting for a put_many()
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}  # (provider, model, dim, hash) -> last use not yet written
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (provider TEXT NOT NULL, model TEXT NOT NULL, "
+            "dim INTEGER NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, last_used INTEGER NOT NULL, "
+            "PRIMARY KEY (provider, model, dim, hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _keys_where(hashes):
+        return f"provider = ? AND model = ? AND dim = ? AND hash IN ({', '.join('?' * len(hashes))})"
+
+    def get_many(self, provider, model, dim, hashes):
+        """Return {hash: float32 vector} for the cached hashes, marking them as recently used."""
+        hashes = list(dict.fromkeys(hashes))
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), 500):  # Stays below SQLite's bound parameter limit
+                chunk = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE {self._keys_where(chunk)}",
+                    (provider, model, dim, *chunk)
+                ).fetchall()
+                found.update((h, np.frombuffer(vector, dtype=np.float32)) for h, vector in rows)
+            now = time.time_ns()
+            self._touched.update(((provider, model, dim, h), now) for h in found)
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._write_touched()
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, provider, model, dim, items):
+        """Store (hash, vector) pairs, evicting least recently used entries beyond the size cap."""
+        now = time.time_ns()
+        vectors = {h: np.asarray(vector, dtype=np.float32).tobytes() for h, vector in items}
+        if not vectors:
+            return
+        hashes = list(vectors)
+        with self._lock:
+            self._write_touched()
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                # Replaced entries no longer count with their old size
+                self._bytes -= self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE {self._keys_where(chunk)}",
+                    (provider, model, dim, *chunk)
+                ).fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(provider, model, dim, h, vector, now) for h, vector in vectors.items()])
+            self._bytes += sum(len(vector) for vector in vectors.values())
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _write_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE provider = ? AND model = ? AND dim = ? AND hash = ?",
+                [(last_used, *key) for key, last_used in self._touched.items()]
+            )
+            self._touched = {}
+
+    def _evict(self):
+        # Keep the most recently used entries whose running total fits in max_bytes
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM (SELECT rowid, SUM(LENGTH(vector)) "
+            "OVER (ORDER BY last_used DESC, rowid DESC) AS total FROM embeddings) WHERE total > ?)",
+            (self.max_bytes,)
+        )
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {"entries": entries, "bytes": self._bytes, "max_bytes": self.max_bytes, "hits": self.hits,
+                    "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._write_touched()
+            self._conn.commit()
+            self._conn.close()
+
+_lock = threading.Lock()
+_cache = None
+_cache_failed = False
+
+def embedding_cache():
+    """Shared cache of the process, or None when EMBEDDING_CACHE_MAX_MB is 0 or the file cannot be opened."""
+    global _cache, _cache_failed
+    if EMBEDDING_CACHE_MAX_MB <= 0:
+        return None
+    with _lock:
+        if _cache is None and not _cache_failed:
+            try:
+                _cache = EmbeddingCache(EMBEDDING_CACHE_FILE, EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Embedding cache disabled, cannot open {EMBEDDING_CACHE_FILE}: {e}")
+                _cache_failed = True
+        return _cache
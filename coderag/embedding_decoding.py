@@ -0,0 +1,46 @@
+import json
+import binascii
+import itertools
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; responses are parsed with the json module without it
+    orjson = None
+
+def loads_json(body):
+    """Parse a JSON response body (bytes), with orjson when it is installed (2-3x faster for embeddings)."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def decode_base64_embeddings(encoded):
+    """Decode base64 little-endian float32 vectors (OpenAI's encoding_format="base64") into one array.
+
+    Every vector is decoded straight into its row of a preallocated (n, dim) float32 array, without
+    creating a Python float per component.
+    """
+    if not encoded:
+        return np.zeros((0, 0), dtype=np.float32)
+    first = np.frombuffer(binascii.a2b_base64(encoded[0]), dtype="<f4")
+    embeddings = np.empty((len(encoded), len(first)), dtype=np.float32)
+    embeddings[0] = first
+    for row, text in enumerate(encoded[1:], start=1):
+        vector = np.frombuffer(binascii.a2b_base64(text), dtype="<f4")
+        if len(vector) != len(first):
+            raise ValueError(f"Embedding {row} has {len(vector)} dimensions, expected {len(first)}")
+        embeddings[row] = vector
+    return embeddings
+
+def json_embeddings(rows):
+    """Copy parsed JSON embeddings (lists of floats of equal length) into one (n, dim) float32 array.
+
+    The floats are written into the preallocated array directly, skipping the float64 array that
+    np.array(rows).astype("float32") builds first.
+    """
+    dim = len(rows[0]) if rows else 0
+    for row, vector in enumerate(rows):
+        if len(vector) != dim:
+            raise ValueError(f"Embedding {row} has {len(vector)} dimensions, expected {dim}")
+    flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.float32, count=len(rows) * dim)
+    return flat.reshape(len(rows), dim)
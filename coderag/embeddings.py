@@ -1,58 +1,228 @@
 import numpy as np
+from coderag.http_clients import openai_client, ollama_post
+from coderag.embedding_cache import embedding_cache
+from coderag.embedding_decoding import decode_base64_embeddings, json_embeddings, loads_json
+from coderag.chunking import chunk_file
+from coderag.local_embeddings import local_embeddings
+from coderag.resilience import (
+    call_with_retries,
+    circuit_breaker,
+    is_transient_error,
+    is_rate_limited,
+    CircuitOpenError,
+    RateLimitedError
+)
+from coderag.namespaces import embedding_model
 from coderag.config import (
-    MODEL_PROVIDER, 
-    OPENAI_API_KEY, 
+    MODEL_PROVIDER,
     OPENAI_EMBEDDING_MODEL,
-    OLLAMA_BASE_URL,
-    OLLAMA_EMBEDDING_MODEL
+    OLLAMA_EMBEDDING_MODEL,
+    EMBEDDING_DIM,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_MAX_IN_FLIGHT,
+    EMBEDDING_RATE_LIMIT_RETRIES
 )
 
 def generate_embeddings(text):
     """Generate embeddings using either OpenAI or Ollama based on configuration."""
-    if MODEL_PROVIDER.lower() == "ollama":
-        return _generate_ollama_embeddings(text)
+    embeddings, failed = generate_embeddings_batch([text])
+    return None if failed else embeddings
+
+def generate_embeddings_batch(texts):
+    """Embed many texts with as few requests as possible.
+
+    Texts are grouped into requests of at most EMBEDDING_BATCH_SIZE texts and EMBEDDING_BATCH_TOKENS
+    estimated tokens. When there are several requests and EMBEDDING_MAX_IN_FLIGHT > 1, they are sent
+    concurrently within the EMBEDDING_RPM / EMBEDDING_TPM quota (see coderag.async_embeddings).
+    Texts found in the embedding cache (see coderag.embedding_cache) are not sent at all, and
+    identical texts are sent once. Returns (embeddings, failed): a (len(texts), dim) float32 matrix
+    in input order, and the sorted positions of the texts that could not be embedded, whose rows are NaN.
+    The "local" provider embeds in-process and never fails, so it bypasses all of this.
+    """
+    if MODEL_PROVIDER.lower() == "local":
+        return local_embeddings(texts, EMBEDDING_DIM), []
+    results = [None] * len(texts)
+    cache = embedding_cache()
+    model = embedding_model(MODEL_PROVIDER)
+    hashes = [cache.text_hash(text) for text in texts] if cache is not None else list(texts)
+    if cache is not None:
+        cached = cache.get_many(MODEL_PROVIDER.lower(), model, EMBEDDING_DIM, hashes)
+        results = [cached.get(h) for h in hashes]
+
+    missing = {}  # Hash (or text) -> first position, so duplicates are embedded once
+    for position, h in enumerate(hashes):
+        if results[position] is None:
+            missing.setdefault(h, position)
+    embedded = _embed_uncached([texts[position] for position in missing.values()])
+    by_hash = dict(zip(missing, embedded))
+    for position, h in enumerate(hashes):
+        if results[position] is None:
+            results[position] = by_hash[h]
+    if cache is not None:
+        cache.put_many(MODEL_PROVIDER.lower(), model, EMBEDDING_DIM,
+                       [(h, e) for h, e in by_hash.items() if e is not None and len(e) == EMBEDDING_DIM])
+
+    dim = next((len(e) for e in results if e is not None), EMBEDDING_DIM)
+    embeddings = np.full((len(texts), dim), np.nan, dtype=np.float32)
+    failed = []
+    for position, embedding in enumerate(results):
+        if embedding is None or len(embedding) != dim:
+            failed.append(position)
+        else:
+            embeddings[position] = embedding
+    return embeddings, failed
+
+def embed_file_chunks(filepaths, contents):
+    """Split files into chunks (see coderag.chunking) and embed all of them with batched requests.
+
+    Returns (chunks, embeddings, failed) per file: the chunks that were embedded, their (len(chunks), dim)
+    embeddings and the number of chunks that could not be embedded. Blank files have no chunks.
+    """
+    return embed_chunks([chunk_file(filepath, content) for filepath, content in zip(filepaths, contents)])
+
+def embed_chunks(file_chunks):
+    """Embed already chunked files, given as one list of chunks per file; see embed_file_chunks()."""
+    texts = [chunk.content for chunks in file_chunks for chunk in chunks]
+    embeddings, failed = generate_embeddings_batch(texts) if texts else (None, [])
+    failed = set(failed)
+
+    results, row = [], 0
+    for chunks in file_chunks:
+        rows = [r for r in range(row, row + len(chunks)) if r not in failed]
+        results.append(([chunks[r - row] for r in rows], embeddings[rows] if rows else None, len(chunks) - len(rows)))
+        row += len(chunks)
+    return results
+
+def _embed_uncached(texts):
+    """Send texts to the provider in batches; returns one embedding (or None) per text."""
+    batches = list(_batches(texts))
+    batch_texts = [[texts[i] for i in batch] for batch in batches]
+    if len(batches) > 1 and EMBEDDING_MAX_IN_FLIGHT > 1 and not _in_event_loop():
+        from coderag.async_embeddings import embed_batches
+        batch_results = embed_batches(batch_texts)
     else:
-        return _generate_openai_embeddings(text)
+        embed = _ollama_embed if MODEL_PROVIDER.lower() == "ollama" else _openai_embed
+        batch_results = [_embed_isolating_failures(embed, batch) for batch in batch_texts]
+    results = [None] * len(texts)
+    for batch, embeddings in zip(batches, batch_results):
+        for position, embedding in zip(batch, embeddings):
+            results[position] = embedding
+    return results
 
-def _generate_openai_embeddings(text):
-    """Generate embeddings using OpenAI API."""
+def _in_event_loop():
+    """Whether this thread runs an event loop, in which asyncio.run() cannot be used."""
+    import asyncio
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        response = client.embeddings.create(
-            model=OPENAI_EMBEDDING_MODEL,
-            input=[text]  # Input should be a list of strings
-        )
-        # Extract the embedding from the response
-        embeddings = response.data[0].embedding
-        return np.array(embeddings).astype('float32').reshape(1, -1)
-    except Exception as e:
-        print(f"Error generating embeddings with OpenAI: {e}")
-        return None
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+def estimate_tokens(text):
+    """Rough token count of text, used for request budgets and the EMBEDDING_TPM quota."""
+    return len(text) // 4 + 1
 
-def _generate_ollama_embeddings(text):
-    """Generate embeddings using Ollama API."""
+def _batches(texts):
+    """Yield lists of positions whose texts fit together in one request."""
+    batch, tokens = [], 0
+    for position, text in enumerate(texts):
+        text_tokens = estimate_tokens(text)
+        if batch and (len(batch) >= EMBEDDING_BATCH_SIZE or tokens + text_tokens > EMBEDDING_BATCH_TOKENS):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(position)
+        tokens += text_tokens
+    if batch:
+        yield batch
+
+def _embed_isolating_failures(embed, texts):
+    """Embed a batch; if the request fails, split it to find the texts that cause the failure.
+
+    Returns one embedding (float32 vector) or None per text.
+    """
     try:
-        import requests
-        import json
-        
-        url = f"{OLLAMA_BASE_URL}/api/embeddings"
-        payload = {
-            "model": OLLAMA_EMBEDDING_MODEL,
-            "prompt": text
-        }
-        
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
-        embeddings = result.get("embedding", [])
-        
-        if not embeddings:
-            print("No embeddings returned from Ollama")
-            return None
-            
-        return np.array(embeddings).astype('float32').reshape(1, -1)
+        embeddings = call_with_retries(lambda: _limited(embed, texts), circuit_breaker("embeddings"))
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return list(embeddings)
     except Exception as e:
-        print(f"Error generating embeddings with Ollama: {e}")
-        return None
\ No newline at end of file
+        # Splitting only helps when the request failed because of its content
+        if len(texts) == 1 or isinstance(e, RateLimitedError) or _is_connection_error(e):
+            print(f"Error generating embeddings with {MODEL_PROVIDER} for {len(texts)} text(s): {e}")
+            return [None] * len(texts)
+    middle = len(texts) // 2
+    return _embed_isolating_failures(embed, texts[:middle]) + _embed_isolating_failures(embed, texts[middle:])
+
+def _limited(embed, texts):
+    """Send one request within the provider's shared in-flight limit and quota (see async_embeddings.Limiter).
+
+    A 429 pauses every request of the provider, synchronous or not, and the request is retried after the
+    pause up to EMBEDDING_RATE_LIMIT_RETRIES times; then a RateLimitedError is raised.
+    """
+    from coderag.async_embeddings import rate_limiter, _retry_after
+    limiter = rate_limiter(MODEL_PROVIDER.lower())
+    attempt = 0
+    while True:
+        try:
+            with limiter.turn(texts):
+                embeddings = embed(texts)
+        except Exception as e:
+            if not is_rate_limited(e):
+                raise
+            if attempt == EMBEDDING_RATE_LIMIT_RETRIES:
+                raise RateLimitedError(None, f"Still rate limited after {attempt} retries") from e
+            limiter.back_off(_retry_after(getattr(getattr(e, "response", None), "headers", None)), attempt)
+            attempt += 1
+            continue
+        limiter.succeeded()
+        return embeddings
+
+def _is_connection_error(error):
+    """Whether the provider could not be reached at all, as opposed to rejecting the request."""
+    return isinstance(error, CircuitOpenError) or is_transient_error(error)
+
+def provider_unavailable():
+    """Whether embedding calls are paused by the circuit breaker; see embedding_retry_in()."""
+    return circuit_breaker("embeddings").is_open
+
+def embedding_retry_in():
+    """Seconds until the embedding provider is tried again (0 when it is available)."""
+    return circuit_breaker("embeddings").retry_in()
+
+def _openai_embed(texts):
+    """Embed texts with one OpenAI API request; returns a (len(texts), dim) float32 array."""
+    response = openai_client().embeddings.create(
+        model=OPENAI_EMBEDDING_MODEL,
+        input=texts,  # Up to 2048 inputs per request
+        encoding_format="base64"  # Raw float32 bytes, decoded without building Python floats
+    )
+    return _decode_openai_response(response)
+
+def _decode_openai_response(response):
+    # Results carry the position of their input
+    data = sorted(response.data, key=lambda item: item.index)
+    if data and not isinstance(data[0].embedding, str):  # A server that ignores encoding_format
+        return json_embeddings([item.embedding for item in data])
+    return decode_base64_embeddings([item.embedding for item in data])
+
+def _ollama_embed(texts):
+    """Embed texts with one request to Ollama's /api/embed, falling back to /api/embeddings per text."""
+    response = ollama_post("/api/embed", {"model": OLLAMA_EMBEDDING_MODEL, "input": texts})
+    if response.status_code == 404 and "model" not in response.text.lower():
+        # Ollama before 0.3 has no batch endpoint
+        return [_ollama_embed_single(text) for text in texts]
+    response.raise_for_status()
+    # Ollama only answers JSON; it is parsed with orjson when available and copied into one float32 array
+    embeddings = loads_json(response.content).get("embeddings", [])
+    if not embeddings:
+        raise ValueError("No embeddings returned from Ollama")
+    return json_embeddings(embeddings)
+
+def _ollama_embed_single(text):
+    response = ollama_post("/api/embeddings", {"model": OLLAMA_EMBEDDING_MODEL, "prompt": text})
+    response.raise_for_status()
+    embedding = loads_json(response.content).get("embedding", [])
+    if not embedding:
+        raise ValueError("No embeddings returned from Ollama")
+    return np.asarray(embedding, dtype=np.float32)
@@ -0,0 +1,70 @@
+import atexit
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from coderag.config import (
+    OPENAI_API_KEY,
+    OLLAMA_BASE_URL,
+    HTTP_POOL_SIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT
+)
+
+# Clients are created on first use and shared by every thread of the process
+_lock = threading.Lock()
+_ollama_session = None
+_openai_client = None
+
+def ollama_session():
+    """Shared requests session for Ollama, keeping up to HTTP_POOL_SIZE connections alive.
+
+    The session holds no per-request state, so threads can send requests through it concurrently;
+    urllib3's connection pool hands each of them its own connection.
+    """
+    global _ollama_session
+    with _lock:
+        if _ollama_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _ollama_session = session
+        return _ollama_session
+
+def ollama_post(path, payload, timeout=None):
+    """POST a JSON payload to an Ollama API path (e.g. "/api/embed") over a pooled connection."""
+    return ollama_session().post(
+        f"{OLLAMA_BASE_URL}{path}",
+        json=payload,
+        timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    )
+
+def openai_client():
+    """Shared OpenAI client; it is thread-safe and keeps its HTTP connections alive between calls."""
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            import httpx
+            from openai import OpenAI, DefaultHttpxClient
+            _openai_client = OpenAI(
+                api_key=OPENAI_API_KEY,
+                max_retries=0,  # Retried with backoff by resilience.call_with_retries()
+                timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                http_client=DefaultHttpxClient(limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE
+                ))
+            )
+        return _openai_client
+
+@atexit.register
+def close_clients():
+    """Close the pooled connections; clients are recreated if used again."""
+    global _ollama_session, _openai_client
+    with _lock:
+        if _ollama_session is not None:
+            _ollama_session.close()
+            _ollama_session = None
+        if _openai_client is not None:
+            _openai_client.close()
+            _openai_client = None
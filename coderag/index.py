@@ -1,75 +1,1216 @@
 import os
+import re
+import json
+import time
+import shutil
+import tempfile
+import hashlib
+import functools
+import threading
 import faiss
 import numpy as np
-from coderag.config import EMBEDDING_DIM, FAISS_INDEX_FILE, WATCHED_DIR
+from coderag.config import (
+    MODEL_PROVIDER,
+    EMBEDDING_DIM,
+    FAISS_INDEX_FILE,
+    FAISS_INDEX_TYPE,
+    FAISS_RERANK_FACTOR,
+    FAISS_BINARY_PREFILTER,
+    FAISS_BINARY_CODES,
+    FAISS_BINARY_CANDIDATES,
+    FAISS_BINARY_MIN_VECTORS,
+    FAISS_HNSW_M,
+    FAISS_TRAIN_SAMPLE_SIZE,
+    EMBEDDING_REDUCTION,
+    EMBEDDING_REDUCED_DIM,
+    EMBEDDING_REDUCTION_MIN_VECTORS,
+    FAISS_MMAP,
+    FAISS_MMAP_PREFAULT,
+    INDEX_SHARD_BY,
+    INDEX_SEARCH_THREADS,
+    WAL_FSYNC,
+    WAL_CHECKPOINT_BYTES,
+    WAL_CHECKPOINT_INTERVAL,
+    SNAPSHOT_KEEP_GENERATIONS,
+    WATCHED_DIR
+)
+from coderag.index_factory import (
+    build_index,
+    train_index,
+    wrap_with_ids,
+    requires_training,
+    is_lossy,
+    min_training_vectors,
+    apply_search_params,
+    get_ids,
+    all_vectors,
+    reconstruct_vectors,
+    remove_ids,
+    read_index_file,
+    prefault_file,
+    index_memory_bytes,
+    describe_index,
+    index_params
+)
+from coderag.metadata_store import MetadataStore, remove_store_files
+from coderag.blob_store import BlobStore, content_hash as text_hash, remove_blob_files
+from coderag.chunking import chunking_signature
+from coderag.wal import WriteAheadLog, read_records, OP_ADD, OP_REMOVE_RANGE
+from coderag.namespaces import embedding_model, namespace_file
+from coderag.sharding import ShardedIndex, LogOverlay, DEFAULT_SHARD, shard_for, shard_file
+from coderag.vector_store import VectorStore, remove_vector_store_files, vector_store_exists
+from coderag.vector_io import write_vectors, read_vectors
+from coderag.binary_prefilter import BinaryPrefilter, prefilter_exists, remove_prefilter_files
+from coderag.embedding_cache import embedding_cache
+from coderag.reduction import Reducer, configured_reducer, reduction_recall, RECALL_K
 
-index = faiss.IndexFlatL2(EMBEDDING_DIM)
-metadata = []
+# Metadata file written by earlier versions into the current working directory
+LEGACY_METADATA_FILE = "metadata.npy"
 
+# Vector ids are (file id << CHUNK_ID_BITS) | chunk number, so all vectors of a file share an id range
+CHUNK_ID_BITS = 15
+MAX_CHUNKS_PER_FILE = 1 << CHUNK_ID_BITS
+
+def _initial_index_type():
+    """Index types that need training start as a flat index until enough vectors are available."""
+    return "flat" if requires_training(FAISS_INDEX_TYPE) else FAISS_INDEX_TYPE
+
+def _new_index(index_type, dim):
+    return wrap_with_ids(build_index(index_type, dim))
+
+# Reduction applied to embeddings before they are stored (see coderag.reduction): the configured one,
+# or the one an index was saved with once it is loaded
+reducer = configured_reducer(EMBEDDING_REDUCTION, EMBEDDING_DIM, EMBEDDING_REDUCED_DIM)
+
+def _new_vector_dim():
+    """Dimension of the vectors an empty index stores: reduced at once when the reduction needs no training."""
+    return reducer.dim if reducer is not None and reducer.is_trained else EMBEDDING_DIM
+
+shards = {}  # Shard name -> FAISS index
+shard_types = {}  # Shard name -> index type the shard is currently built as
+vector_stores = {}  # Shard name -> full-precision VectorStore, kept for lossy index types and prefilters
+binary_prefilters = {}  # Shard name -> BinaryPrefilter, for shards with FAISS_BINARY_MIN_VECTORS vectors
+# Searches all shards, re-ranking candidates of lossy or prefiltered shards with their exact vectors
+index = ShardedIndex(shards, _new_vector_dim(), INDEX_SEARCH_THREADS or None, vector_stores, FAISS_RERANK_FACTOR,
+                     binary_prefilters, FAISS_BINARY_CANDIDATES, reducer)
+_dirty_shards = set()  # Shards changed since the last snapshot
+index_read_only = False  # True when the index was memory-mapped by load_index(mmap=True)
+_index_loaded = False  # Whether load_index() or clear_index() set up the module's own index in this process
+metadata = None  # MetadataStore opened on first use, see _metadata_store()
+blobs = None  # BlobStore holding file and chunk contents, see _blob_store()
+wal = None  # WriteAheadLog of changes since the last snapshot, see _write_ahead_log()
+snapshot_lsn = 0  # Last log sequence number contained in the index file on disk
+_last_checkpoint = time.monotonic()
+_reader_snapshot = None  # (manifest key, generation, ShardedIndex) served to query processes by current_index()
+_reader_log_key = None  # Size and mtime of the write-ahead log when it was last applied to _reader_snapshot
+_reader_reload_lock = threading.Lock()
+
+# The monitor changes the index from the watchdog thread while the main thread checkpoints it
+_lock = threading.RLock()
+
+def _synchronized(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+def _namespace():
+    """The active embedding namespace: vectors of one provider, model and dimension."""
+    return {"provider": MODEL_PROVIDER.lower(), "model": embedding_model(MODEL_PROVIDER), "dim": EMBEDDING_DIM}
+
+def _index_file():
+    """Index file of the active embedding namespace; every index file is derived from it."""
+    namespace = _namespace()
+    return namespace_file(FAISS_INDEX_FILE, namespace["provider"], namespace["model"], namespace["dim"])
+
+# What follows the FAISS_INDEX_FILE stem in the names of the other index files: the manifest, snapshots, write-ahead
+# log, reduction, metadata store (with its SQLite journal files), blob file generations, and the shard files with
+# their exact vectors and binary prefilters
+_INDEX_FILE_SUFFIX = re.compile(r"\.(json|snapshots|wal|reduction|meta\.sqlite(-wal|-shm|-journal)?|blobs(\.g\d+)?"
+                                r"|shard-.+)")
+
+def _adopt_unnamespaced_index():
+    """Move an index saved before namespaces into the active namespace, if its dimension matches.
+
+    The index files are all named after FAISS_INDEX_FILE, so they are renamed to the namespace's
+    prefix and the paths in the manifest are updated accordingly. Other files sharing the prefix,
+    such as the embedding cache, are left alone.
+    """
+    legacy_stem, stem = os.path.splitext(FAISS_INDEX_FILE)[0], os.path.splitext(_index_file())[0]
+    legacy_manifest = legacy_stem + ".json"
+    if os.path.exists(_index_info_file()) or not (os.path.exists(legacy_manifest) or os.path.exists(FAISS_INDEX_FILE)):
+        return
+    info = {}
+    if os.path.exists(legacy_manifest):
+        with open(legacy_manifest) as f:
+            info = json.load(f)
+    if info.get("dim", EMBEDDING_DIM) != EMBEDDING_DIM:
+        return  # Built with another model; it stays where it is
+
+    directory, prefix = os.path.split(legacy_stem)
+    for entry in os.listdir(directory or "."):
+        path = os.path.join(directory, entry)
+        if path == FAISS_INDEX_FILE or (entry.startswith(prefix) and _INDEX_FILE_SUFFIX.fullmatch(entry[len(prefix):])):
+            target = _index_file() if path == FAISS_INDEX_FILE else stem + path[len(legacy_stem):]
+            os.rename(path, target)
+    for shard_info in info.get("shards", {}).values():
+        for key in ("file", "prefilter"):
+            if key in shard_info and shard_info[key].startswith(legacy_stem):
+                shard_info[key] = stem + shard_info[key][len(legacy_stem):]
+    if info:
+        info["namespace"] = _namespace()
+        with open(_index_info_file(), "w") as f:
+            json.dump(info, f, indent=2)
+    print(f"Moved the existing index into the namespace of {_namespace()['provider']}/{_namespace()['model']}.")
+
+def _index_info_file():
+    """Path of the JSON manifest describing the current snapshot generation (shard files, types, parameters)."""
+    return os.path.splitext(_index_file())[0] + ".json"
+
+def _snapshot_dir():
+    """Directory holding one subdirectory of shard files per snapshot generation."""
+    return os.path.splitext(_index_file())[0] + ".snapshots"
+
+def _generation_dir(generation):
+    return os.path.join(_snapshot_dir(), f"gen-{generation:08d}")
+
+def _in_snapshot_dir(path):
+    return os.path.dirname(os.path.dirname(os.path.abspath(path))) == os.path.abspath(_snapshot_dir())
+
+def _metadata_file():
+    """Path of the SQLite metadata store, kept next to the FAISS index file."""
+    return os.path.splitext(_index_file())[0] + ".meta.sqlite"
+
+def _metadata_store():
+    """Return the metadata store for the current index location, opening it if needed."""
+    global metadata
+    if metadata is None or metadata.path != _metadata_file():
+        if metadata is not None:
+            metadata.close()
+        metadata = MetadataStore(_metadata_file())
+    return metadata
+
+def _blob_file():
+    """Path of the compressed content blob file, kept next to the FAISS index file."""
+    return os.path.splitext(_index_file())[0] + ".blobs"
+
+def _blob_store():
+    """Return the content blob store, whose catalog lives in the metadata store."""
+    global blobs
+    store = _metadata_store()
+    if blobs is None or blobs.catalog is not store:
+        if blobs is not None:
+            blobs.close()
+        blobs = BlobStore(_blob_file(), store)
+    return blobs
+
+def _with_content_hash(entry):
+    """Move the content of a metadata entry into the blob store, keeping only its hash."""
+    entry = dict(entry)
+    entry["content_hash"] = _blob_store().put(entry.pop("content"))
+    return entry
+
+def _resolve_content(entries):
+    """Fill in the content of {vector_id: entry} entries by decompressing their blobs."""
+    hashes = [entry["content_hash"] for entry in entries.values() if entry["content"] is None]
+    contents = _blob_store().get_many(hashes) if hashes else {}
+    for entry in entries.values():
+        if entry["content"] is None:
+            entry["content"] = contents.get(entry["content_hash"])
+    return entries
+
+def _wal_file():
+    """Path of the write-ahead log, kept next to the FAISS index file."""
+    return os.path.splitext(_index_file())[0] + ".wal"
+
+def _write_ahead_log():
+    """Return the write-ahead log for the current index location, opening it if needed."""
+    global wal
+    if wal is None or wal.path != _wal_file():
+        if wal is not None:
+            wal.close()
+        wal = WriteAheadLog(_wal_file(), fsync=WAL_FSYNC)
+        wal.last_lsn = max(wal.last_lsn, snapshot_lsn)
+    return wal
+
+def _file_id(relative_filepath):
+    """Stable 48-bit id derived from the path of a file relative to WATCHED_DIR."""
+    digest = hashlib.sha1(relative_filepath.replace(os.sep, "/").encode("utf-8")).digest()
+    return int.from_bytes(digest[:6], "big")
+
+def vector_id(relative_filepath, chunk=0):
+    """Stable id of the vector for the given chunk of a file."""
+    if not 0 <= chunk < MAX_CHUNKS_PER_FILE:
+        raise ValueError(f"Chunk number {chunk} is out of range (max {MAX_CHUNKS_PER_FILE - 1})")
+    return (_file_id(relative_filepath) << CHUNK_ID_BITS) | chunk
+
+def _file_id_range(relative_filepath):
+    """Half-open range [start, end) covering the vector ids of every chunk of a file."""
+    start = _file_id(relative_filepath) << CHUNK_ID_BITS
+    return start, start + MAX_CHUNKS_PER_FILE
+
+def _relative_path(filepath):
+    return os.path.relpath(filepath, WATCHED_DIR) if os.path.isabs(filepath) else filepath
+
+def _shard_name(relative_filepath):
+    return shard_for(relative_filepath, INDEX_SHARD_BY)
+
+def _shard(name, dim=None):
+    """Return the index of a shard, creating an empty one if it does not exist yet."""
+    if name not in shards:
+        shard_types[name] = _initial_index_type()
+        shards[name] = _new_index(shard_types[name], dim or index.d)
+    return shards[name]
+
+def _keeps_full_vectors():
+    """Whether exact vectors are stored on disk next to the shards for re-ranking."""
+    return (is_lossy(FAISS_INDEX_TYPE) and FAISS_RERANK_FACTOR > 0) or FAISS_BINARY_PREFILTER != "none"
+
+def _vector_store_base(name):
+    return os.path.splitext(shard_file(_index_file(), name))[0]
+
+def _vector_store(name, dim):
+    """Return the full-precision vector store of a shard, opening it if needed."""
+    if name not in vector_stores:
+        vector_stores[name] = VectorStore(_vector_store_base(name), dim, read_only=index_read_only)
+    return vector_stores[name]
+
+def _full_vectors(name, ids, vectors=None):
+    """Exact vectors of a shard: from its vector store when it has one, else as stored in the index.
+
+    vectors, if given, are the ids' vectors already read from the index; otherwise they are reconstructed.
+    """
+    vectors = reconstruct_vectors(shards[name], ids) if vectors is None else vectors
+    if name in vector_stores:
+        stored = vector_stores[name].get(ids)
+        found = ~np.isnan(stored).any(axis=1)
+        vectors[found] = stored[found]
+    return vectors
+
+def _build_prefilter(ids, vectors):
+    """Build a binary prefilter trained on a sample of the given vectors and holding all of them."""
+    prefilter = BinaryPrefilter(vectors.shape[1], FAISS_BINARY_PREFILTER, FAISS_BINARY_CODES, FAISS_HNSW_M)
+    sample = vectors
+    if len(vectors) > FAISS_TRAIN_SAMPLE_SIZE:
+        sample = vectors[np.random.default_rng(1234).choice(len(vectors), FAISS_TRAIN_SAMPLE_SIZE, replace=False)]
+    prefilter.train(sample)
+    prefilter.add(ids, vectors)
+    return prefilter
+
+def _maybe_build_prefilter(name):
+    """Give a shard a binary prefilter once it is large enough for the exhaustive search to be slow."""
+    if FAISS_BINARY_PREFILTER == "none" or name in binary_prefilters or shards[name].ntotal < FAISS_BINARY_MIN_VECTORS:
+        return
+    ids = get_ids(shards[name])
+    binary_prefilters[name] = _build_prefilter(ids, _full_vectors(name, ids))
+    print(f"Built {FAISS_BINARY_PREFILTER} binary prefilter for shard '{name}' on {len(ids)} vectors.")
+
+def _reset_shards():
+    shards.clear()
+    shard_types.clear()
+    vector_stores.clear()
+    binary_prefilters.clear()
+    _dirty_shards.clear()
+    index.dim = _new_vector_dim()
+
+def _set_reducer(new_reducer):
+    global reducer
+    reducer = new_reducer
+    index.reducer = new_reducer
+
+def _index_reduced():
+    """Whether the index holds reduced vectors, so embeddings and queries are reduced before use."""
+    return _reduces(index)
+
+def _reduces(sharded):
+    return sharded.reducer is not None and sharded.reducer.is_trained and sharded.d == sharded.reducer.dim
+
+@_synchronized
 def clear_index():
     """Delete the FAISS index and metadata files if they exist, and reinitialize the index."""
-    global index, metadata
-    
-    # Delete the FAISS index file
-    if os.path.exists(FAISS_INDEX_FILE):
-        os.remove(FAISS_INDEX_FILE)
-        print(f"Deleted FAISS index file: {FAISS_INDEX_FILE}")
-
-    # Delete the metadata file
-    metadata_file = "metadata.npy"
-    if os.path.exists(metadata_file):
-        os.remove(metadata_file)
+    global index_read_only, metadata, blobs, wal, snapshot_lsn, _index_loaded
+
+    # Delete the FAISS index files of every shard, their description and the write-ahead log
+    if wal is not None:
+        wal.close()
+        wal = None
+    snapshot_lsn = 0
+    shard_infos = _read_index_info().get("shards", {})
+    # Shard files of indexes saved before snapshot generations live next to FAISS_INDEX_FILE
+    shard_files = [info["file"] for info in shard_infos.values() if not _in_snapshot_dir(info["file"])]
+    for index_file in [_index_file(), *shard_files, _index_info_file(), _wal_file()]:
+        if os.path.exists(index_file):
+            os.remove(index_file)
+            print(f"Deleted FAISS index file: {index_file}")
+    for shard_info in shard_infos.values():
+        if "prefilter" in shard_info and not _in_snapshot_dir(shard_info["file"]):
+            for prefilter_file in remove_prefilter_files(shard_info["prefilter"]):
+                print(f"Deleted binary prefilter file: {prefilter_file}")
+    if os.path.isdir(_snapshot_dir()):
+        shutil.rmtree(_snapshot_dir())
+        print(f"Deleted index snapshots: {_snapshot_dir()}")
+    for name in {DEFAULT_SHARD, *shard_infos}:
+        for vectors_file in remove_vector_store_files(_vector_store_base(name)):
+            print(f"Deleted vector file: {vectors_file}")
+
+    # Delete the metadata store and content blobs, and the pickled metadata of earlier versions
+    if blobs is not None:
+        blobs.close()
+        blobs = None
+    if metadata is not None:
+        metadata.close()
+        metadata = None
+    for metadata_file in remove_store_files(_metadata_file()):
         print(f"Deleted metadata file: {metadata_file}")
+    for blob_file in remove_blob_files(_blob_file()):
+        print(f"Deleted content blob file: {blob_file}")
+    if os.path.exists(LEGACY_METADATA_FILE):
+        os.remove(LEGACY_METADATA_FILE)
+        print(f"Deleted metadata file: {LEGACY_METADATA_FILE}")
 
     # Reinitialize the FAISS index and metadata
-    index = faiss.IndexFlatL2(EMBEDDING_DIM)
-    metadata = []
+    _set_reducer(configured_reducer(EMBEDDING_REDUCTION, EMBEDDING_DIM, EMBEDDING_REDUCED_DIM))
+    _reset_shards()
+    index_read_only = False
+    _index_loaded = True
     print("FAISS index and metadata cleared and reinitialized.")
 
-def add_to_index(embeddings, full_content, filename, filepath):
-    global index, metadata
+def _rebuild_index(target_type, ids, vectors):
+    """Build a fresh index of the given type holding exactly the given vectors."""
+    new_index = _new_index(target_type, vectors.shape[1])
+    if requires_training(target_type):
+        train_index(new_index, vectors)
+    if len(ids):
+        new_index.add_with_ids(vectors, ids)
+    return new_index
+
+def _compacted_type(n_vectors):
+    """Index type for a shard rebuilt with n_vectors: the configured type once it can be trained."""
+    return FAISS_INDEX_TYPE if n_vectors >= min_training_vectors(FAISS_INDEX_TYPE) else "flat"
+
+def _maybe_train_shard(name):
+    """Convert a flat staging shard into the configured index type once it can be trained."""
+    shard = shards[name]
+    if shard_types[name] == FAISS_INDEX_TYPE or shard.ntotal < min_training_vectors(FAISS_INDEX_TYPE):
+        return
+
+    ids = get_ids(shard)
+    shards[name] = _rebuild_index(FAISS_INDEX_TYPE, ids, reconstruct_vectors(shard, ids))
+    shard_types[name] = FAISS_INDEX_TYPE
+    print(f"Trained {FAISS_INDEX_TYPE} index for shard '{name}' on {len(ids)} vectors.")
+
+def _check_writable():
+    if index_read_only:
+        raise RuntimeError("The FAISS index was memory-mapped read-only; load it with load_index(mmap=False) to modify it.")
+
+def _apply_add(shard, ids, vectors, replay=False):
+    _shard(shard, vectors.shape[1]).add_with_ids(vectors, ids)
+    if _keeps_full_vectors():
+        store = _vector_store(shard, vectors.shape[1])
+        # A replayed addition has normally been appended to the on-disk store already
+        store.add_missing(ids, vectors) if replay else store.add(ids, vectors)
+    if shard in binary_prefilters:
+        binary_prefilters[shard].add(ids, vectors)
+    _dirty_shards.add(shard)
+    _maybe_train_shard(shard)
+    _maybe_build_prefilter(shard)
+
+def _apply_remove_range(shard, start, end):
+    """Remove the vectors with ids in [start, end) from a shard; returns how many there were."""
+    if shard not in shards:
+        return 0
+    removed = remove_ids(shards[shard], faiss.IDSelectorRange(start, end))
+    if removed:
+        if shard in binary_prefilters:
+            # Binary HNSW cannot remove codes; stale candidates are dropped with the shard's own stale vectors
+            binary_prefilters[shard].remove_range(start, end)
+        _dirty_shards.add(shard)
+    return removed
+
+def _remove_file_vectors(relative_filepath):
+    """Drop the vectors and metadata of every chunk of a file; returns the number of chunks removed."""
+    _check_writable()
+    shard = _shard_name(relative_filepath)
+    start, end = _file_id_range(relative_filepath)
+    if _apply_remove_range(shard, start, end):
+        # Only logged when there was something to remove: new files then leave readers' snapshot ids unread
+        _write_ahead_log().append_remove_range(shard, start, end)
+    _metadata_store().delete_file(relative_filepath)
+    return _metadata_store().delete_range(start, end)
+
+def _stored_vectors(embeddings):
+    """Embeddings as the index stores them: reduced once the index holds reduced vectors."""
+    expected_dim = reducer.input_dim if _index_reduced() else index.d
+    if embeddings.shape[1] != expected_dim:
+        raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match FAISS index dimension {expected_dim}")
+    vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+    return reducer.apply(vectors) if _index_reduced() else vectors
+
+def _reduction_min_vectors():
+    if reducer.transform is None:
+        return 1  # Truncation needs no training
+    return max(EMBEDDING_REDUCTION_MIN_VECTORS, reducer.min_training_vectors)
+
+def _maybe_reduce_index():
+    """Reduce the stored full embeddings once the configured reduction can be trained on them.
+
+    Every shard is rebuilt with reduced vectors and a new generation is saved at once, so the
+    write-ahead log never mixes full and reduced vectors.
+    """
+    if reducer is None or not shards or index.d != reducer.input_dim or index.ntotal < _reduction_min_vectors():
+        return
+    live_ids = np.array(_metadata_store().ids(), dtype=np.int64)
+    if len(live_ids) < _reduction_min_vectors():
+        return
+    rebuilt = {name: _live_vectors(name, live_ids) for name in shards}
+    vectors = np.vstack([vectors for _, vectors in rebuilt.values()])
+    sample = vectors
+    if len(vectors) > FAISS_TRAIN_SAMPLE_SIZE:
+        sample = vectors[np.random.default_rng(1234).choice(len(vectors), FAISS_TRAIN_SAMPLE_SIZE, replace=False)]
+    reducer.train(sample)
+    reducer.recall = reduction_recall(reducer, sample)
 
-    if embeddings.shape[1] != index.d:
-        raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match FAISS index dimension {index.d}")
+    _reset_shards()
+    for name, (ids, vectors) in rebuilt.items():
+        if len(ids):
+            _install_shard(name, ids, reducer.apply(vectors))
+    save_index()
+    recall = f", recall@{RECALL_K} {reducer.recall:.3f} against full embeddings" if reducer.recall is not None else ""
+    print(f"Reduced {len(live_ids)} vectors from {reducer.input_dim} to {reducer.dim} dimensions "
+          f"with {reducer.method}{recall}.")
+
+@_synchronized
+def add_to_index(embeddings, full_content, filename, filepath, chunks=None, file_stat=None):
+    """Index a file, replacing any vectors previously stored for it.
+
+    With chunks (see coderag.chunking), vector i is the embedding of chunks[i], whose content and line
+    span are stored with it; without, every vector refers to full_content. file_stat is the os.stat()
+    of the file taken before it was read; with it the file is recorded in the file manifest, so an
+    unchanged file is skipped on the next startup (see diff_files()). The change is logged, but only
+    durable and visible to other processes after commit_index() or save_index().
+    """
+    vectors = _stored_vectors(embeddings)
+    if chunks is not None and len(chunks) != len(embeddings):
+        raise ValueError(f"Got {len(embeddings)} embeddings for {len(chunks)} chunks")
+    _check_writable()
 
     # Convert absolute filepath to relative path
-    relative_filepath = os.path.relpath(filepath, WATCHED_DIR)
+    relative_filepath = _relative_path(filepath)
 
-    index.add(embeddings)
-    metadata.append({
-        "content": full_content,
-        "filename": filename,
-        "filepath": relative_filepath  # Store relative filepath
+    _remove_file_vectors(relative_filepath)
+    ids = np.array([vector_id(relative_filepath, chunk) for chunk in range(len(embeddings))], dtype=np.int64)
+    shard = _shard_name(relative_filepath)
+    _write_ahead_log().append_add(shard, ids, vectors)
+    _apply_add(shard, ids, vectors)
+    if chunks is None:
+        content_hash = _blob_store().put(full_content)  # Stored once, however many chunks or files share it
+        spans = [(content_hash, None, None)] * len(ids)
+    else:
+        hashes = _blob_store().put_many([chunk.content for chunk in chunks])  # One catalog lookup per file
+        spans = [(digest, chunk.start_line, chunk.end_line) for digest, chunk in zip(hashes, chunks)]
+    _metadata_store().upsert(
+        (vid, {
+            "content_hash": content_hash,
+            "filename": filename,
+            "filepath": relative_filepath,  # Store relative filepath
+            "chunk": chunk,
+            "start_line": start_line,
+            "end_line": end_line
+        })
+        for chunk, (vid, (content_hash, start_line, end_line)) in enumerate(zip(ids, spans))
+    )
+    if file_stat is not None:
+        _record_file(relative_filepath, full_content, file_stat, len(ids),
+                     chunking_signature() if chunks is not None else "whole-file")
+    _maybe_reduce_index()
+
+def _record_file(relative_filepath, full_content, file_stat, chunks, chunking):
+    _metadata_store().upsert_file(relative_filepath, {
+        "size": file_stat.st_size,
+        "mtime_ns": file_stat.st_mtime_ns,
+        "content_hash": text_hash(full_content),
+        "first_id": _file_id_range(relative_filepath)[0],
+        "chunks": chunks,
+        "chunking": chunking
     })
 
+@_synchronized
+def diff_files(filepaths):
+    """Compare files on disk with the file manifest of the index.
+
+    Returns (changed, removed): the files among filepaths that are new or changed since they were
+    indexed, and the paths (under WATCHED_DIR) of indexed files that are no longer among filepaths.
+    A file whose size and mtime match its manifest entry is not read. One whose content still has the
+    recorded hash (e.g. rewritten by a checkout) only gets its size and mtime updated. Files chunked
+    with other settings count as changed.
+    """
+    store = _metadata_store()
+    manifest = store.files()
+    signature = chunking_signature()
+    changed, seen = [], set()
+    for filepath in filepaths:
+        relative_filepath = _relative_path(filepath)
+        seen.add(relative_filepath)
+        entry = manifest.get(relative_filepath)
+        if entry is None or entry["chunking"] != signature:
+            changed.append(filepath)
+            continue
+        try:
+            stat = os.stat(filepath)
+            if (stat.st_size, stat.st_mtime_ns) == (entry["size"], entry["mtime_ns"]):
+                continue
+            with open(filepath, 'r', encoding='utf-8') as f:
+                unchanged = text_hash(f.read()) == entry["content_hash"]
+        except (OSError, UnicodeDecodeError):
+            unchanged = False  # Reported when the file is read for indexing
+        if unchanged:
+            store.update_file_stat(relative_filepath, stat.st_size, stat.st_mtime_ns)
+        else:
+            changed.append(filepath)
+    removed = sorted((set(manifest) | store.filepaths()) - seen)
+    return changed, [os.path.join(WATCHED_DIR, relative_filepath) for relative_filepath in removed]
+
+@_synchronized
+def remove_from_index(filepath, content=None, file_stat=None):
+    """Remove every vector of a file (e.g. after it was deleted); returns the number of chunks removed.
+
+    For a file that still exists but has no chunks (empty or only comments), pass its content and the
+    os.stat() taken before reading it: the file is kept in the file manifest with an empty id range, so
+    diff_files() does not read it again on the next startup.
+    """
+    relative_filepath = _relative_path(filepath)
+    removed = _remove_file_vectors(relative_filepath)
+    if file_stat is not None:
+        _check_writable()
+        _record_file(relative_filepath, content, file_stat, 0, chunking_signature())
+    return removed
+
+def _commit_metadata():
+    # Metadata rows were upserted incrementally; committing makes them visible with the new vectors.
+    # Blob frames and exact vectors are flushed first so no committed row points at missing data.
+    for store in vector_stores.values():
+        store.flush()
+    _blob_store().flush()
+    _metadata_store().commit()
+    _blob_store().remove_replaced()  # Blob files compacted away, now that no committed row points into them
+
+@_synchronized
+def commit_index():
+    """Make the changes since the last commit durable by syncing the write-ahead log.
+
+    This costs O(size of the changes), unlike save_index() which rewrites the whole index. The log is
+    folded into a new snapshot once it grows past WAL_CHECKPOINT_BYTES.
+    """
+    _check_writable()
+    _write_ahead_log().sync()
+    _commit_metadata()
+    if _write_ahead_log().size() >= WAL_CHECKPOINT_BYTES:
+        save_index()
+
+@_synchronized
+def maybe_checkpoint_index():
+    """Fold the write-ahead log into a new snapshot if it is large or old enough; returns True if it did."""
+    if index_read_only or wal is None or wal.size() == 0:
+        return False
+    if wal.size() < WAL_CHECKPOINT_BYTES and time.monotonic() - _last_checkpoint < WAL_CHECKPOINT_INTERVAL:
+        return False
+    save_index()
+    return True
+
+def _link_or_copy(src, dst):
+    """Share an unchanged file with the previous generation; files are never modified once written."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_generation(generation, previous_shards, previous_reduction):
+    """Write the shard files of a new generation into a temporary directory and rename it into place.
+
+    Returns the manifest entries of the shards and of the reduction, if the index holds reduced
+    vectors. Shards and reductions unchanged since the previous generation are hard-linked instead of
+    rewritten.
+    """
+    os.makedirs(_snapshot_dir(), exist_ok=True)
+    final_dir = _generation_dir(generation)
+    tmp_dir = tempfile.mkdtemp(prefix=f".gen-{generation:08d}-", dir=_snapshot_dir())
+    shard_infos = {}
+    for name in shards:
+        filename = os.path.basename(shard_file(_index_file(), name))
+        prefilter_name = os.path.splitext(filename)[0]
+        previous = previous_shards.get(name, {})
+        prefilter_missing = name in binary_prefilters and "prefilter" not in previous
+        if name in _dirty_shards or prefilter_missing or not os.path.exists(previous.get("file", "")):
+            faiss.write_index(shards[name], os.path.join(tmp_dir, filename))
+            if name in binary_prefilters:
+                binary_prefilters[name].save(os.path.join(tmp_dir, prefilter_name))
+        else:
+            _link_or_copy(previous["file"], os.path.join(tmp_dir, filename))
+            if name in binary_prefilters:
+                for suffix in (".binary", ".binary.npz"):
+                    _link_or_copy(previous["prefilter"] + suffix, os.path.join(tmp_dir, prefilter_name + suffix))
+        shard_infos[name] = {
+            "file": os.path.join(final_dir, filename),
+            "index_type": shard_types[name],
+            "params": index_params(shard_types[name])
+        }
+        if name in binary_prefilters:
+            shard_infos[name]["prefilter"] = os.path.join(final_dir, prefilter_name)
+    reduction = _write_reduction(tmp_dir, final_dir, previous_reduction)
+    for filename in os.listdir(tmp_dir):
+        _fsync_path(os.path.join(tmp_dir, filename))
+    if os.path.isdir(final_dir):  # Left behind by a save that crashed before publishing its manifest
+        shutil.rmtree(final_dir)
+    os.rename(tmp_dir, final_dir)
+    _fsync_path(_snapshot_dir())
+    return shard_infos, reduction
+
+def _write_reduction(tmp_dir, final_dir, previous_reduction):
+    """Write the trained reduction transform into a generation; returns its manifest entry or None."""
+    if not _index_reduced():
+        return None
+    reduction = reducer.info()
+    if reducer.transform is not None:
+        filename = os.path.basename(os.path.splitext(_index_file())[0]) + ".reduction"
+        previous_file = previous_reduction.get("file", "")
+        same = {key: previous_reduction.get(key) for key in ("method", "input_dim", "dim")} == \
+            {key: reduction[key] for key in ("method", "input_dim", "dim")}
+        if same and os.path.exists(previous_file):
+            _link_or_copy(previous_file, os.path.join(tmp_dir, filename))  # Trained once, never changes
+        else:
+            reducer.save(os.path.join(tmp_dir, filename))
+        reduction["file"] = os.path.join(final_dir, filename)
+    return reduction
+
+def _publish_manifest(manifest):
+    """Atomically replace the manifest, which switches readers to the generation it names."""
+    tmp_file = _index_info_file() + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, _index_info_file())
+
+def _prune_generations(current):
+    """Delete generations older than the last SNAPSHOT_KEEP_GENERATIONS and unpublished leftovers."""
+    for entry in os.listdir(_snapshot_dir()):
+        path = os.path.join(_snapshot_dir(), entry)
+        if entry.startswith(".gen-"):
+            shutil.rmtree(path, ignore_errors=True)
+        elif entry.startswith("gen-") and int(entry[4:]) <= current - max(SNAPSHOT_KEEP_GENERATIONS, 1):
+            shutil.rmtree(path, ignore_errors=True)
+
+@_synchronized
 def save_index():
-    faiss.write_index(index, FAISS_INDEX_FILE)
-    with open("metadata.npy", "wb") as f:
-        np.save(f, metadata)
-
-def load_index():
-    global index, metadata
-    index = faiss.read_index(FAISS_INDEX_FILE)
-    with open("metadata.npy", "rb") as f:
-        metadata = np.load(f, allow_pickle=True).tolist()
+    """Publish a new snapshot generation of the index and truncate the write-ahead log.
+
+    Shard files are written to a fresh generation directory and the manifest is replaced atomically
+    afterwards, so readers see either the previous or the new generation but never a partial one.
+    """
+    global snapshot_lsn, _last_checkpoint
+    _check_writable()
+    log = _write_ahead_log()
+    info = _read_index_info()
+    previous_shards = info.get("shards", {})
+    generation = info.get("generation", 0) + 1
+    shard_infos, reduction = _write_generation(generation, previous_shards, info.get("reduction") or {})
+    _dirty_shards.clear()
+    # Rows and exact vectors referenced by the new generation must be visible before it is published
+    _commit_metadata()
+    manifest = {
+        "generation": generation,
+        "namespace": _namespace(),
+        "configured_index_type": FAISS_INDEX_TYPE,
+        "shard_by": INDEX_SHARD_BY,
+        "dim": index.d,
+        "shards": shard_infos,
+        "wal_lsn": log.last_lsn
+    }
+    if reduction is not None:
+        manifest["reduction"] = reduction
+    _publish_manifest(manifest)
+    # Drop shard files of indexes saved in place before generations, and exact vectors of removed shards
+    for shard_info in previous_shards.values():
+        if not _in_snapshot_dir(shard_info["file"]) and os.path.exists(shard_info["file"]):
+            os.remove(shard_info["file"])
+            if "prefilter" in shard_info:
+                remove_prefilter_files(shard_info["prefilter"])
+    for name in set(previous_shards) - set(shards):
+        remove_vector_store_files(_vector_store_base(name))
+    _prune_generations(generation)
+    snapshot_lsn = log.last_lsn
+    log.reset()
+    _last_checkpoint = time.monotonic()
+
+def _read_index_info():
+    """Read the JSON manifest of the index on disk, or {} if there is none."""
+    if not os.path.exists(_index_info_file()):
+        return {}
+    with open(_index_info_file()) as f:
+        return json.load(f)
+
+def _read_index_files(mmap=False, prefault=False, info=None):
+    """Read the shards, their types and the snapshot's log sequence number without touching module state."""
+    info = _read_index_info() if info is None else info
+    shard_infos = info.get("shards")
+    if shard_infos is None and os.path.exists(_index_file()):
+        # Indexes saved before sharding (or without a description) are a single flat or typed index
+        shard_infos = {DEFAULT_SHARD: {"file": _index_file(), "index_type": info.get("index_type", "flat")}}
+    shard_infos = shard_infos or {}  # Nothing saved in this namespace yet
+    loaded_shards, loaded_types = {}, {}
+    for name, shard_info in shard_infos.items():
+        if mmap and prefault:
+            prefault_file(shard_info["file"])
+        loaded_shards[name] = read_index_file(shard_info["file"], mmap)
+        loaded_types[name] = shard_info["index_type"]
+    return loaded_shards, loaded_types, info.get("wal_lsn", 0)
+
+def _read_side_stores(info, loaded_shards, read_only):
+    """Open the exact vector stores and binary prefilters of loaded shards, without touching module state."""
+    stores, prefilters = {}, {}
+    for name, shard in loaded_shards.items():
+        if vector_store_exists(_vector_store_base(name)):
+            stores[name] = VectorStore(_vector_store_base(name), shard.d, read_only=read_only)
+        prefilter = info.get("shards", {}).get(name, {}).get("prefilter")
+        if FAISS_BINARY_PREFILTER != "none" and prefilter and prefilter_exists(prefilter):
+            prefilters[name] = BinaryPrefilter.load(prefilter)
+    return stores, prefilters
+
+def _replay_log():
+    """Apply the write-ahead log records newer than the loaded snapshot; returns how many were applied."""
+    applied = 0
+    for _, op, args in read_records(_wal_file(), after_lsn=snapshot_lsn):
+        if op == OP_ADD:
+            _apply_add(*args, replay=True)
+        elif op == OP_REMOVE_RANGE:
+            _apply_remove_range(*args)
+        applied += 1
+    return applied
+
+@_synchronized
+def load_index(mmap=None, prefault=None):
+    """Load the index from disk.
+
+    With mmap=True (default: FAISS_MMAP) the index is memory-mapped read-only, so every query process
+    shares the same page-cache copy and loading time does not grow with the index size. prefault
+    (default: FAISS_MMAP_PREFAULT) asks the OS to read the mapped file ahead of the first queries.
+    """
+    global index_read_only, snapshot_lsn, _index_loaded
+    mmap = FAISS_MMAP if mmap is None else mmap
+    prefault = FAISS_MMAP_PREFAULT if prefault is None else prefault
+    if os.path.exists(LEGACY_METADATA_FILE):
+        raise ValueError(f"Found legacy metadata file '{LEGACY_METADATA_FILE}'; "
+                         "run `python scripts/compact_index.py` to migrate it.")
+    _adopt_unnamespaced_index()
+    info = _read_index_info()
+    loaded_shards, loaded_types, snapshot_lsn = _read_index_files(mmap, prefault, info)
+    loaded_stores, loaded_prefilters = _read_side_stores(info, loaded_shards, mmap)
+    _set_reducer(_loaded_reducer(info))
+    _reset_shards()
+    shards.update(loaded_shards)
+    shard_types.update(loaded_types)
+    vector_stores.update(loaded_stores)
+    binary_prefilters.update(loaded_prefilters)
+    index_read_only = mmap
+    _index_loaded = True
+    for shard in shards.values():
+        apply_search_params(shard)
+    _metadata_store()
+    # A mapped index cannot be modified, so changes still in the log show up after the next checkpoint
+    if not mmap and _replay_log():
+        print("Replayed write-ahead log changes made after the last index snapshot.")
     return index
 
-def get_metadata():
-    return metadata
+def _loaded_reducer(info):
+    """The reduction an index was saved with, which wins over the configured one; else the configured one."""
+    if "reduction" not in info:
+        return configured_reducer(EMBEDDING_REDUCTION, EMBEDDING_DIM, EMBEDDING_REDUCED_DIM)
+    loaded = Reducer.load(info["reduction"])
+    if (loaded.method, loaded.dim) != (EMBEDDING_REDUCTION, EMBEDDING_REDUCED_DIM):
+        print(f"The index stores embeddings reduced with {loaded.method} to {loaded.dim} dimensions; "
+              "clear and rebuild it to apply EMBEDDING_REDUCTION and EMBEDDING_REDUCED_DIM.")
+    return loaded
+
+def _manifest_key():
+    """Identity of the published manifest; it changes whenever a new generation is published."""
+    try:
+        stat = os.stat(_index_info_file())
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def _load_generation(mmap, prefault):
+    """Load the published generation into a new ShardedIndex, leaving the module's own index untouched."""
+    with _lock:
+        _adopt_unnamespaced_index()
+    info = _read_index_info()
+    loaded_shards, loaded_types, lsn = _read_index_files(mmap, prefault, info)
+    for shard in loaded_shards.values():
+        apply_search_params(shard)
+    stores, prefilters = _read_side_stores(info, loaded_shards, read_only=True)
+    dim = info.get("dim", EMBEDDING_DIM)
+    loaded_reducer = Reducer.load(info["reduction"]) if "reduction" in info else None
+    loaded = ShardedIndex(loaded_shards, dim, INDEX_SEARCH_THREADS or None, stores, FAISS_RERANK_FACTOR, prefilters,
+                          FAISS_BINARY_CANDIDATES, loaded_reducer)
+    # Snapshot ids are only gathered once the log removes something, so loading stays independent of their number
+    loaded.overlay = LogOverlay(loaded.d, lsn, lambda: np.sort(np.concatenate(
+        [np.zeros(0, dtype=np.int64)] + [get_ids(shard) for shard in loaded_shards.values()])))
+    loaded.shard_types, loaded.memory_mapped = loaded_types, mmap
+    return info.get("generation", 0), loaded
+
+def _log_key():
+    try:
+        stat = os.stat(_wal_file())
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def _refresh_overlay(loaded):
+    """Apply the write-ahead log records committed since loaded's overlay was built."""
+    global _reader_log_key
+    key = _log_key()
+    if key == _reader_log_key:
+        return
+    overlay = loaded.overlay
+    records = list(read_records(_wal_file(), after_lsn=overlay.lsn))
+    if records:
+        loaded.overlay = overlay.updated(records)
+    _reader_log_key = key
+
+def current_index(mmap=None, prefault=None):
+    """Index for query processes: the published snapshot generation, reloaded only when a new one appears.
+
+    Checking for a new generation costs one stat() of the manifest. A newer generation is loaded next to
+    the one in use and swapped in with a single reference assignment: queries never wait for the writer
+    or for the reload, and never see a partially written index. Changes committed to the write-ahead
+    log since the snapshot are applied on top of it (see sharding.LogOverlay) when the log has grown,
+    so they are searchable as soon as their metadata is.
+    """
+    global _reader_snapshot, _reader_log_key
+    mmap = FAISS_MMAP if mmap is None else mmap
+    prefault = FAISS_MMAP_PREFAULT if prefault is None else prefault
+    snapshot = _reader_snapshot
+    key = _manifest_key()
+    if snapshot is not None and snapshot[0] == key:
+        if _log_key() != _reader_log_key and _reader_reload_lock.acquire(blocking=False):
+            try:
+                if _reader_snapshot is snapshot:
+                    _refresh_overlay(snapshot[2])
+            except (OSError, ValueError) as e:
+                print(f"Failed to apply write-ahead log changes, serving the snapshot without them: {e}")
+            finally:
+                _reader_reload_lock.release()
+        return snapshot[2]
+    # One thread loads the new generation while the others keep serving the current one
+    if not _reader_reload_lock.acquire(blocking=snapshot is None):
+        return snapshot[2]
+    try:
+        if _reader_snapshot is None or _reader_snapshot[0] != key:
+            try:
+                _reader_snapshot = (key, *_load_generation(mmap, prefault))
+                _reader_log_key = None
+                _refresh_overlay(_reader_snapshot[2])
+            except (OSError, RuntimeError) as e:
+                if _reader_snapshot is None:
+                    raise
+                # E.g. the generation was pruned while loading it; retry with the next query
+                print(f"Failed to load the new index generation, still serving generation {_reader_snapshot[1]}: {e}")
+                return _reader_snapshot[2]
+            print(f"Serving index generation {_reader_snapshot[1]}.")
+        return _reader_snapshot[2]
+    finally:
+        _reader_reload_lock.release()
+
+def _migrate_legacy_metadata(loaded_index, store):
+    """Move metadata.npy into the metadata store; returns the ids and vectors to keep."""
+    with open(LEGACY_METADATA_FILE, "rb") as f:
+        legacy_metadata = np.load(f, allow_pickle=True)
+    store.clear()
+
+    if legacy_metadata.ndim == 0:
+        # Dict keyed by stable vector id
+        legacy_metadata = legacy_metadata.item()
+        store.upsert((vid, _with_content_hash(entry)) for vid, entry in legacy_metadata.items())
+        ids = np.array(sorted(legacy_metadata), dtype=np.int64)
+        return ids, reconstruct_vectors(loaded_index, ids)
+
+    # Positional list: entry i belongs to vector i, later entries supersede earlier ones
+    legacy_metadata = legacy_metadata.tolist()
+    latest = {}
+    for position, entry in enumerate(legacy_metadata):
+        latest[entry["filepath"]] = position
+    positions = sorted(latest.values())
+    ids = np.array([vector_id(legacy_metadata[p]["filepath"]) for p in positions], dtype=np.int64)
+    store.upsert((vid, _with_content_hash(dict(legacy_metadata[p], chunk=0))) for vid, p in zip(ids, positions))
+    vectors = np.zeros((len(positions), loaded_index.d), dtype=np.float32)
+    for row, position in enumerate(positions):
+        vectors[row] = loaded_index.reconstruct(position)
+    return ids, vectors
+
+def _install_shard(name, ids, vectors):
+    """Replace a shard with a freshly built index holding exactly the given vectors."""
+    shard_types[name] = _compacted_type(len(ids))
+    shards[name] = _rebuild_index(shard_types[name], ids, vectors)
+    apply_search_params(shards[name])
+    if _keeps_full_vectors():
+        _vector_store(name, vectors.shape[1]).rewrite(ids, vectors)
+    else:
+        vector_stores.pop(name, None)
+        remove_vector_store_files(_vector_store_base(name))
+    binary_prefilters.pop(name, None)
+    if FAISS_BINARY_PREFILTER != "none" and len(ids) >= FAISS_BINARY_MIN_VECTORS:
+        binary_prefilters[name] = _build_prefilter(ids, vectors)
+    _dirty_shards.add(name)
+
+def _route_to_shards(ids, vectors, filepaths):
+    """Group vectors by the shard their file belongs to under the current INDEX_SHARD_BY."""
+    names = np.array([_shard_name(filepaths[int(vid)]) for vid in ids], dtype=object)
+    return {name: (ids[names == name], vectors[names == name]) for name in set(names)}
+
+@_synchronized
+def compact_index(shard=None):
+    """Rebuild the index on disk so it holds exactly one vector per live chunk.
+
+    Without a shard name every shard is rebuilt and vectors are re-routed according to INDEX_SHARD_BY,
+    which is also how an existing index is re-sharded. With a shard name only that shard is rebuilt
+    and rewritten, while the others keep serving from their files untouched.
+    Indexes written before stable ids appended a new vector for every save of a file; their
+    metadata.npy is migrated into the metadata store, keeping only the most recent entry of each file.
+    Returns a (vectors_before, vectors_after) tuple.
+    """
+    global index_read_only
+    _adopt_unnamespaced_index()
+    store = _metadata_store()
+
+    migrated = os.path.exists(LEGACY_METADATA_FILE)
+    if migrated:
+        loaded_shards, _, _ = _read_index_files()
+        legacy_index = loaded_shards[DEFAULT_SHARD]
+        vectors_before = legacy_index.ntotal
+        ids, vectors = _migrate_legacy_metadata(legacy_index, store)
+        rebuilt = {DEFAULT_SHARD: (ids, vectors)}
+    else:
+        load_index(mmap=False)  # Includes the changes still in the write-ahead log
+        if shard is not None and shard not in shards:
+            raise ValueError(f"Unknown shard '{shard}', existing shards: {sorted(shards)}")
+        names = [shard] if shard is not None else list(shards)
+        vectors_before = sum(shards[name].ntotal for name in names)
+        # Rows written before the blob store kept their content inline
+        store.upsert([(vid, _with_content_hash(entry)) for vid, entry in store.entries() if entry["content"] is not None])
+        # Drop vectors without metadata (removed files) and duplicated ids left behind by HNSW
+        live_ids = np.array(store.ids(), dtype=np.int64)
+        rebuilt = {name: _live_vectors(name, live_ids) for name in names}
+
+    if shard is None:
+        # Re-route every live vector to the shard its file belongs to
+        filepaths = {vid: entry["filepath"] for vid, entry in store.entries()}
+        ids = np.concatenate([ids for ids, _ in rebuilt.values()])
+        vectors = np.vstack([vectors for _, vectors in rebuilt.values()]) if rebuilt else \
+            np.zeros((0, index.d), dtype=np.float32)
+        rebuilt = _route_to_shards(ids, vectors, filepaths)
+        _reset_shards()
+    for name, (ids, vectors) in rebuilt.items():
+        _install_shard(name, ids, vectors)
+    index_read_only = False
+
+    blob_bytes_before, blob_bytes_after = _blob_store().compact()  # Drop contents of replaced and removed files
+    save_index()
+    print(f"Compacted content blobs: {blob_bytes_before} -> {blob_bytes_after} bytes.")
+    if migrated:
+        os.remove(LEGACY_METADATA_FILE)
+    return vectors_before, sum(shards[name].ntotal for name in rebuilt)
+
+def _live_vectors(name, live_ids):
+    """Ids and exact vectors of a shard restricted to live ids, keeping the latest copy of duplicated ids."""
+    ids, vectors = all_vectors(shards[name])
+    # HNSW keeps removed and superseded vectors; the last copy of an id is the current one
+    _, last = np.unique(ids[::-1], return_index=True)
+    keep = np.sort(len(ids) - 1 - last)
+    keep = keep[np.isin(ids[keep], live_ids)]
+    return ids[keep], _full_vectors(name, ids[keep], vectors[keep])
+
+@_synchronized
+def export_vectors(path):
+    """Write the id and vector of every live chunk to a .npy, .parquet or .arrow file; returns the count.
+
+    Vectors are read in bulk per shard, at full precision when the shard keeps exact vectors on disk.
+    """
+    live_ids = np.array(_metadata_store().ids(), dtype=np.int64)
+    shard_ids = {name: np.unique(get_ids(shard)) for name, shard in shards.items()}
+    total = sum(int(np.isin(ids, live_ids).sum()) for ids in shard_ids.values())
+    write_vectors(path, (_live_vectors(name, live_ids) for name in shards), total, index.d)
+    print(f"Exported {total} vectors from {len(shards)} shard(s) to {path}.")
+    return total
+
+@_synchronized
+def import_vectors(path):
+    """Rebuild the index from a file written by export_vectors(), without computing embeddings again.
+
+    Vectors are routed to shards through their metadata, so the metadata store of the exported index
+    must be in place; vectors without metadata are skipped. Reduced vectors can only be imported into
+    an index with the same reduction. Returns the number of imported vectors.
+    """
+    global index_read_only
+    ids, vectors = read_vectors(path)
+    if vectors.shape[1] not in (EMBEDDING_DIM, index.d):
+        raise ValueError(f"Vector dimension {vectors.shape[1]} in {path} matches neither EMBEDDING_DIM {EMBEDDING_DIM} "
+                         f"nor the index dimension {index.d}")
+    filepaths = {vid: entry["filepath"] for vid, entry in _metadata_store().entries()}
+    known = np.isin(ids, np.fromiter(filepaths, dtype=np.int64, count=len(filepaths)))
+    if not known.all():
+        print(f"Skipping {int((~known).sum())} vectors without metadata.")
+    ids = np.asarray(ids)[known]
+    vectors = np.ascontiguousarray(vectors[known], dtype=np.float32)
+
+    _reset_shards()
+    if vectors.shape[1] == EMBEDDING_DIM and index.d != EMBEDDING_DIM:
+        vectors = reducer.apply(vectors)  # Full embeddings into an index of reduced vectors
+    for name, (shard_ids, shard_vectors) in _route_to_shards(ids, vectors, filepaths).items():
+        _install_shard(name, shard_ids, shard_vectors)
+    index_read_only = False
+    save_index()
+    _maybe_reduce_index()
+    print(f"Imported {len(ids)} vectors from {path} into {len(shards)} shard(s).")
+    return len(ids)
+
+def get_metadata(ids=None):
+    """Return {vector_id: entry} for the given ids; without ids every entry is loaded.
+
+    Only the contents of the returned entries are read from the blob store and decompressed.
+    """
+    store = _metadata_store()
+    if ids is None:
+        return _resolve_content(dict(store.entries()))
+    return _resolve_content(store.get(ids))
 
 def retrieve_vectors(n=5):
-    n = min(n, index.ntotal)
-    vectors = np.zeros((n, EMBEDDING_DIM), dtype=np.float32)
-    for i in range(n):
-        vectors[i] = index.reconstruct(i)
-    return vectors
+    vectors = [np.zeros((0, index.d), dtype=np.float32)]
+    for shard in shards.values():
+        ids = get_ids(shard)[:n - sum(len(v) for v in vectors)]
+        vectors.append(reconstruct_vectors(shard, ids))
+    return np.vstack(vectors)
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _stats_source():
+    """(index, shard types, generation, memory-mapped) that index_stats() describes.
+
+    A process that loaded the index (the indexer) reports its own, without taking the writer lock or
+    loading a second copy; any other process reports the snapshot served by current_index().
+    """
+    if _index_loaded:
+        return index, dict(shard_types), _read_index_info().get("generation", 0), index_read_only
+    served = current_index()
+    generation = _reader_snapshot[1] if _reader_snapshot is not None and _reader_snapshot[2] is served else 0
+    return served, served.shard_types, generation, served.memory_mapped
+
+def index_stats(top_files=0):
+    """Size and health figures of the index.
+
+    In the indexer these describe its loaded index; elsewhere the published snapshot generation returned
+    by current_index(), with the write-ahead log changes applied on top of it. Counters, file sizes and
+    aggregate SQL queries over the metadata are read; the latter grow with the number of chunks, so this
+    suits reports and occasional health checks rather than the query path. Vector memory is what the
+    shards hold in RAM (or map); metadata and content are the sizes of their files on disk. With
+    top_files, the files with the most vectors are listed as well.
+    """
+    served, types, generation, memory_mapped = _stats_source()
+    store = _metadata_store()
+    metadata_stats = store.stats()
+    shard_stats = {}
+    for name, shard in list(served.shards.items()):  # A copy, as the indexer may add shards meanwhile
+        prefilter = served.binary_prefilters.get(name)
+        stored = served.vector_stores.get(name)
+        shard_bytes = index_memory_bytes(shard)
+        shard_stats[name] = {
+            "index_type": types[name],
+            "ntotal": shard.ntotal,
+            "bytes": shard_bytes,
+            "bytes_per_vector": shard_bytes / shard.ntotal if shard.ntotal else 0.0,
+            "exact_vector_bytes": stored.nbytes() if stored is not None else 0,
+            "prefilter_bytes": prefilter.ntotal * prefilter.nbits // 8 if prefilter is not None else 0,
+            "params": describe_index(shard),
+            "configured_params": index_params(types[name])
+        }
+
+    log_vectors = served.overlay.index.ntotal if served.overlay is not None else 0
+    ntotal = served.ntotal + log_vectors
+    live = metadata_stats["chunks"]
+    vector_bytes = sum(shard["bytes"] for shard in shard_stats.values())
+    stats = {
+        "namespace": _namespace(),
+        "generation": generation,
+        "configured_index_type": FAISS_INDEX_TYPE,
+        "memory_mapped": memory_mapped,
+        "ntotal": ntotal,
+        "log_vectors": log_vectors,  # Added since the snapshot, searched from the write-ahead log
+        "live_vectors": live,
+        # Vectors of removed files and superseded copies that HNSW cannot delete, until compaction
+        "stale_fraction": max(ntotal - live, 0) / ntotal if ntotal else 0.0,
+        "bytes_per_vector": vector_bytes / ntotal if ntotal else 0.0,
+        "files": metadata_stats["files"],
+        "vectors_per_file": live / metadata_stats["files"] if metadata_stats["files"] else 0.0,
+        "memory": {
+            "vectors": vector_bytes,
+            "exact_vectors": sum(shard["exact_vector_bytes"] for shard in shard_stats.values()),
+            "prefilters": sum(shard["prefilter_bytes"] for shard in shard_stats.values()),
+            "metadata": _file_size(_metadata_file()) + _file_size(_metadata_file() + "-wal"),
+            "content": _file_size(_blob_store().path)
+        },
+        "content_raw_bytes": metadata_stats["content_raw_bytes"],
+        "wal_bytes": _file_size(_wal_file()),
+        "reduction": served.reducer.info() if _reduces(served) else None,
+        "shards": shard_stats
+    }
+    cache = embedding_cache()
+    if cache is not None:
+        stats["embedding_cache"] = cache.stats()
+    if top_files:
+        stats["largest_files"] = store.chunks_per_file(top_files)
+    return stats
+
+def format_stats(stats):
+    """Render index_stats() as a human-readable report."""
+    namespace = stats["namespace"]
+    memory = stats["memory"]
+    lines = [
+        f"Namespace: {namespace['provider']}/{namespace['model']} (dim {namespace['dim']}), "
+        f"generation {stats['generation']}, configured type {stats['configured_index_type']}"
+        + (", memory-mapped" if stats["memory_mapped"] else ""),
+        f"Vectors: {stats['ntotal']} ({stats['live_vectors']} live, {stats['stale_fraction']:.1%} stale or duplicate, "
+        f"{stats['log_vectors']} from the write-ahead log), "
+        f"{stats['bytes_per_vector']:.1f} bytes/vector",
+        f"Files: {stats['files']} ({stats['vectors_per_file']:.2f} vectors/file)",
+        f"Memory: vectors {memory['vectors']} B, exact vectors on disk {memory['exact_vectors']} B, "
+        f"prefilters {memory['prefilters']} B",
+        f"Disk: metadata {memory['metadata']} B, content {memory['content']} B "
+        f"({stats['content_raw_bytes']} B uncompressed), write-ahead log {stats['wal_bytes']} B"
+    ]
+    reduction = stats.get("reduction")
+    if reduction is not None:
+        recall = f", recall@{RECALL_K} {reduction['recall']:.3f} against full embeddings" if reduction["recall"] is not None else ""
+        lines.append(f"Reduction: {reduction['method']}, {reduction['input_dim']} -> {reduction['dim']} dimensions{recall}")
+    cache = stats.get("embedding_cache")
+    if cache is not None:
+        lines.append(f"Embedding cache: {cache['entries']} entries, {cache['bytes']} of {cache['max_bytes']} B, "
+                     f"{cache['hits']} hits / {cache['misses']} misses this process")
+    for name, shard in stats["shards"].items():
+        params = ", ".join(f"{key}={value}" for key, value in shard["params"].items())
+        lines.append(f"Shard {name}: {shard['index_type']}, {shard['ntotal']} vectors, "
+                     f"{shard['bytes_per_vector']:.1f} bytes/vector ({params})")
+    for filepath, count in stats.get("largest_files", []):
+        lines.append(f"  {count:6d} vectors  {filepath}")
+    return "\n".join(lines)
 
 def inspect_metadata(n=5):
-    metadata = get_metadata()
-    print(f"Inspecting the first {n} metadata entries:")
-    for i, data in enumerate(metadata[:n]):
-        print(f"Entry {i}:")
-        print(f"Filename: {data['filename']}")
-        print(f"Filepath: {data['filepath']}")
-        print(f"Content: {data['content'][:100]}...")  # Show the first 100 characters
-        print()
+    """Print the index statistics and the n files with the most vectors."""
+    print(format_stats(index_stats(top_files=n)))
\ No newline at end of file
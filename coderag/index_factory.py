@@ -0,0 +1,398 @@
+import os
+import struct
+import tempfile
+import faiss
+import numpy as np
+from coderag.config import (
+    FAISS_HNSW_M,
+    FAISS_HNSW_EF_CONSTRUCTION,
+    FAISS_HNSW_EF_SEARCH,
+    FAISS_IVF_NLIST,
+    FAISS_IVF_NPROBE,
+    FAISS_PQ_M,
+    FAISS_PQ_NBITS,
+    FAISS_TRAIN_SAMPLE_SIZE
+)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq", "sq8", "fp16")
+
+# SQ8 only learns per-dimension value ranges, which a modest sample captures
+SQ8_MIN_TRAINING_VECTORS = 1000
+
+# Id given to vectors "removed" from an index that cannot remove them (HNSW); see remove_ids()
+TOMBSTONE_ID = -1
+
+def requires_training(index_type):
+    """Return True if the given index type needs a training pass before vectors can be added."""
+    return index_type in ("ivf", "ivfpq", "sq8")
+
+def is_lossy(index_type):
+    """Return True if the index stores compressed codes, so search results benefit from exact re-ranking."""
+    return index_type in ("ivfpq", "sq8", "fp16")
+
+def min_training_vectors(index_type):
+    """Number of vectors needed before an index of this type can be trained reliably."""
+    if not requires_training(index_type):
+        return 0
+    if index_type == "sq8":
+        return SQ8_MIN_TRAINING_VECTORS
+    # FAISS warns below ~39 points per centroid; PQ also needs 2^nbits points per sub-quantizer
+    minimum = FAISS_IVF_NLIST * 39
+    if index_type == "ivfpq":
+        minimum = max(minimum, 2 ** FAISS_PQ_NBITS)
+    return minimum
+
+def build_index(index_type, dim):
+    """Create an empty FAISS index of the given type."""
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        apply_search_params(index)
+        return index
+
+    if index_type == "ivf":
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, FAISS_IVF_NLIST)
+        apply_search_params(index)
+        return index
+
+    if index_type == "ivfpq":
+        if dim % FAISS_PQ_M != 0:
+            raise ValueError(f"Embedding dimension {dim} is not divisible by FAISS_PQ_M={FAISS_PQ_M}")
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, FAISS_IVF_NLIST, FAISS_PQ_M, FAISS_PQ_NBITS)
+        apply_search_params(index)
+        return index
+
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+
+    if index_type == "fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+
+    raise ValueError(f"Unknown FAISS index type '{index_type}', expected one of {INDEX_TYPES}")
+
+def train_index(index, vectors, sample_size=FAISS_TRAIN_SAMPLE_SIZE):
+    """Train the index on a random sample of at most sample_size vectors."""
+    if index.is_trained:
+        return
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if len(vectors) > sample_size:
+        rng = np.random.default_rng(1234)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    else:
+        sample = vectors
+    index.train(sample)
+
+def wrap_with_ids(index):
+    """Make the index accept caller-chosen 64-bit vector ids.
+
+    IVF indexes store ids natively in their inverted lists. Other indexes are wrapped in
+    IndexIDMap2, which keeps the id -> position map needed for reconstruction by id.
+    """
+    if _extract_ivf(index) is not None:
+        return index
+    return faiss.IndexIDMap2(index)
+
+def _extract_ivf(index):
+    return None if isinstance(index, MappedFlatIndex) else faiss.try_extract_index_ivf(index)
+
+def base_index(index):
+    """Return the index below an IndexIDMap/IndexIDMap2 wrapper, if any."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+def apply_search_params(index):
+    """Set query-time parameters (nprobe, efSearch) from the configuration.
+
+    These are not reliably preserved by faiss.write_index, so they are re-applied after loading.
+    """
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = FAISS_IVF_NPROBE
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+
+def make_reconstructable(index):
+    """Rebuild the direct map of IVF indexes so vectors can be reconstructed by id."""
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        # The map is persisted as a type only, so reset it to force a rebuild from the inverted lists
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+def get_ids(index):
+    """Return the ids of all vectors stored in an id-aware index, leaving out tombstoned ones."""
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        invlists = ivf.invlists
+        ids = [np.zeros(0, dtype=np.int64)]
+        for list_no in range(ivf.nlist):
+            list_size = invlists.list_size(list_no)
+            if list_size == 0:
+                continue
+            list_ids = invlists.get_ids(list_no)
+            ids.append(faiss.rev_swig_ptr(list_ids, list_size).copy())
+            invlists.release_ids(list_no, list_ids)
+        return np.concatenate(ids)
+    ids = _id_map(index)
+    return ids[ids != TOMBSTONE_ID]
+
+def _id_map(index):
+    if isinstance(index, MappedFlatIndex):
+        return index.ids.copy()
+    return faiss.vector_to_array(index.id_map).astype(np.int64)
+
+def reconstruct_vectors(index, ids):
+    """Reconstruct the stored vectors for the given ids."""
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    make_reconstructable(index)
+    return index.reconstruct_batch(ids)
+
+def all_vectors(index):
+    """Return (ids, vectors) of every vector stored in an id-aware index, in storage order.
+
+    Non-IVF indexes are read with a single reconstruct_n over their storage, which is a plain copy of
+    the codes; IVF indexes are reconstructed through their direct map.
+    """
+    if _extract_ivf(index) is not None:
+        ids = get_ids(index)
+        return ids, reconstruct_vectors(index, ids) if len(ids) else np.zeros((0, index.d), dtype=np.float32)
+    ids = _id_map(index)
+    if len(ids) == 0:
+        return ids, np.zeros((0, index.d), dtype=np.float32)
+    live = ids != TOMBSTONE_ID
+    return ids[live], base_index(index).reconstruct_n(0, index.ntotal)[live]
+
+def remove_ids(index, selector):
+    """Remove the vectors matched by the selector; returns the number of removed vectors.
+
+    HNSW graphs cannot drop vectors, so their ids are overwritten with TOMBSTONE_ID instead. Searches
+    with search_params() skip them, and they disappear when the index is compacted. A chunk added again
+    under the same id therefore has a single live copy.
+    """
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        # Removal by range is not supported while a hashtable direct map is active
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    try:
+        return index.remove_ids(selector)
+    except RuntimeError:
+        return _tombstone_ids(index, selector)
+
+def _tombstone_ids(index, selector):
+    ids = _id_map(index)
+    if isinstance(selector, faiss.IDSelectorRange):
+        members = (ids >= selector.imin) & (ids < selector.imax)
+    else:
+        members = np.array([selector.is_member(int(vid)) for vid in ids], dtype=bool)
+    members &= ids != TOMBSTONE_ID
+    if members.any():
+        ids[members] = TOMBSTONE_ID
+        faiss.copy_array_to_vector(ids, index.id_map)
+        if isinstance(index, faiss.IndexIDMap2):
+            index.construct_rev_map()
+    return int(members.sum())
+
+def search_params(index):
+    """SearchParameters that hide tombstoned vectors, for indexes that have them (HNSW); else None."""
+    base = base_index(index)
+    if not isinstance(base, faiss.IndexHNSW):
+        return None
+    selector = faiss.IDSelectorNot(faiss.IDSelectorRange(TOMBSTONE_ID, TOMBSTONE_ID + 1))
+    params = faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    params.referenced_objects = [selector]  # The parameters only hold a pointer to the selector
+    return params
+
+def mmap_io_flags():
+    """FAISS read flags for a shared, read-only memory mapping of an index file.
+
+    IO_FLAG_MMAP_IFC (faiss >= 1.10) maps flat, HNSW and IVF storage in place; older builds only
+    map the inverted lists of IVF indexes and read other index types into memory.
+    """
+    return faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+def read_index_file(path, mmap=False):
+    """Read an index from disk, memory-mapping it read-only if requested and supported.
+
+    Without IO_FLAG_MMAP_IFC, flat shards are mapped by MappedFlatIndex instead of being read into memory.
+    """
+    if mmap:
+        if not hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            mapped = MappedFlatIndex.open(path)
+            if mapped is not None:
+                return mapped
+        try:
+            return faiss.read_index(path, mmap_io_flags())
+        except RuntimeError as e:
+            print(f"Memory-mapping {path} is not supported ({e}); loading it into memory instead.")
+    return faiss.read_index(path)
+
+def _read_index_header(f):
+    """Read the fields faiss.write_index stores for every index; returns (d, ntotal, metric_type)."""
+    d, ntotal, _, _, _, metric_type = struct.unpack("<iqqq?i", f.read(33))
+    if metric_type > faiss.METRIC_L2:
+        f.read(4)  # metric_arg
+    return d, ntotal, metric_type
+
+class MappedFlatIndex:
+    """Read-only IndexIDMap(2) over IndexFlatL2, searched in place from a memory-mapped index file.
+
+    FAISS builds without IO_FLAG_MMAP_IFC (before 1.10) only map IVF inverted lists and read flat
+    indexes into memory, so every query process would hold its own copy of the vectors. This maps
+    the float32 vectors of the file with numpy and searches them exactly, block by block.
+    """
+
+    is_trained = True
+    metric_type = faiss.METRIC_L2
+    search_block = 65536  # Vectors compared with the queries at once
+
+    def __init__(self, vectors, ids):
+        self.vectors = vectors
+        self.ids = ids
+        self.ntotal, self.d = vectors.shape
+        self.code_size = self.d * 4
+
+    @classmethod
+    def open(cls, path):
+        """Map the file at path, or return None if it does not hold an id-mapped IndexFlatL2."""
+        with open(path, "rb") as f:
+            if f.read(4) not in (b"IxMp", b"IxM2"):
+                return None
+            _read_index_header(f)
+            if f.read(4) != b"IxF2":
+                return None
+            d, ntotal, _ = _read_index_header(f)
+            (count,) = struct.unpack("<Q", f.read(8))
+            offset = f.tell()
+            f.seek(count * 4, os.SEEK_CUR)
+            (n_ids,) = struct.unpack("<Q", f.read(8))
+            ids = np.fromfile(f, dtype=np.int64, count=n_ids)
+        if count != ntotal * d or len(ids) != ntotal:
+            return None
+        if ntotal == 0:
+            return cls(np.zeros((0, d), dtype=np.float32), ids)
+        return cls(np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=(ntotal, d)), ids)
+
+    def search(self, x, k, params=None):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        labels = np.full((len(x), k), -1, dtype=np.int64)
+        query_norms = (x * x).sum(axis=1, keepdims=True)
+        for start in range(0, self.ntotal, self.search_block):
+            block = np.asarray(self.vectors[start:start + self.search_block])
+            block_distances = query_norms - 2 * x @ block.T + (block * block).sum(axis=1)
+            block_labels = np.broadcast_to(self.ids[start:start + len(block)], block_distances.shape)
+            distances = np.hstack([distances, np.maximum(block_distances, 0)])
+            labels = np.hstack([labels, block_labels])
+            order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+            distances = np.take_along_axis(distances, order, axis=1)
+            labels = np.take_along_axis(labels, order, axis=1)
+        return distances, labels
+
+    def reconstruct_n(self, start, n):
+        return np.array(self.vectors[start:start + n])
+
+    def reconstruct_batch(self, ids):
+        order = np.argsort(self.ids, kind="stable")
+        positions = order[np.searchsorted(self.ids, ids, sorter=order)]
+        return np.array(self.vectors[positions])
+
+def prefault_file(path, chunk_size=1 << 20):
+    """Pull a file into the OS page cache so the first queries on a mapped index do not page-fault."""
+    with open(path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            return
+        while f.read(chunk_size):
+            pass
+
+def index_memory_bytes(index):
+    """Approximate in-memory size of an index's codes, ids and graph, computed without serializing it."""
+    nbytes = 0
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        nbytes += index.ntotal * (8 if isinstance(index, faiss.IndexIDMap) else 24)  # id_map (+ rev_map)
+        index = base_index(index)
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        # Inverted lists hold a code and an id per vector; the coarse quantizer holds nlist centroids
+        return nbytes + ivf.ntotal * (ivf.code_size + 8) + ivf.nlist * ivf.d * 4
+    if isinstance(index, faiss.IndexHNSW):
+        graph = (index.hnsw.neighbors.size() + index.hnsw.levels.size() + index.hnsw.offsets.size() * 2) * 4
+        return nbytes + graph + index_memory_bytes(faiss.downcast_index(index.storage))
+    return nbytes + index.ntotal * getattr(index, "code_size", index.d * 4)
+
+def describe_index(index):
+    """Training and quantization parameters of a live index, as opposed to the configured ones."""
+    base = base_index(index)
+    params = {"class": type(base).__name__, "is_trained": bool(index.is_trained), "dim": index.d}
+    ivf = _extract_ivf(base)
+    if ivf is not None:
+        params.update(nlist=ivf.nlist, nprobe=ivf.nprobe)
+        if isinstance(ivf, faiss.IndexIVFPQ):
+            params.update(pq_m=ivf.pq.M, pq_nbits=ivf.pq.nbits)
+    if isinstance(base, faiss.IndexHNSW):
+        params.update(ef_construction=base.hnsw.efConstruction, ef_search=base.hnsw.efSearch,
+                      max_level=base.hnsw.max_level)
+    if isinstance(base, faiss.IndexScalarQuantizer):
+        params.update(sq_code_size=base.code_size)
+    params["code_size"] = getattr(ivf or base, "code_size", None)
+    return params
+
+def index_params(index_type):
+    """Build parameters worth persisting next to the index, for inspection and reloading."""
+    params = {}
+    if index_type == "hnsw":
+        params.update(M=FAISS_HNSW_M, ef_construction=FAISS_HNSW_EF_CONSTRUCTION)
+    if requires_training(index_type):
+        params.update(train_sample_size=FAISS_TRAIN_SAMPLE_SIZE)
+    if index_type in ("ivf", "ivfpq"):
+        params.update(nlist=FAISS_IVF_NLIST)
+    if index_type == "ivfpq":
+        params.update(pq_m=FAISS_PQ_M, pq_nbits=FAISS_PQ_NBITS)
+    return params
+
+def storage_report(vectors, queries, k=10, rerank_factor=4, index_types=("flat", "fp16", "sq8")):
+    """Compare memory per vector and recall@k of index types on the given vectors.
+
+    Recall is measured against exact flat search, once on the index alone and once with
+    rerank_factor * k candidates re-ranked by exact distance. Returns one dict per index type.
+    """
+    from coderag.vector_store import VectorStore, exact_rerank
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    dim = vectors.shape[1]
+    k = min(k, len(vectors))
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    def recall(ids):
+        return float(np.mean([len(set(found) & set(expected)) / k for found, expected in zip(ids, truth)]))
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = VectorStore(os.path.join(tmp_dir, "report"), dim)
+        store.add(np.arange(len(vectors)), vectors)
+        for index_type in index_types:
+            index = build_index(index_type, dim)
+            train_index(index, vectors)
+            index.add(vectors)
+            _, ids = index.search(queries, k)
+            _, candidates = index.search(queries, k * max(rerank_factor, 1))
+            _, reranked = exact_rerank(queries, candidates, store, k)
+            report.append({
+                "index_type": index_type,
+                "bytes_per_vector": len(faiss.serialize_index(index)) / len(vectors),
+                "recall": recall(ids),
+                "recall_reranked": recall(reranked)
+            })
+    return report
@@ -0,0 +1,151 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from coderag.config import EMBEDDING_DIM, LOCAL_EMBEDDING_WORKERS
+
+# Name recorded as the embedding model of the "local" provider; bump it when the features change,
+# so indexes built with other features get their own namespace
+LOCAL_EMBEDDING_MODEL = "feature-hashing-v1"
+
+TEXTS_PER_PASS = 512  # Texts hashed together in one vectorized pass
+WORKER_TEXTS = 4096  # Texts sent to a worker process at a time
+
+_PRIME = 0x100000001B3  # Odd, so its powers are invertible modulo 2**64
+_PRIME_INVERSE = pow(_PRIME, -1, 2 ** 64)
+# Salts keep the three kinds of features apart; weights favour whole identifiers
+_IDENTIFIER, _SUBWORD, _TRIGRAM = np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9)
+_WEIGHTS = {"identifier": 1.0, "subword": 0.7, "trigram": 0.3}
+
+# Byte classes and lower-casing as 256-entry lookup tables, applied with one gather each
+_ALNUM, _WORD, _LOWERCASE, _UPPERCASE = 1, 2, 4, 8
+_BYTES = np.arange(256)
+_CLASSES = np.zeros(256, dtype=np.uint8)
+_CLASSES[(_BYTES >= 48) & (_BYTES <= 57) | (_BYTES >= 128)] = _ALNUM | _WORD
+_CLASSES[97:123] = _ALNUM | _WORD | _LOWERCASE
+_CLASSES[65:91] = _ALNUM | _WORD | _UPPERCASE
+_CLASSES[95] = _WORD  # "_"
+_LOWER = np.where((_BYTES >= 65) & (_BYTES <= 90), _BYTES + 32, _BYTES).astype(np.uint8)
+
+# PRIME**i and PRIME**-i, replaced together by a larger pair when a longer pass needs them
+_tables = (np.ones(1, dtype=np.uint64), np.ones(1, dtype=np.uint64))
+_tables_lock = threading.Lock()
+
+def _power_tables(n):
+    """PRIME**i and PRIME**-i modulo 2**64 for i < n; uint64 arithmetic wraps around.
+
+    Threads embedding at once (e.g. the reindexing pipeline's workers) share the tables, so larger ones
+    are built aside and published as one tuple; a reader never sees a table shorter than it asked for.
+    """
+    global _tables
+    powers, inverse_powers = _tables
+    if len(powers) < n:
+        with _tables_lock:
+            powers, inverse_powers = _tables
+            if len(powers) < n:
+                size = max(n, 2 * len(powers))
+                factors = np.full(size, _PRIME, dtype=np.uint64)
+                factors[0] = 1
+                powers = np.cumprod(factors, dtype=np.uint64)
+                factors[1:] = _PRIME_INVERSE
+                inverse_powers = np.cumprod(factors, dtype=np.uint64)
+                _tables = (powers, inverse_powers)
+    return powers[:n], inverse_powers[:n]
+
+def _mix(h):
+    """splitmix64 finalizer, spreading polynomial hashes over all 64 bits."""
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+def _runs(mask, breaks=None):
+    """Start and end (exclusive) positions of the runs of True in mask, also split before breaks."""
+    padded = np.concatenate(([False], mask, [False]))
+    starts = padded[1:-1] & ~padded[:-2]
+    if breaks is not None:
+        starts |= mask & breaks
+    # A run ends where the next position is outside the mask or starts the next run
+    ends = mask & (~np.concatenate((mask[1:], [False])) | np.concatenate((starts[1:], [False])))
+    return np.flatnonzero(starts), np.flatnonzero(ends) + 1
+
+def _hash_pass(texts, dim):
+    """Feature-hash a group of texts into a (len(texts), dim) float32 matrix."""
+    encoded = [text.encode("utf-8", "replace") for text in texts]
+    data = np.frombuffer(b"\0".join(encoded) + b"\0", dtype=np.uint8)
+    lengths = np.array([len(e) + 1 for e in encoded])
+    doc = np.repeat(np.arange(len(texts)), lengths)
+
+    lower = _LOWER[data]
+    classes = _CLASSES[data]
+    alnum = (classes & _ALNUM).astype(bool)
+    word = (classes & _WORD).astype(bool)  # Identifier characters, including "_"
+    # An upper-case letter after a lower-case one starts a word part: "fooBar" -> "foo", "bar"
+    camel = np.concatenate(([False], (classes[:-1] & _LOWERCASE).astype(bool) & (classes[1:] & _UPPERCASE).astype(bool)))
+
+    codes = lower.astype(np.uint64) + np.uint64(1)
+    powers, inverse_powers = _power_tables(len(data) + 1)
+    prefix = np.zeros(len(data) + 1, dtype=np.uint64)
+    np.cumsum(codes * powers[:len(data)], dtype=np.uint64, out=prefix[1:])
+
+    offsets = doc * dim  # Row of each byte's text in the flattened output
+    buckets, weights = [], []
+
+    def add(hashes, positions, weight):
+        # The high 32 bits pick the bucket (multiply-shift, no modulo), the low bit the sign
+        buckets.append(offsets[positions] + (((hashes >> np.uint64(32)) * np.uint64(dim)) >> np.uint64(32)).astype(np.int64))
+        weights.append(np.where(hashes & np.uint64(1), -weight, weight))
+
+    for salt, kind, (starts, ends) in ((_IDENTIFIER, "identifier", _runs(word)),
+                                      (_SUBWORD, "subword", _runs(alnum, camel))):
+        # Polynomial hash of data[start:end], shifted back to position 0 so equal tokens hash equally
+        hashes = (prefix[ends] - prefix[starts]) * inverse_powers[starts]
+        add(_mix(hashes ^ salt), starts, _WEIGHTS[kind])
+
+    # Trigrams fit in 24 bits, so one multiplicative (Fibonacci) hash spreads them well enough
+    trigram = np.flatnonzero(alnum[:-2] & alnum[1:-1] & alnum[2:])
+    packed = (lower[trigram].astype(np.uint64) << np.uint64(16)) | (lower[trigram + 1].astype(np.uint64) << np.uint64(8)) \
+        | lower[trigram + 2].astype(np.uint64)
+    add((packed ^ _TRIGRAM) * np.uint64(0x9E3779B97F4A7C15), trigram, _WEIGHTS["trigram"])
+
+    counts = np.bincount(np.concatenate(buckets), weights=np.concatenate(weights), minlength=len(texts) * dim)
+    # Most buckets are empty, so the scaling only touches the others
+    filled = np.flatnonzero(counts)
+    values = np.sign(counts[filled]) * np.log1p(np.abs(counts[filled]))  # Sublinear term frequency
+    norms = np.sqrt(np.bincount(filled // dim, weights=values * values, minlength=len(texts)))
+    vectors = np.zeros(len(texts) * dim, dtype=np.float32)
+    vectors[filled] = values / norms[filled // dim]
+    return vectors.reshape(len(texts), dim)
+
+def embed_texts(texts, dim=EMBEDDING_DIM):
+    """Embed texts in this process; deterministic across runs, machines and processes."""
+    if not texts:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.vstack([_hash_pass(texts[start:start + TEXTS_PER_PASS], dim)
+                      for start in range(0, len(texts), TEXTS_PER_PASS)])
+
+_lock = threading.Lock()
+_pool = None
+_pool_workers = 0
+
+def _process_pool(workers):
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool, _pool_workers = ProcessPoolExecutor(max_workers=workers), workers
+        return _pool
+
+def local_embeddings(texts, dim=EMBEDDING_DIM, workers=None):
+    """Embed texts with the feature-hashing embedder, spread over LOCAL_EMBEDDING_WORKERS processes if set.
+
+    Each text becomes a signed, log-scaled count of hashed features, L2-normalized: its identifiers,
+    their parts split at "_" and camelCase, and character trigrams within words, all lowercased.
+    """
+    texts = list(texts)
+    workers = LOCAL_EMBEDDING_WORKERS if workers is None else workers
+    if workers <= 0 or len(texts) <= WORKER_TEXTS:
+        return embed_texts(texts, dim)
+    groups = [texts[start:start + WORKER_TEXTS] for start in range(0, len(texts), WORKER_TEXTS)]
+    return np.vstack(list(_process_pool(workers).map(embed_texts, groups, [dim] * len(groups))))
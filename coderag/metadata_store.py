@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import threading
+
+# Columns of a metadata row besides the vector id, with their SQLite definitions
+COLUMNS = {
+    "filepath": "TEXT NOT NULL DEFAULT ''",
+    "filename": "TEXT NOT NULL DEFAULT ''",
+    "chunk": "INTEGER NOT NULL DEFAULT 0",
+    "content": "TEXT",  # Inline content, only set on rows written before the blob store existed
+    "content_hash": "TEXT",  # SHA-256 of the content, stored once in the blob store
+    "start_line": "INTEGER",  # Line span of the chunk in the file (1-based, inclusive); NULL for whole files
+    "end_line": "INTEGER"
+}
+
+# Columns of the file manifest besides the path: what a file looked like when it was indexed
+FILE_COLUMNS = {
+    "size": "INTEGER NOT NULL",
+    "mtime_ns": "INTEGER NOT NULL",
+    "content_hash": "TEXT NOT NULL",  # SHA-256 of the whole file content
+    "first_id": "INTEGER NOT NULL",  # The file's vectors have ids first_id .. first_id + chunks - 1
+    "chunks": "INTEGER NOT NULL",
+    "chunking": "TEXT NOT NULL"  # Chunking settings the file was split with, see chunking.chunking_signature()
+}
+
+class MetadataStore:
+    """SQLite table of chunk metadata keyed by FAISS vector id.
+
+    Writes are grouped in an implicit transaction that becomes visible to other processes on commit(),
+    which the index layer calls together with saving the vectors. Lookups only read the requested rows.
+    The same database holds the catalog of the content blob store and the manifest of indexed files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        # The monitor writes from the watchdog thread, so the connection is shared across threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")  # Readers do not block the writer and vice versa
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, "
+            + ", ".join(f"{name} {definition}" for name, definition in COLUMNS.items()) + ")"
+        )
+        # Add columns introduced after the database was created
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        for name, definition in COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE chunks ADD COLUMN {name} {definition}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_filepath ON chunks (filepath)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, offset INTEGER NOT NULL, "
+            "length INTEGER NOT NULL, size INTEGER NOT NULL, codec TEXT NOT NULL)"
+        )
+        # Generation of the blob file the catalog rows point into (one row; none means 0)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS blob_generation (generation INTEGER NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files (filepath TEXT PRIMARY KEY, "
+            + ", ".join(f"{name} {definition}" for name, definition in FILE_COLUMNS.items()) + ")"
+        )
+        self._conn.commit()
+
+    def upsert(self, rows):
+        """Insert or replace rows given as (vector_id, entry) pairs."""
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO chunks (id, {', '.join(COLUMNS)}) VALUES (?, {', '.join('?' * len(COLUMNS))})",
+                [(int(vid), *(entry.get(column) for column in COLUMNS)) for vid, entry in rows]
+            )
+
+    def get(self, ids):
+        """Return {vector_id: entry} for the ids that exist in the store."""
+        ids = [int(vid) for vid in ids]
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM chunks WHERE id IN ({', '.join('?' * len(ids))})", ids
+            ).fetchall()
+        return {row["id"]: _row_to_entry(row) for row in rows}
+
+    def delete_range(self, start, end):
+        """Delete rows with start <= id < end; returns the number of deleted rows."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM chunks WHERE id >= ? AND id < ?", (start, end)).rowcount
+
+    def ids(self):
+        """Return all vector ids in ascending order."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM chunks ORDER BY id")]
+
+    def entries(self, limit=None):
+        """Return (vector_id, entry) pairs in id order, optionally limited to the first `limit` rows."""
+        query, params = "SELECT * FROM chunks ORDER BY id", ()
+        if limit is not None:
+            query, params = query + " LIMIT ?", (limit,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [(row["id"], _row_to_entry(row)) for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def stats(self):
+        """Row, file and blob counts and the raw and compressed size of the blobs, from aggregate queries."""
+        with self._lock:
+            chunks, files = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT filepath) FROM chunks").fetchone()
+            blobs, raw_bytes, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM blobs"
+            ).fetchone()
+        return {"chunks": chunks, "files": files, "blobs": blobs,
+                "content_raw_bytes": raw_bytes, "content_stored_bytes": stored_bytes}
+
+    def chunks_per_file(self, limit=None):
+        """Return (filepath, chunk count) pairs, files with the most chunks first."""
+        query, params = "SELECT filepath, COUNT(*) AS n FROM chunks GROUP BY filepath ORDER BY n DESC, filepath", ()
+        if limit is not None:
+            query, params = query + " LIMIT ?", (limit,)
+        with self._lock:
+            return [(row[0], row[1]) for row in self._conn.execute(query, params)]
+
+    def blob_locations(self, hashes):
+        """Return {hash: (offset, length, size, codec)} for the given content hashes."""
+        hashes = list(set(hashes))
+        if not hashes:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM blobs WHERE hash IN ({', '.join('?' * len(hashes))})", hashes
+            ).fetchall()
+        return {row["hash"]: (row["offset"], row["length"], row["size"], row["codec"]) for row in rows}
+
+    def blob_snapshot(self, hashes):
+        """Return (generation, {hash: (offset, length, size, codec)}) read in one statement.
+
+        The generation names the blob file the locations refer to; reading both together keeps them
+        consistent while compaction switches the catalog to a new file.
+        """
+        hashes = list(set(hashes))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT (SELECT COALESCE(MAX(generation), 0) FROM blob_generation) AS generation, blobs.* "
+                f"FROM (SELECT 1) LEFT JOIN blobs ON hash IN ({', '.join('?' * len(hashes))})", hashes
+            ).fetchall()
+        locations = {row["hash"]: (row["offset"], row["length"], row["size"], row["codec"])
+                     for row in rows if row["hash"] is not None}
+        return rows[0]["generation"], locations
+
+    def blob_generation(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(generation), 0) FROM blob_generation").fetchone()[0]
+
+    def add_blob(self, content_hash, offset, length, size, codec):
+        self.add_blobs([(content_hash, offset, length, size, codec)])
+
+    def add_blobs(self, rows):
+        """Record (hash, offset, length, size, codec) rows of appended blob frames."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO blobs (hash, offset, length, size, codec) VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def referenced_blobs(self):
+        """Return the catalog rows of blobs still referenced by a chunk, in file order."""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT hash, offset, length, size, codec FROM blobs "
+                "WHERE hash IN (SELECT content_hash FROM chunks) ORDER BY offset"
+            )]
+
+    def replace_blobs(self, rows, generation):
+        """Replace the whole blob catalog with (hash, offset, length, size, codec) rows in the given blob file generation.
+
+        Both change in the same transaction, which becomes visible to other processes on commit().
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM blob_generation")
+            self._conn.execute("INSERT INTO blob_generation (generation) VALUES (?)", (generation,))
+            self._conn.execute("DELETE FROM blobs")
+            self._conn.executemany(
+                "INSERT INTO blobs (hash, offset, length, size, codec) VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def upsert_file(self, filepath, entry):
+        """Record an indexed file in the file manifest, replacing its previous entry."""
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO files (filepath, {', '.join(FILE_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(FILE_COLUMNS))})",
+                (filepath, *(entry[column] for column in FILE_COLUMNS))
+            )
+
+    def update_file_stat(self, filepath, size, mtime_ns):
+        with self._lock:
+            self._conn.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE filepath = ?", (size, mtime_ns, filepath))
+
+    def delete_file(self, filepath):
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE filepath = ?", (filepath,))
+
+    def files(self):
+        """Return the file manifest as {filepath: entry}."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM files").fetchall()
+        return {row["filepath"]: {column: row[column] for column in FILE_COLUMNS} for row in rows}
+
+    def filepaths(self):
+        """Return the set of file paths that have chunks, including files indexed before the manifest existed."""
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT DISTINCT filepath FROM chunks")}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM files")
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def _row_to_entry(row):
+    return {column: row[column] for column in COLUMNS}
+
+def remove_store_files(path):
+    """Delete the database file and its SQLite journal files; returns the paths that were removed."""
+    removed = []
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+            removed.append(path + suffix)
+    return removed
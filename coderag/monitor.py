@@ -1,9 +1,10 @@
 import time
 import os
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from coderag.index import add_to_index, save_index
-from coderag.embeddings import generate_embeddings
+from coderag.index import add_to_index, remove_from_index, commit_index, maybe_checkpoint_index, save_index
+from coderag.embeddings import embed_file_chunks, provider_unavailable
 from coderag.config import WATCHED_DIR, IGNORE_PATHS
 
 def should_ignore_path(path):
@@ -14,20 +15,105 @@ def should_ignore_path(path):
     return False
 
 class CodeChangeHandler(FileSystemEventHandler):
+    """Collects file changes; flush() indexes them with batched embedding requests.
+
+    Editors often write a file several times in a row, so queuing also embeds each file once per flush.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pending = {}  # Path -> "index" or "remove", in order of the last change
+
     def on_modified(self, event):
         if event.is_directory or should_ignore_path(event.src_path):
             return
 
         if event.src_path.endswith(".py"):
-            print(f"Detected change in file: {event.src_path}")
-            with open(event.src_path, 'r', encoding='utf-8') as f:
-                full_content = f.read()
-            embeddings = generate_embeddings(full_content)
-            if embeddings is not None and len(embeddings) > 0:
-                filename = os.path.basename(event.src_path)
-                add_to_index(embeddings, full_content, filename, event.src_path)
-                save_index()
-                print(f"Updated FAISS index for file: {event.src_path}")
+            self._queue(event.src_path, "index")
+
+    def on_deleted(self, event):
+        if event.is_directory or should_ignore_path(event.src_path):
+            return
+
+        if event.src_path.endswith(".py"):
+            self._queue(event.src_path, "remove")
+
+    def on_moved(self, event):
+        if event.is_directory:
+            return
+
+        # A move is a delete of the old path followed by a change of the new one
+        if event.src_path.endswith(".py") and not should_ignore_path(event.src_path):
+            self._queue(event.src_path, "remove")
+        if event.dest_path.endswith(".py") and not should_ignore_path(event.dest_path):
+            self._queue(event.dest_path, "index")
+
+    def _queue(self, path, action):
+        with self._lock:
+            self._pending.pop(path, None)
+            self._pending[path] = action
+
+    def _requeue(self, path):
+        # A change queued since the flush started is newer and wins
+        with self._lock:
+            self._pending.setdefault(path, "index")
+
+    def flush(self):
+        """Apply the queued changes and commit them once; returns the number of changed files.
+
+        While the embedding provider is unavailable (its circuit breaker is open) files stay queued, and
+        files that failed because the provider went down during the flush are queued again.
+        """
+        if provider_unavailable():
+            return 0
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        changed = 0
+        for path in [path for path, action in pending.items() if action == "remove"]:
+            if remove_from_index(path):
+                print(f"Removed file from FAISS index: {path}")
+                changed += 1
+
+        paths, contents, stats = [], [], []
+        for path in [path for path, action in pending.items() if action == "index"]:
+            print(f"Detected change in file: {path}")
+            try:
+                stat = os.stat(path)  # Taken before reading, for the file manifest
+                with open(path, 'r', encoding='utf-8') as f:
+                    contents.append(f.read())
+                paths.append(path)
+                stats.append(stat)
+            except OSError as e:  # E.g. deleted again before the flush; its delete event follows
+                print(f"Error reading file {path}: {e}")
+        embedded = embed_file_chunks(paths, contents)
+        for path, content, stat, (chunks, embeddings, failed) in zip(paths, contents, stats, embedded):
+            if failed and provider_unavailable():
+                print(f"Embedding provider unavailable, will retry {path}")
+                self._requeue(path)
+                continue
+            if failed:
+                print(f"Failed to generate embeddings for {failed} chunk(s) of {path}")
+            if not chunks:
+                if not failed and remove_from_index(path, content, stat):  # The file was emptied
+                    changed += 1
+                continue
+            try:
+                # Replaces the previous vectors
+                add_to_index(embeddings, content, os.path.basename(path), path, chunks=chunks,
+                             file_stat=None if failed else stat)
+            except ValueError as e:
+                print(f"Error indexing file {path}: {e}")
+                continue
+            print(f"Updated FAISS index for file: {path} ({len(chunks)} chunks)")
+            changed += 1
+
+        if changed:
+            commit_index()  # Appends to the write-ahead log instead of rewriting the whole index
+        return changed
 
 def start_monitoring():
     event_handler = CodeChangeHandler()
@@ -39,6 +125,13 @@ def start_monitoring():
     try:
         while True:
             time.sleep(1)
+            # Index the files changed during the last second with batched embedding requests
+            event_handler.flush()
+            # Periodically fold the write-ahead log into a new index snapshot
+            if maybe_checkpoint_index():
+                print("Checkpointed FAISS index.")
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    event_handler.flush()
+    save_index()
\ No newline at end of file
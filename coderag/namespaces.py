@@ -0,0 +1,43 @@
+import os
+import re
+import glob
+import json
+import hashlib
+from coderag.config import MODEL_PROVIDER, OPENAI_EMBEDDING_MODEL, OLLAMA_EMBEDDING_MODEL
+from coderag.local_embeddings import LOCAL_EMBEDDING_MODEL
+
+NAMESPACE_MARKER = ".ns-"
+
+def embedding_model(provider=MODEL_PROVIDER):
+    """Embedding model configured for a provider."""
+    if provider.lower() == "local":
+        return LOCAL_EMBEDDING_MODEL
+    return OLLAMA_EMBEDDING_MODEL if provider.lower() == "ollama" else OPENAI_EMBEDDING_MODEL
+
+def namespace_file(index_file, provider, model, dim):
+    """Index file of the (provider, model, dim) namespace; all other index files are derived from it.
+
+    Vectors of different embedding models are not comparable, so every model gets its own index,
+    metadata and write-ahead log next to FAISS_INDEX_FILE.
+    """
+    key = f"{provider.lower()}-{model}-{dim}"
+    slug = re.sub(r"[^A-Za-z0-9_.-]", "_", key)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]  # Keeps sanitized names unique
+    stem, ext = os.path.splitext(index_file)
+    return f"{stem}{NAMESPACE_MARKER}{slug}-{digest}{ext}"
+
+def list_namespaces(index_file):
+    """Describe the namespaces that have a saved snapshot next to index_file.
+
+    Returns dicts with provider, model, dim, generation and manifest path, sorted by provider and model.
+    """
+    stem = os.path.splitext(index_file)[0]
+    namespaces = []
+    for manifest in glob.glob(glob.escape(stem + NAMESPACE_MARKER) + "*.json"):
+        with open(manifest) as f:
+            info = json.load(f)
+        namespace = info.get("namespace")
+        if namespace is None:
+            continue
+        namespaces.append(dict(namespace, generation=info.get("generation", 0), manifest=manifest))
+    return sorted(namespaces, key=lambda n: (n["provider"], n["model"], n["dim"]))
@@ -0,0 +1,160 @@
+import os
+import time
+import queue
+import threading
+from coderag.index import add_to_index, remove_from_index, commit_index
+from coderag.chunking import chunk_file
+from coderag.embeddings import embed_chunks, provider_unavailable, embedding_retry_in, estimate_tokens
+from coderag.config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_MAX_IN_FLIGHT,
+    REINDEX_READERS,
+    REINDEX_EMBED_WORKERS,
+    REINDEX_QUEUE_SIZE,
+    REINDEX_COMMIT_FILES
+)
+
+_DONE = object()  # Put once per consumer of a queue after the last item
+
+def _items(source):
+    """Yield the items of a queue until its end marker."""
+    while True:
+        item = source.get()
+        if item is _DONE:
+            return
+        yield item
+
+def _start_stage(work, source, target, workers, consumers):
+    """Run work(source, target) on workers threads; once all have returned, mark the end of target for each consumer."""
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def run():
+        try:
+            work(source, target)
+        finally:
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                for _ in range(consumers):
+                    target.put(_DONE)
+
+    threads = [threading.Thread(target=run, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def _scan(filepaths, paths):
+    try:
+        for filepath in filepaths:
+            paths.put(filepath)
+    except Exception as e:  # The files found so far are still indexed
+        print(f"Error listing files to index: {e}")
+
+def _read(paths, files):
+    """Read and chunk files; each becomes (filepath, content, stat, chunks)."""
+    for filepath in _items(paths):
+        try:
+            stat = os.stat(filepath)  # Before reading, so a change made meanwhile is seen on the next start
+            with open(filepath, 'r', encoding='utf-8') as f:
+                content = f.read()
+            files.put((filepath, content, stat, chunk_file(filepath, content)))
+        except Exception as e:
+            print(f"Error reading file {filepath}: {e}")
+
+def _next_batch(files):
+    """Take files until their chunks fill one embedding request, without waiting once there is one.
+
+    Returns the files and whether the end of the queue was reached.
+    """
+    first = files.get()
+    if first is _DONE:
+        return [], True
+    batch = [first]
+    texts, tokens = len(first[3]), sum(estimate_tokens(chunk.content) for chunk in first[3])
+    while texts < EMBEDDING_BATCH_SIZE and tokens < EMBEDDING_BATCH_TOKENS:
+        try:
+            item = files.get_nowait()
+        except queue.Empty:
+            break  # Embed what there is rather than leave the provider idle
+        if item is _DONE:
+            return batch, True
+        batch.append(item)
+        texts += len(item[3])
+        tokens += sum(estimate_tokens(chunk.content) for chunk in item[3])
+    return batch, False
+
+def _embed(files, results):
+    """Embed batches of chunked files; each becomes (filepath, content, stat, chunks, embeddings, failed).
+
+    Files whose chunks failed because the provider became unavailable are embedded again once the
+    circuit breaker lets calls through. Only chunks missing from the embedding cache reach the provider,
+    through its shared limiter (see async_embeddings.rate_limiter()), which holds all workers together
+    to EMBEDDING_MAX_IN_FLIGHT requests and the EMBEDDING_RPM / EMBEDDING_TPM quota.
+    """
+    done = False
+    while not done:
+        pending, done = _next_batch(files)
+        while pending:
+            if provider_unavailable():
+                wait = embedding_retry_in()
+                print(f"Embedding provider unavailable, pausing {wait:.0f}s before retrying {len(pending)} file(s)")
+                time.sleep(wait)
+            try:
+                embedded = embed_chunks([chunks for _, _, _, chunks in pending])
+            except Exception as e:
+                print(f"Error embedding {len(pending)} file(s): {e}")
+                break
+            retry = []
+            for item, (chunks, embeddings, failed) in zip(pending, embedded):
+                if failed and provider_unavailable():
+                    retry.append(item)
+                    continue
+                filepath, content, stat, _ = item
+                results.put((filepath, content, stat, chunks, embeddings, failed))
+            pending = retry
+
+def index_files(filepaths, readers=None, embed_workers=None, queue_size=None, commit_files=None):
+    """Index files with a pipeline of threads joined by bounded queues, and return the number indexed.
+
+    A scanner thread iterates filepaths (which may walk a directory lazily), readers threads read and
+    chunk the files, and embed_workers threads (default EMBEDDING_MAX_IN_FLIGHT) each embed one batch
+    of files at a time. The calling thread is the only writer of the index: it adds the embedded files
+    and commits every commit_files files. Every queue holds at most queue_size items, so memory stays
+    bounded however many files there are. The caller saves the index afterwards.
+    """
+    readers = max(REINDEX_READERS if readers is None else readers, 1)
+    embed_workers = REINDEX_EMBED_WORKERS if embed_workers is None else embed_workers
+    embed_workers = max(embed_workers or EMBEDDING_MAX_IN_FLIGHT, 1)
+    queue_size = REINDEX_QUEUE_SIZE if queue_size is None else queue_size
+    commit_files = REINDEX_COMMIT_FILES if commit_files is None else commit_files
+
+    paths, files, results = (queue.Queue(maxsize=queue_size) for _ in range(3))
+    threads = _start_stage(lambda _, target: _scan(filepaths, target), None, paths, 1, readers)
+    threads += _start_stage(_read, paths, files, readers, embed_workers)
+    threads += _start_stage(_embed, files, results, embed_workers, 1)
+
+    indexed = uncommitted = 0
+    for filepath, content, stat, chunks, embeddings, failed in _items(results):
+        if failed:
+            print(f"Failed to generate embeddings for {failed} chunk(s) of {filepath}")
+        if not chunks:
+            if not failed:  # Nothing to embed; recorded so it is not read again on the next start
+                remove_from_index(filepath, content, stat)
+            continue
+        try:
+            # Files with chunks that failed are left out of the file manifest, so the next start retries them
+            add_to_index(embeddings, content, os.path.basename(filepath), filepath, chunks=chunks,
+                         file_stat=None if failed else stat)
+            indexed += 1
+            uncommitted += 1
+        except Exception as e:
+            print(f"Error processing file {filepath}: {e}")
+        if commit_files and uncommitted >= commit_files:
+            commit_index()
+            uncommitted = 0
+    for thread in threads:
+        thread.join()
+    return indexed
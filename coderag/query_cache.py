@@ -0,0 +1,69 @@
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from coderag.config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL
+
+def normalize_query(query):
+    """Key of a query: Unicode NFC form with runs of whitespace collapsed and the ends stripped."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", query)).strip()
+
+class QueryCache:
+    """Bounded in-memory LRU map from query key to embedding, with entries expiring after ttl seconds.
+
+    It is shared by all threads (Streamlit sessions) of the serving process. Cached embeddings are
+    read-only arrays, so callers cannot modify the shared copy.
+    """
+
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, embedding), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, embedding):
+        embedding = embedding.copy()
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl if self.ttl > 0 else float("inf"), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl,
+                    "hits": self.hits, "misses": self.misses, "expired": self.expired,
+                    "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL) if QUERY_CACHE_SIZE > 0 else None
+
+def query_cache():
+    """Query embedding cache of the process, or None when QUERY_CACHE_SIZE is 0."""
+    return _cache
@@ -0,0 +1,138 @@
+import faiss
+import numpy as np
+from coderag.config import FAISS_PQ_M
+
+REDUCTION_METHODS = ("none", "truncate", "pca", "opq")
+OPQ_MIN_TRAINING_VECTORS = 256 * 39  # OPQ trains a PQ with 2^8 centroids per sub-quantizer
+RECALL_QUERIES = 200
+RECALL_K = 10
+
+class Reducer:
+    """Maps embeddings of input_dim dimensions to dim dimensions before they are indexed or searched.
+
+    "truncate" keeps the first dim components and scales them back to the norm of the full vector,
+    which suits Matryoshka-trained models whose leading dimensions carry most of the information.
+    "pca" projects onto the dim principal components of the indexed vectors, and "opq" learns a
+    rotation that also balances their variance over FAISS_PQ_M sub-vectors for product quantization;
+    both are FAISS VectorTransforms trained once on a sample. recall is the recall@RECALL_K against
+    the full embeddings measured when the reduction was trained, if it was.
+    """
+
+    def __init__(self, method, input_dim, dim, transform=None):
+        if method not in REDUCTION_METHODS[1:]:
+            raise ValueError(f"Unknown embedding reduction '{method}', expected one of {REDUCTION_METHODS}")
+        if not 0 < dim < input_dim:
+            raise ValueError(f"Reduced dimension {dim} must be between 0 and the embedding dimension {input_dim}")
+        if method == "opq" and dim % FAISS_PQ_M != 0:
+            raise ValueError(f"Reduced dimension {dim} is not divisible by FAISS_PQ_M={FAISS_PQ_M}")
+        self.method = method
+        self.input_dim = input_dim
+        self.dim = dim
+        self.transform = transform if transform is not None else self._new_transform()
+        self.recall = None
+
+    def _new_transform(self):
+        if self.method == "pca":
+            return faiss.PCAMatrix(self.input_dim, self.dim)
+        if self.method == "opq":
+            return faiss.OPQMatrix(self.input_dim, FAISS_PQ_M, self.dim)
+        return None
+
+    @property
+    def is_trained(self):
+        return self.transform is None or self.transform.is_trained
+
+    @property
+    def min_training_vectors(self):
+        """Vectors needed before the reduction can be trained reliably."""
+        if self.method == "opq":
+            return max(OPQ_MIN_TRAINING_VECTORS, self.input_dim)
+        return self.dim if self.method == "pca" else 0
+
+    def train(self, vectors):
+        if self.transform is not None and not self.transform.is_trained:
+            self.transform.train(np.ascontiguousarray(vectors, dtype=np.float32))
+
+    def apply(self, vectors):
+        """Reduce a (n, input_dim) array of embeddings to a (n, dim) float32 array."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.shape[1] != self.input_dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the reduction's input dimension {self.input_dim}")
+        if self.transform is not None:
+            return self.transform.apply(vectors)
+        reduced = np.array(vectors[:, :self.dim])  # A copy, even when the slice is contiguous
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        reduced *= np.linalg.norm(vectors, axis=1, keepdims=True) / np.where(norms > 0, norms, 1)
+        return reduced
+
+    def info(self):
+        """Description stored in the index manifest."""
+        return {"method": self.method, "input_dim": self.input_dim, "dim": self.dim, "recall": self.recall}
+
+    def save(self, path):
+        """Write the trained transform, if the method has one; returns whether a file was written."""
+        if self.transform is None:
+            return False
+        faiss.write_VectorTransform(self.transform, path)
+        return True
+
+    @classmethod
+    def load(cls, info):
+        """Reducer described by a manifest entry written from info(), with "file" naming its transform."""
+        transform = faiss.read_VectorTransform(info["file"]) if info.get("file") else None
+        reducer = cls(info["method"], info["input_dim"], info["dim"], transform)
+        reducer.recall = info.get("recall")
+        return reducer
+
+def configured_reducer(method, input_dim, dim):
+    """Untrained Reducer for the configured method, or None for "none"."""
+    if method == "none":
+        return None
+    return Reducer(method, input_dim, dim)
+
+def reduction_recall(reducer, vectors, n_queries=RECALL_QUERIES, k=RECALL_K):
+    """Recall@k of exact search over reduced vectors, against exact search over the full vectors.
+
+    n_queries of the vectors are held out as queries and searched among the others.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_queries = min(n_queries, len(vectors) // 2)
+    if n_queries == 0:
+        return None
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[np.random.default_rng(0).choice(len(vectors), n_queries, replace=False)] = True
+    base, queries = vectors[~held_out], vectors[held_out]
+    k = min(k, len(base))
+
+    def search(base, queries):
+        exact = faiss.IndexFlatL2(base.shape[1])
+        exact.add(base)
+        return exact.search(queries, k)[1]
+
+    truth = search(base, queries)
+    found = search(reducer.apply(base), reducer.apply(queries))
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+def reduction_report(vectors, dims, methods=("truncate", "pca"), train_sample=100000):
+    """Compare bytes per stored vector and recall@RECALL_K of reductions of the given vectors.
+
+    Returns one dict per method and dimension, after a row for the full vectors; reductions needing
+    more training vectors than given are left out.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    input_dim = vectors.shape[1]
+    sample = vectors
+    if len(vectors) > train_sample:
+        sample = vectors[np.random.default_rng(1234).choice(len(vectors), train_sample, replace=False)]
+    report = [{"method": "none", "dim": input_dim, "bytes_per_vector": 4 * input_dim, "recall": 1.0}]
+    for method in methods:
+        for dim in dims:
+            if dim >= input_dim:
+                continue
+            reducer = Reducer(method, input_dim, dim)
+            if len(sample) < reducer.min_training_vectors:
+                continue
+            reducer.train(sample)
+            report.append({"method": method, "dim": dim, "bytes_per_vector": 4 * dim,
+                           "recall": reduction_recall(reducer, vectors)})
+    return report
@@ -0,0 +1,170 @@
+import time
+import random
+import threading
+from coderag.config import (
+    PROVIDER_RETRIES,
+    PROVIDER_RETRY_BASE,
+    PROVIDER_RETRY_MAX,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT
+)
+
+class CircuitOpenError(Exception):
+    """A call was refused without trying because its circuit breaker is open."""
+
+    def __init__(self, breaker):
+        super().__init__(f"{breaker.name} provider is unavailable, retrying in {breaker.retry_in():.0f}s")
+        self.breaker = breaker
+
+class RateLimitedError(Exception):
+    """The provider rejected a request with HTTP 429; retry_after is its hint in seconds, if any."""
+
+    def __init__(self, retry_after=None, message="rate limited"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Fails calls fast after failure_threshold consecutive failures of an unavailable provider.
+
+    Once open, calls are refused for reset_timeout seconds. Then a single trial call is let through
+    ("half-open"): its success closes the breaker, its failure opens it for another reset_timeout.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False  # A half-open trial call is in progress
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """Whether calls are currently refused."""
+        with self._lock:
+            return self.opened_at is not None and (self._trial or self.clock() < self.opened_at + self.reset_timeout)
+
+    def retry_in(self):
+        """Seconds until the next call is let through (0 when closed)."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(self.opened_at + self.reset_timeout - self.clock(), 0.0)
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or self.clock() < self.opened_at + self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_rate_limited(self):
+        """A 429 answer: the provider is up but busy, so failures keep their count and a trial call succeeds."""
+        with self._lock:
+            if self._trial:
+                self.opened_at = None
+                self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial:
+                    print(f"{self.name} provider failed {self.failures} time(s) in a row, pausing calls "
+                          f"for {self.reset_timeout:.0f}s")
+                self.opened_at = self.clock()
+                self._trial = False
+
+TRANSIENT_STATUS_CODES = (429, 502, 503, 504)
+
+_lock = threading.Lock()
+_breakers = {}
+
+def circuit_breaker(name):
+    """Shared breaker of the process for a kind of provider call ("embeddings" or "generation")."""
+    with _lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+def is_transient_error(error):
+    """Whether a failed call may succeed when retried: connection problems, timeouts, 429 and 502/503/504.
+
+    A plain 500 is not retried, since Ollama also answers it for inputs it cannot handle.
+    """
+    import requests
+    if isinstance(error, (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status in TRANSIENT_STATUS_CODES:
+        return True
+    try:
+        import openai
+        if isinstance(error, openai.APIConnectionError):  # Includes timeouts
+            return True
+    except ImportError:
+        pass
+    try:
+        import httpx
+        if isinstance(error, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    return False
+
+def is_rate_limited(error):
+    """Whether the provider answered a call with 429 (RateLimitedError, or an HTTP error of status 429)."""
+    if isinstance(error, RateLimitedError):
+        return True
+    response = getattr(error, "response", None)
+    return (getattr(error, "status_code", None) or getattr(response, "status_code", None)) == 429
+
+def backoff_delay(attempt, base=PROVIDER_RETRY_BASE, maximum=PROVIDER_RETRY_MAX):
+    """Seconds to wait before retry number attempt + 1: exponential, with full jitter."""
+    return random.uniform(0, min(base * 2 ** attempt, maximum))
+
+def call_with_retries(call, breaker, retries=None):
+    """Run call(), retrying transient errors with jittered backoff while the breaker lets calls through.
+
+    Errors that are not transient (e.g. a rejected request) are raised at once and do not count as
+    provider failures, and neither do 429s. A RateLimitedError is raised at once: a rate limiter (see
+    async_embeddings.Limiter) already retried the call. Raises CircuitOpenError when the breaker is open.
+    """
+    retries = PROVIDER_RETRIES if retries is None else retries
+    last_error = None
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            if last_error is not None:  # The breaker opened while retrying
+                raise last_error
+            raise CircuitOpenError(breaker)
+        try:
+            result = call()
+        except Exception as e:
+            if is_rate_limited(e):
+                breaker.record_rate_limited()
+                if isinstance(e, RateLimitedError):
+                    raise
+            elif not is_transient_error(e):
+                breaker.record_success()  # The provider answered
+                raise
+            else:
+                breaker.record_failure()
+            if attempt == retries:
+                raise
+            last_error = e
+            time.sleep(backoff_delay(attempt))
+            continue
+        breaker.record_success()
+        return result
@@ -1,11 +1,26 @@
 import numpy as np
-from coderag.index import load_index, get_metadata
+from coderag.index import current_index, get_metadata
 from coderag.embeddings import generate_embeddings
+from coderag.query_cache import query_cache, normalize_query
+
+def query_embedding_for(query):
+    """Embedding of a search query, served from the in-memory query cache when it was seen recently."""
+    cache = query_cache()
+    key = normalize_query(query)
+    if cache is not None:
+        embedding = cache.get(key)
+        if embedding is not None:
+            return embedding
+    # The normalized text is embedded, so every spelling of a key gets the same vector
+    embedding = generate_embeddings(key)
+    if embedding is not None and cache is not None:
+        cache.put(key, embedding)
+    return embedding
 
 def search_code(query, k=5):
     """Search the FAISS index using a text query."""
-    index = load_index()  # Load the FAISS index
-    query_embedding = generate_embeddings(query)  # Generate embedding for the query
+    index = current_index()  # Latest published index snapshot, reloaded only when it changed
+    query_embedding = query_embedding_for(query)
 
     if query_embedding is None:
         print("Failed to generate query embedding.")
@@ -14,16 +29,24 @@ def search_code(query, k=5):
     # Perform the search in FAISS
     distances, indices = index.search(query_embedding, k)
 
+    # Look up only the rows of the returned hits (-1 marks missing hits when fewer than k exist)
+    metadata = get_metadata([idx for idx in indices[0] if idx != -1])
+
     results = []
+    seen_ids = set()
     for i, idx in enumerate(indices[0]):  # Iterate over the search results
-        if idx < len(get_metadata()):  # Ensure the index is within bounds
-            file_data = get_metadata()[idx]
-            results.append({
-                "filename": file_data["filename"],
-                "filepath": file_data["filepath"],
-                "content": file_data["content"],
-                "distance": distances[0][i]  # Access distance using the correct index
-            })
-        else:
-            print(f"Warning: Index {idx} is out of bounds for metadata with length {len(get_metadata())}")
+        if idx == -1 or idx in seen_ids:  # Missing hit, or a stale duplicate of the same chunk
+            continue
+        seen_ids.add(idx)
+        file_data = metadata.get(int(idx))
+        if file_data is None:  # Vector of a removed file that has not been compacted away yet
+            continue
+        results.append({
+            "filename": file_data["filename"],
+            "filepath": file_data["filepath"],
+            "content": file_data["content"],
+            "start_line": file_data["start_line"],  # None for vectors of whole files
+            "end_line": file_data["end_line"],
+            "distance": distances[0][i]  # Access distance using the correct index
+        })
     return results
@@ -0,0 +1,182 @@
+import os
+import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from coderag.vector_store import exact_rerank
+from coderag.index_factory import search_params
+
+DEFAULT_SHARD = "default"
+ROOT_SHARD = "_root"  # Files directly under WATCHED_DIR when sharding by top-level directory
+
+def shard_for(relative_filepath, shard_by):
+    """Name of the shard a file belongs to.
+
+    shard_by is "none" (a single shard) or "top_dir" (one shard per top-level directory of WATCHED_DIR,
+    e.g. one per repository when several repositories are checked out below it).
+    """
+    if shard_by == "none":
+        return DEFAULT_SHARD
+    if shard_by == "top_dir":
+        parts = relative_filepath.replace(os.sep, "/").split("/")
+        return parts[0] if len(parts) > 1 else ROOT_SHARD
+    raise ValueError(f"Unknown INDEX_SHARD_BY value '{shard_by}', expected 'none' or 'top_dir'")
+
+def shard_file(index_file, shard):
+    """Path of the FAISS file of a shard; the default shard keeps the configured FAISS_INDEX_FILE."""
+    if shard == DEFAULT_SHARD:
+        return index_file
+    slug = re.sub(r"[^A-Za-z0-9_.-]", "_", shard)
+    digest = hashlib.sha1(shard.encode("utf-8")).hexdigest()[:8]  # Keeps sanitized names unique
+    stem, ext = os.path.splitext(index_file)
+    return f"{stem}.shard-{slug}-{digest}{ext}"
+
+def _merge_range(ranges, start, end):
+    """Union of sorted, disjoint [start, end) ranges with one more range."""
+    merged = []
+    for range_start, range_end in ranges:
+        if range_end < start or range_start > end:
+            merged.append((range_start, range_end))
+        else:
+            start, end = min(start, range_start), max(end, range_end)
+    merged.append((start, end))
+    return sorted(merged)
+
+class LogOverlay:
+    """Changes from the write-ahead log on top of a read-only snapshot generation.
+
+    Vectors added since the snapshot are searched exactly in memory, and the snapshot's vectors with
+    ids in a range removed since then are hidden. Updates go to a copy (see updated()), so queries
+    keep searching a consistent overlay while the next one is built. lsn is the last record applied.
+    """
+
+    def __init__(self, dim, lsn, base_ids):
+        self.dim = dim
+        self.lsn = lsn
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+        self.removed = []  # Sorted, disjoint [start, end) id ranges removed since the snapshot
+        self.hidden = 0  # Distinct snapshot vectors hidden by the removed ranges
+        self._base_ids = base_ids  # Sorted ids of the snapshot, or a function returning them when first needed
+
+    def _snapshot_ids(self):
+        if callable(self._base_ids):
+            self._base_ids = self._base_ids()
+        return self._base_ids
+
+    def updated(self, records):
+        """Copy of the overlay with the (lsn, op, args) records of coderag.wal applied."""
+        from coderag.wal import OP_ADD, OP_REMOVE_RANGE
+        overlay = LogOverlay(self.dim, self.lsn, self._base_ids)
+        overlay.index = faiss.clone_index(self.index)
+        overlay.removed = list(self.removed)
+        overlay.hidden = self.hidden
+        for lsn, op, args in records:
+            if op == OP_ADD:
+                _, ids, vectors = args
+                overlay.index.add_with_ids(np.ascontiguousarray(vectors), np.ascontiguousarray(ids))
+            elif op == OP_REMOVE_RANGE:
+                _, start, end = args
+                overlay.index.remove_ids(faiss.IDSelectorRange(start, end))
+                overlay.removed = _merge_range(overlay.removed, start, end)
+            overlay.lsn = lsn
+        # A file saved again removes the same range again; its snapshot vectors are hidden only once
+        if overlay.removed:
+            base_ids = overlay._snapshot_ids()
+            overlay.hidden = sum(int(np.searchsorted(base_ids, end) - np.searchsorted(base_ids, start))
+                                 for start, end in overlay.removed)
+        return overlay
+
+    def hides(self, ids):
+        """Mask of the snapshot ids that were removed since the snapshot."""
+        hidden = np.zeros(ids.shape, dtype=bool)
+        for start, end in self.removed:
+            hidden |= (ids >= start) & (ids < end)
+        return hidden
+
+    def merge(self, x, k, distances, ids):
+        """Combine snapshot results (searched with k + self.hidden) with the overlay's into the top k."""
+        hidden = self.hides(ids)
+        distances, ids = distances.copy(), ids.copy()
+        distances[hidden | (ids == -1)], ids[hidden] = np.inf, -1
+        if self.index.ntotal:
+            added_distances, added_ids = self.index.search(x, k)
+            distances, ids = np.hstack([distances, added_distances]), np.hstack([ids, added_ids])
+            distances[ids == -1] = np.inf
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+class ShardedIndex:
+    """Read-only view over the shard indexes that searches them concurrently and merges the results.
+
+    FAISS releases the GIL during search, so a thread pool scans the shards in parallel. Each shard
+    returns its own top-k, and the merged top-k is taken by ascending L2 distance. Shards with a
+    full-precision vector store return rerank_factor * k candidates that are re-ranked exactly first;
+    shards with a binary prefilter take prefilter_candidates candidates from it instead.
+    Queries of full embeddings are reduced with reducer (see coderag.reduction) when the shards hold
+    reduced vectors. overlay, if set, is a LogOverlay of changes made since the shards were written.
+    """
+
+    def __init__(self, shards, dim, max_workers=None, vector_stores=None, rerank_factor=0,
+                 binary_prefilters=None, prefilter_candidates=0, reducer=None):
+        self.shards = shards  # Shared with the index module, which adds and replaces shards
+        self.vector_stores = vector_stores if vector_stores is not None else {}
+        self.rerank_factor = rerank_factor
+        self.binary_prefilters = binary_prefilters if binary_prefilters is not None else {}
+        self.prefilter_candidates = prefilter_candidates
+        self.dim = dim
+        self.reducer = reducer
+        self.overlay = None
+        self.shard_types = {}  # Shard name -> index type, for reports
+        self.memory_mapped = False
+        self._max_workers = max_workers
+        self._executor = None
+
+    @property
+    def d(self):
+        for shard in self.shards.values():
+            return shard.d
+        return self.dim
+
+    @property
+    def ntotal(self):
+        return sum(shard.ntotal for shard in self.shards.values())
+
+    def _search_shard(self, name, x, k):
+        shard = self.shards[name]
+        store = self.vector_stores.get(name)
+        prefilter = self.binary_prefilters.get(name)
+        if store is not None and prefilter is not None:
+            candidates = prefilter.search(x, max(self.prefilter_candidates, k * max(self.rerank_factor, 1)))
+            return exact_rerank(x, candidates, store, k)
+        params = search_params(shard)
+        if store is None or self.rerank_factor <= 0:
+            return shard.search(x, k, params=params)
+        _, candidates = shard.search(x, k * self.rerank_factor, params=params)
+        return exact_rerank(x, candidates, store, k)
+
+    def search(self, x, k):
+        reducer = self.reducer
+        if reducer is not None and x.shape[1] == reducer.input_dim and self.d == reducer.dim:
+            x = reducer.apply(x)
+        overlay = self.overlay  # Replaced, never modified, while queries run
+        if overlay is None or not (overlay.removed or overlay.index.ntotal):
+            return self._search_shards(x, k)
+        distances, ids = self._search_shards(x, k + overlay.hidden)
+        return overlay.merge(x, k, distances, ids)
+
+    def _search_shards(self, x, k):
+        names = list(self.shards)
+        if len(names) == 1:
+            return self._search_shard(names[0], x, k)
+        if not names:
+            return np.full((len(x), k), np.inf, dtype=np.float32), np.full((len(x), k), -1, dtype=np.int64)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="shard-search")
+        results = list(self._executor.map(lambda name: self._search_shard(name, x, k), names))
+        distances = np.hstack([d for d, _ in results])
+        ids = np.hstack([i for _, i in results])
+        distances[ids == -1] = np.inf  # Missing hits of small shards sort last
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow is only needed for the Arrow and Parquet formats
+    pyarrow = None
+
+VECTOR_FORMATS = {".npy": "npy", ".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+
+def vector_format(path):
+    """File format of a vector export, chosen by the file extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in VECTOR_FORMATS:
+        raise ValueError(f"Unsupported vector file extension '{ext}', expected one of {sorted(VECTOR_FORMATS)}")
+    fmt = VECTOR_FORMATS[ext]
+    if fmt != "npy" and pyarrow is None:
+        raise RuntimeError(f"Writing and reading {fmt} vector files requires the 'pyarrow' package.")
+    return fmt
+
+def ids_file(path):
+    """Path of the id array written next to a .npy vector file."""
+    return os.path.splitext(path)[0] + ".ids.npy"
+
+def _schema(dim):
+    return pyarrow.schema([("id", pyarrow.int64()), ("vector", pyarrow.list_(pyarrow.float32(), dim))])
+
+def _record_batch(ids, vectors, dim):
+    # Both columns wrap the NumPy buffers without copying them
+    vector_column = pyarrow.FixedSizeListArray.from_arrays(pyarrow.array(vectors.reshape(-1)), dim)
+    return pyarrow.RecordBatch.from_arrays([pyarrow.array(ids), vector_column], schema=_schema(dim))
+
+def write_vectors(path, batches, n, dim):
+    """Write n vectors and their ids, given as an iterable of (ids, vectors) batches.
+
+    .npy files are written through a memory map (ids go to a separate .ids.npy file); Parquet and
+    Arrow IPC files hold an "id" column and a fixed-size list "vector" column. Batches are written as
+    they come, so an export never holds more than one batch in memory.
+    """
+    fmt = vector_format(path)
+    if fmt == "npy":
+        vectors_out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n, dim))
+        ids_out = np.lib.format.open_memmap(ids_file(path), mode="w+", dtype=np.int64, shape=(n,))
+        row = 0
+        for ids, vectors in batches:
+            vectors_out[row:row + len(ids)] = vectors
+            ids_out[row:row + len(ids)] = ids
+            row += len(ids)
+        vectors_out.flush()
+        ids_out.flush()
+        del vectors_out, ids_out
+        return
+
+    writer = (pyarrow.parquet.ParquetWriter(path, _schema(dim)) if fmt == "parquet"
+              else pyarrow.ipc.new_file(path, _schema(dim)))
+    with writer:
+        for ids, vectors in batches:
+            if len(ids):
+                writer.write_batch(_record_batch(np.ascontiguousarray(ids, dtype=np.int64),
+                                                 np.ascontiguousarray(vectors, dtype=np.float32), dim))
+
+def read_vectors(path):
+    """Read (ids, vectors) from a file written by write_vectors().
+
+    .npy and Arrow IPC files are memory-mapped, so the returned arrays are views of the file and pages are
+    only read as they are used. Parquet files are decoded into memory.
+    """
+    fmt = vector_format(path)
+    if fmt == "npy":
+        return np.load(ids_file(path), mmap_mode="r"), np.load(path, mmap_mode="r")
+
+    if fmt == "parquet":
+        table = pyarrow.parquet.read_table(path)
+    else:
+        table = pyarrow.ipc.open_file(pyarrow.memory_map(path, "r")).read_all()
+    dim = table.schema.field("vector").type.list_size
+    if table.num_rows == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, dim), dtype=np.float32)
+    # A single record batch converts without copying; several are concatenated once
+    vectors = table.column("vector").combine_chunks().flatten().to_numpy(zero_copy_only=False).reshape(-1, dim)
+    ids = table.column("id").combine_chunks().to_numpy(zero_copy_only=False)
+    return ids, vectors
@@ -0,0 +1,203 @@
+import os
+import glob
+import numpy as np
+
+def _generation_base(base_path, generation):
+    """Base path of the files of a store generation; generation 0 keeps the names of earlier versions."""
+    return base_path if generation == 0 else f"{base_path}.g{generation}"
+
+def _read_generation(pointer_path):
+    try:
+        with open(pointer_path) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+def vector_store_exists(base_path):
+    """Whether a vector store was written at base_path."""
+    return os.path.exists(_generation_base(base_path, _read_generation(base_path + ".vector_generation")) + ".vectors")
+
+class VectorStore:
+    """Append-only on-disk store of full-precision float32 vectors, read through np.memmap.
+
+    Quantized indexes keep only compact codes in RAM; this store keeps the exact vectors on disk so the
+    best candidates can be re-ranked exactly. Rows are appended to `<base>.vectors` with their ids in
+    `<base>.vector_ids`. When an id is written more than once the latest row wins; rows of removed ids
+    are never looked up (candidates come from the index) and disappear on rewrite().
+
+    rewrite() writes a new generation of both files and switches `<base>.vector_generation` to it, so
+    a process that opened the store keeps reading the id and vector files of the same generation.
+    """
+
+    def __init__(self, base_path, dim, read_only=False):
+        self.base_path = base_path
+        self.pointer_path = base_path + ".vector_generation"
+        self.dim = dim
+        self.read_only = read_only
+        self._recent = {}  # id -> row for rows appended since the sorted lookup was built
+        self._vectors = None
+        self._open()
+
+    def _open(self):
+        for _ in range(3):
+            self.generation = _read_generation(self.pointer_path)
+            base = _generation_base(self.base_path, self.generation)
+            self.vectors_path, self.ids_path = base + ".vectors", base + ".vector_ids"
+            try:
+                self._load_lookup()
+                return
+            except FileNotFoundError:  # Rewritten by another process in the meantime
+                continue
+        self._load_lookup()
+
+    def _load_lookup(self):
+        if os.path.exists(self.ids_path):
+            ids = np.fromfile(self.ids_path, dtype=np.int64)
+        elif self.generation:
+            raise FileNotFoundError(self.ids_path)
+        else:
+            ids = np.zeros(0, np.int64)
+        self._rows = len(ids)
+        # Sort ids keeping the last row of each id, so lookups are a binary search
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+        last = np.append(sorted_ids[1:] != sorted_ids[:-1], True) if len(ids) else np.zeros(0, bool)
+        self._sorted_ids, self._sorted_rows = sorted_ids[last], order[last]
+        self._recent = {}
+        self._vectors = None
+        if self._rows:
+            # Mapped now, so the rows read above stay paired with this file even if the store is rewritten
+            self._matrix()
+
+    def add(self, ids, vectors):
+        """Append vectors for the given ids."""
+        if self.read_only:
+            raise RuntimeError("The vector store was opened read-only.")
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self.ids_path, "ab") as f:
+            f.write(ids.tobytes())
+        for row, vid in enumerate(ids, start=self._rows):
+            self._recent[int(vid)] = row
+        self._rows += len(ids)
+
+    def add_missing(self, ids, vectors):
+        """Append only the vectors that are not already the stored row of their id; returns how many were appended.
+
+        Replaying the write-ahead log re-applies additions whose rows usually reached the store before,
+        so appending them again would grow the files on every load.
+        """
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        missing = ~(self.get(ids) == vectors).all(axis=1)
+        if missing.any():
+            self.add(ids[missing], vectors[missing])
+        return int(missing.sum())
+
+    def get(self, ids):
+        """Return the stored vectors for the given ids as a (len(ids), dim) array; missing ids are NaN."""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        self._merge_recent()
+        if len(self._sorted_ids):
+            positions = np.clip(np.searchsorted(self._sorted_ids, ids), 0, len(self._sorted_ids) - 1)
+            found = self._sorted_ids[positions] == ids
+            rows[found] = self._sorted_rows[positions[found]]
+
+        result = np.full((len(ids), self.dim), np.nan, dtype=np.float32)
+        if (rows >= 0).any():
+            matrix = self._matrix()
+            result[rows >= 0] = matrix[rows[rows >= 0]]
+        return result
+
+    def _merge_recent(self):
+        """Fold rows appended since the last lookup into the sorted id arrays, so lookups stay vectorized."""
+        if not self._recent:
+            return
+        recent_ids = np.fromiter(self._recent.keys(), dtype=np.int64, count=len(self._recent))
+        recent_rows = np.fromiter(self._recent.values(), dtype=np.int64, count=len(self._recent))
+        keep = ~np.isin(self._sorted_ids, recent_ids)
+        ids = np.concatenate([self._sorted_ids[keep], recent_ids])
+        rows = np.concatenate([self._sorted_rows[keep], recent_rows])
+        order = np.argsort(ids)
+        self._sorted_ids, self._sorted_rows = ids[order], rows[order]
+        self._recent = {}
+
+    def _matrix(self):
+        """Memory-map the vector file, remapping it when rows were appended since the last mapping."""
+        if self._vectors is None or len(self._vectors) < self._rows:
+            # Only the rows whose ids are known; vectors are appended before their ids
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._vectors
+
+    def flush(self):
+        """Force appended rows to stable storage."""
+        for path in (self.vectors_path, self.ids_path):
+            if os.path.exists(path):
+                with open(path, "rb+") as f:
+                    os.fsync(f.fileno())
+
+    def rewrite(self, ids, vectors):
+        """Replace the store contents with exactly the given vectors (used by compaction).
+
+        The vectors go to the files of a new generation, which the pointer file switches to once they are
+        complete; the files of the previous generation are deleted afterwards. Processes that opened the
+        previous generation keep their mappings of it.
+        """
+        old_paths = (self.vectors_path, self.ids_path)
+        self.generation = max(self.generation, _read_generation(self.pointer_path)) + 1
+        base = _generation_base(self.base_path, self.generation)
+        self.vectors_path, self.ids_path = base + ".vectors", base + ".vector_ids"
+        for path, data in ((self.vectors_path, np.ascontiguousarray(vectors, dtype=np.float32)),
+                           (self.ids_path, np.ascontiguousarray(ids, dtype=np.int64))):
+            with open(path, "wb") as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        with open(self.pointer_path + ".tmp", "w") as f:
+            f.write(str(self.generation))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.pointer_path + ".tmp", self.pointer_path)
+        for path in old_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self._load_lookup()
+
+    def nbytes(self):
+        """Size of the store on disk."""
+        return sum(os.path.getsize(p) for p in (self.vectors_path, self.ids_path) if os.path.exists(p))
+
+def remove_vector_store_files(base_path):
+    """Delete the files of a vector store, of every generation; returns the paths that were removed."""
+    removed = []
+    paths = [base_path + suffix for suffix in (".vectors", ".vector_ids", ".vector_generation")]
+    paths += sorted(glob.glob(glob.escape(base_path) + ".g*.vector*"))
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+def exact_rerank(queries, candidate_ids, store, k):
+    """Re-rank ANN candidates by exact L2 distance to their full-precision vectors.
+
+    candidate_ids is an (nq, k') array as returned by a FAISS search (-1 for missing hits). Returns
+    (distances, ids) of shape (nq, k).
+    """
+    nq = len(queries)
+    distances = np.full((nq, k), np.inf, dtype=np.float32)
+    ids = np.full((nq, k), -1, dtype=np.int64)
+    for q in range(nq):
+        # Indexes that cannot remove vectors may return an id more than once
+        candidates = np.unique(candidate_ids[q][candidate_ids[q] != -1])
+        if not len(candidates):
+            continue
+        exact = ((store.get(candidates) - queries[q]) ** 2).sum(axis=1)
+        exact[np.isnan(exact)] = np.inf  # Candidates without a stored vector sort last
+        order = np.argsort(exact, kind="stable")[:k]
+        distances[q, :len(order)] = exact[order]
+        ids[q, :len(order)] = candidates[order]
+    return distances, ids
@@ -0,0 +1,113 @@
+import os
+import zlib
+import struct
+import threading
+import numpy as np
+
+# Record header: body length, CRC32 of the body, log sequence number (LSN)
+HEADER = struct.Struct("<IIQ")
+OP_ADD = 1
+OP_REMOVE_RANGE = 2
+
+class WriteAheadLog:
+    """Append-only log of index mutations since the last snapshot.
+
+    Each record is self-delimiting and checksummed, so a record torn by a crash is detected and dropped
+    on the next open. Records carry increasing sequence numbers; the snapshot stores the last one it
+    contains, which makes replaying a log that was not truncated after a snapshot harmless.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self.last_lsn = 0
+        valid_size = 0
+        for lsn, _, _, end in _scan(path):
+            self.last_lsn, valid_size = lsn, end
+        if os.path.exists(path) and os.path.getsize(path) > valid_size:
+            print(f"Discarding {os.path.getsize(path) - valid_size} bytes of incomplete records from {path}")
+            with open(path, "rb+") as f:
+                f.truncate(valid_size)
+        self._file = open(path, "ab")
+
+    def append_add(self, shard, ids, vectors):
+        """Log the addition of vectors under the given ids to a shard; returns the record's LSN."""
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        body = _encode_shard(OP_ADD, shard) + struct.pack("<II", *vectors.shape) + ids.tobytes() + vectors.tobytes()
+        return self._append(body)
+
+    def append_remove_range(self, shard, start, end):
+        """Log the removal of ids in [start, end) from a shard; returns the record's LSN."""
+        return self._append(_encode_shard(OP_REMOVE_RANGE, shard) + struct.pack("<qq", start, end))
+
+    def _append(self, body):
+        with self._lock:
+            self.last_lsn += 1
+            self._file.write(HEADER.pack(len(body), zlib.crc32(body), self.last_lsn) + body)
+            return self.last_lsn
+
+    def sync(self):
+        """Flush appended records to the OS and, if configured, to stable storage."""
+        with self._lock:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def reset(self, last_lsn=None):
+        """Truncate the log once its records are folded into a snapshot; numbering continues."""
+        with self._lock:
+            self._file.truncate(0)
+            self._file.seek(0)
+            if last_lsn is not None:
+                self.last_lsn = max(self.last_lsn, last_lsn)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def read_records(path, after_lsn=0):
+    """Yield (lsn, op, args) for the complete records of a log with an LSN greater than after_lsn.
+
+    Only reads the file, so query processes can replay the log while the indexer appends to it.
+    """
+    for lsn, op, args, _ in _scan(path):
+        if lsn > after_lsn:
+            yield lsn, op, args
+
+def _scan(path):
+    """Yield (lsn, op, args, end_offset) for every complete record in the file."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        length, crc, lsn = HEADER.unpack_from(data, offset)
+        body = data[offset + HEADER.size:offset + HEADER.size + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            return  # Torn or corrupt tail, e.g. a record still being written
+        offset += HEADER.size + length
+        yield lsn, body[0], _decode_args(body), offset
+
+def _encode_shard(op, shard):
+    name = shard.encode("utf-8")
+    return struct.pack("<BH", op, len(name)) + name
+
+def _decode_args(body):
+    """Decode a record body into (shard, ids, vectors) for adds or (shard, start, end) for removals."""
+    name_length = struct.unpack_from("<H", body, 1)[0]
+    shard = body[3:3 + name_length].decode("utf-8")
+    offset = 3 + name_length
+    if body[0] == OP_ADD:
+        n, d = struct.unpack_from("<II", body, offset)
+        ids = np.frombuffer(body, dtype=np.int64, count=n, offset=offset + 8)
+        vectors = np.frombuffer(body, dtype=np.float32, count=n * d, offset=offset + 8 + 8 * n).reshape(n, d)
+        return shard, ids, vectors
+    if body[0] == OP_REMOVE_RANGE:
+        return (shard, *struct.unpack_from("<qq", body, offset))
+    raise ValueError(f"Unknown write-ahead log operation {body[0]}")
@@ -138,33 +138,6 @@ EMBEDDING_DIM={correct_dimension}
     # Reload environment variables
     load_dotenv(override=True)
 
-def clear_faiss_index():
-    """Clear the FAISS index to force recreation with correct dimension."""
-    print("\n🧹 Clearing FAISS index...")
-    
-    try:
-        import os
-        
-        # Remove FAISS index files
-        files_to_remove = [
-            "coderag_index.faiss",
-            "metadata.npy",
-            "./coderag_index.faiss",
-            "./metadata.npy"
-        ]
-        
-        for file_path in files_to_remove:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"✅ Removed: {file_path}")
-        
-        print("✅ FAISS index cleared successfully!")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error clearing FAISS index: {e}")
-        return False
-
 def main():
     """Main function to fix embedding dimension issues."""
     print("🔧 Fixing Embedding Dimension Issues")
@@ -205,8 +178,9 @@ def main():
     # Update .env file
     update_env_file(correct_dimension)
     
-    # Clear FAISS index
-    clear_faiss_index()
+    # Indexes are kept per (provider, model, dimension), so the index of the previous model stays
+    # available and the new model gets its own index on the next run of main.py
+    print("\n📦 The index of the previous model is kept; switching back to it needs no re-embedding.")
     
     print("\n" + "=" * 50)
     print("🎉 Embedding dimension issue fixed!")
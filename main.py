@@ -1,9 +1,10 @@
 import os
 import logging
+import argparse
 import atexit
 import warnings
-from coderag.index import clear_index, add_to_index, save_index
-from coderag.embeddings import generate_embeddings
+from coderag.index import clear_index, load_index, remove_from_index, diff_files, commit_index, save_index
+from coderag.pipeline import index_files
 from coderag.config import WATCHED_DIR
 from coderag.monitor import start_monitoring, should_ignore_path
 
@@ -13,10 +14,8 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Suppress transformers warnings
 warnings.filterwarnings("ignore", category=FutureWarning, module="transformers.tokenization_utils_base")
 
-def full_reindex():
-    """Perform a full reindex of the entire codebase."""
-    logging.info("Starting full reindexing of the codebase...")
-    files_processed = 0
+def _source_files():
+    """Yield the .py files of WATCHED_DIR that are not ignored."""
     for root, _, files in os.walk(WATCHED_DIR):
         if should_ignore_path(root):  # Check if the directory should be ignored
             logging.info(f"Ignoring directory: {root}")
@@ -29,29 +28,58 @@ def full_reindex():
                 continue
 
             if file.endswith(".py"):
-                logging.info(f"Processing file: {filepath}")
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        full_content = f.read()
-
-                    embeddings = generate_embeddings(full_content)  # Generate embeddings
-                    if embeddings is not None:
-                        add_to_index(embeddings, full_content, file, filepath)
-                    else:
-                        logging.warning(f"Failed to generate embeddings for {filepath}")
-                    files_processed += 1
-                except Exception as e:
-                    logging.error(f"Error processing file {filepath}: {e}")
+                yield filepath
+
+def _logged(filepaths):
+    for filepath in filepaths:
+        logging.info(f"Processing file: {filepath}")
+        yield filepath
+
+def full_reindex():
+    """Perform a full reindex of the entire codebase.
+
+    Walking, reading and chunking, embedding and adding files to the index overlap in a pipeline of
+    threads (see coderag.pipeline), so the embedding provider is kept busy while files are read.
+    """
+    logging.info("Starting full reindexing of the codebase...")
+    files_processed = index_files(_logged(_source_files()))
 
     save_index()
     logging.info(f"Full reindexing completed. {files_processed} files processed.")
 
+def incremental_reindex():
+    """Bring the saved index up to date with the codebase: embed new and changed files, drop deleted ones.
+
+    Unchanged files are recognized by the size and mtime recorded in the index's file manifest, so
+    restarting on an unchanged codebase reads no file and sends no embedding request.
+    """
+    logging.info("Comparing the codebase with the indexed files...")
+    changed, removed = diff_files(_source_files())
+    for filepath in removed:
+        logging.info(f"Removing deleted file: {filepath}")
+        remove_from_index(filepath)
+    files_processed = index_files(_logged(changed))
+
+    if changed or removed:
+        save_index()
+    else:
+        commit_index()  # Only file manifest entries of rewritten but unchanged files
+    logging.info(f"Incremental reindexing completed. {files_processed} of {len(changed)} new or changed files "
+                 f"processed, {len(removed)} deleted files removed.")
+
 def main():
-    # Completely clear the FAISS index and metadata
-    clear_index()
+    parser = argparse.ArgumentParser(description="Index WATCHED_DIR and keep the index up to date while files change.")
+    parser.add_argument("--full", action="store_true", help="Clear the index and embed every file again")
+    args = parser.parse_args()
 
-    # Perform a full reindex of the codebase
-    full_reindex()
+    if args.full:
+        # Completely clear the FAISS index and metadata, then reindex the whole codebase
+        clear_index()
+        full_reindex()
+    else:
+        # Continue from the saved index, embedding only what changed since the last run
+        load_index(mmap=False)
+        incremental_reindex()
 
     # Start monitoring the directory for changes
     start_monitoring()
@@ -1,11 +1,11 @@
 from coderag.config import (
     MODEL_PROVIDER,
-    OPENAI_API_KEY, 
     OPENAI_CHAT_MODEL,
-    OLLAMA_BASE_URL,
     OLLAMA_CHAT_MODEL
 )
 from coderag.search import search_code
+from coderag.http_clients import openai_client, ollama_post
+from coderag.resilience import call_with_retries, circuit_breaker
 
 SYSTEM_PROMPT = """
 You are an expert coding assistant. Your task is to help users with their question. Use the retrieved code context to inform your responses, but feel free to suggest better solutions if appropriate.
@@ -32,7 +32,7 @@ def execute_rag_flow(user_query):
         
         # Prepare code context
         code_context = "\n\n".join([
-            f"File: {result['filename']}\n{result['content']}"
+            f"File: {result['filename']}{_line_span(result)}\n{result['content']}"
             for result in search_results[:3]  # Limit to top 3 results
         ])
         
@@ -40,6 +40,9 @@ def execute_rag_flow(user_query):
         full_prompt = PRE_PROMPT.format(query=user_query, code_context=code_context)
         
         # Generate response using configured provider
+        if MODEL_PROVIDER.lower() == "local":
+            # The local provider only embeds; answer with the retrieved code itself
+            return f"Retrieved code (MODEL_PROVIDER=local has no chat model):\n\n{code_context}"
         if MODEL_PROVIDER.lower() == "ollama":
             response = _generate_ollama_response(full_prompt)
         else:
@@ -50,12 +53,15 @@ def execute_rag_flow(user_query):
     except Exception as e:
         return f"Error in RAG flow execution: {e}"
 
+def _line_span(result):
+    if result.get("start_line") is None:
+        return ""
+    return f" (lines {result['start_line']}-{result['end_line']})"
+
 def _generate_openai_response(full_prompt):
     """Generate response using OpenAI API."""
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        response = client.chat.completions.create(
+        response = call_with_retries(lambda: openai_client().chat.completions.create(
             model=OPENAI_CHAT_MODEL,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
@@ -63,18 +69,19 @@ def _generate_openai_response(full_prompt):
             ],
             temperature=0.3,
             max_tokens=4000
-        )
+        ), circuit_breaker("generation"))
         return response.choices[0].message.content.strip()
     except Exception as e:
         return f"Error generating OpenAI response: {e}"
 
+def _ollama_generate(payload):
+    response = ollama_post("/api/generate", payload)
+    response.raise_for_status()
+    return response.json()
+
 def _generate_ollama_response(full_prompt):
     """Generate response using Ollama API."""
     try:
-        import requests
-        import json
-        
-        url = f"{OLLAMA_BASE_URL}/api/generate"
         payload = {
             "model": OLLAMA_CHAT_MODEL,
             "prompt": f"{SYSTEM_PROMPT}\n\n{full_prompt}",
@@ -85,10 +92,7 @@ def _generate_ollama_response(full_prompt):
             }
         }
         
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
+        result = call_with_retries(lambda: _ollama_generate(payload), circuit_breaker("generation"))
         return result.get("response", "").strip()
     except Exception as e:
         return f"Error generating Ollama response: {e}"
\ No newline at end of file
@@ -0,0 +1,14 @@
+import argparse
+from coderag.index import compact_index
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove stale and duplicate vectors from the FAISS index.")
+    parser.add_argument("--shard", help="Only rebuild this shard instead of re-sharding the whole index")
+    args = parser.parse_args()
+
+    vectors_before, vectors_after = compact_index(args.shard)
+    print(f"Compacted FAISS index: {vectors_before} -> {vectors_after} vectors "
+          f"({vectors_before - vectors_after} stale or duplicate vectors removed).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import json
+import time
+import base64
+import argparse
+import numpy as np
+from coderag.embedding_decoding import decode_base64_embeddings, json_embeddings, loads_json, orjson
+from coderag.config import EMBEDDING_DIM
+
+def _best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cost of decoding embedding responses per 1k vectors.")
+    parser.add_argument("--vectors", type=int, default=1000, help="Vectors per response")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per decoder; the fastest is reported")
+    args = parser.parse_args()
+
+    vectors = np.random.default_rng(0).normal(0, 0.02, (args.vectors, args.dim)).astype(np.float32)
+    # Providers print float32 values with their shortest representation, about 10 digits
+    json_body = json.dumps({"embeddings": [[float(str(x)) for x in row] for row in vectors]}).encode()
+    encoded = [base64.b64encode(row.tobytes()).decode() for row in vectors]
+    base64_body = json.dumps({"data": [{"index": i, "embedding": e} for i, e in enumerate(encoded)]}).encode()
+
+    decoders = {
+        # What the client code did before: floats parsed into lists, then converted with np.array
+        "json lists + np.array": lambda: np.array(json.loads(json_body)["embeddings"]).astype("float32"),
+        # The OpenAI SDK's default: base64 on the wire, decoded back into lists of floats
+        "base64 -> lists + np.array": lambda: np.array(
+            [np.frombuffer(base64.b64decode(e), dtype="float32").tolist() for e in encoded]).astype("float32"),
+        f"json ({'orjson' if orjson is not None else 'json'}) + float32 buffer":
+            lambda: json_embeddings(loads_json(json_body)["embeddings"]),
+        "base64 + float32 buffer": lambda: decode_base64_embeddings(
+            [item["embedding"] for item in loads_json(base64_body)["data"]])
+    }
+    print(f"{args.vectors} vectors of dimension {args.dim}; JSON response {len(json_body) / 1e6:.1f} MB, "
+          f"base64 response {len(base64_body) / 1e6:.1f} MB")
+    for name, decode in decoders.items():
+        seconds = _best_of(args.repeat, decode)
+        print(f"{name:<34}{seconds * 1000 * 1000 / args.vectors:>10.1f} ms per 1k vectors")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import json
+import argparse
+from coderag.index import index_stats, format_stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the size, memory use and health of the FAISS index.")
+    parser.add_argument("--top", type=int, default=10, help="List the files with the most vectors")
+    parser.add_argument("--json", action="store_true", help="Print the statistics as JSON")
+    args = parser.parse_args()
+
+    stats = index_stats(top_files=args.top)
+    print(json.dumps(stats, indent=2) if args.json else format_stats(stats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+from coderag.config import FAISS_INDEX_FILE
+from coderag.namespaces import list_namespaces
+
+def main():
+    namespaces = list_namespaces(FAISS_INDEX_FILE)
+    if not namespaces:
+        print("No embedding namespaces have been saved yet.")
+    for namespace in namespaces:
+        print(f"{namespace['provider']}/{namespace['model']} (dim {namespace['dim']}): "
+              f"generation {namespace['generation']}, {namespace['manifest']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import time
+import argparse
+from coderag.local_embeddings import local_embeddings, WORKER_TEXTS
+from coderag.config import WATCHED_DIR, EMBEDDING_DIM
+
+def _read_sources(directory, limit):
+    texts = []
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if file.endswith(".py"):
+                try:
+                    with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                        texts.append(f.read())
+                except (OSError, UnicodeDecodeError):
+                    continue
+                if len(texts) >= limit:
+                    return texts
+    return texts
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput of the local feature-hashing embedder.")
+    parser.add_argument("--dir", default=WATCHED_DIR, help="Directory whose .py files are embedded")
+    parser.add_argument("--files", type=int, default=20000, help="Number of files to embed (sources are repeated)")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count() or 1],
+                        help="Process pool sizes to compare (0 = in-process)")
+    args = parser.parse_args()
+
+    sources = _read_sources(args.dir, args.files)
+    if not sources:
+        print(f"No .py files found in {args.dir}.")
+        return
+    texts = (sources * (args.files // len(sources) + 1))[:args.files]
+    megabytes = sum(len(text.encode("utf-8")) for text in texts) / 1e6
+    print(f"{len(texts)} files ({megabytes:.1f} MB, {len(sources)} distinct), dimension {args.dim}")
+    for workers in args.workers:
+        local_embeddings(texts[:2 * WORKER_TEXTS], args.dim, workers)  # Starts the pool and warms up
+        start = time.perf_counter()
+        local_embeddings(texts, args.dim, workers)
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>3} workers: {len(texts) / elapsed:>10.0f} files/s {megabytes / elapsed:>8.1f} MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import argparse
+import numpy as np
+from coderag.index import load_index, retrieve_vectors
+from coderag.index_factory import storage_report, INDEX_TYPES
+from coderag.config import FAISS_RERANK_FACTOR
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory use and recall of FAISS index types on the indexed vectors.")
+    parser.add_argument("--sample", type=int, default=20000, help="Number of indexed vectors to compare on")
+    parser.add_argument("--queries", type=int, default=200, help="Number of indexed vectors used as queries")
+    parser.add_argument("--k", type=int, default=10, help="Number of results per query")
+    parser.add_argument("--rerank-factor", type=int, default=FAISS_RERANK_FACTOR or 4,
+                        help="Candidates fetched per result before exact re-ranking")
+    parser.add_argument("--types", nargs="+", default=["flat", "fp16", "sq8"], choices=INDEX_TYPES)
+    args = parser.parse_args()
+
+    load_index()
+    vectors = retrieve_vectors(args.sample)
+    if len(vectors) == 0:
+        print("The index is empty; index some files before running the report.")
+        return
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    # Perturb the queries so they are not exact copies of indexed vectors
+    queries = queries + rng.normal(0, queries.std() * 0.1, queries.shape).astype(np.float32)
+
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries, k={args.k}, "
+          f"re-rank factor {args.rerank_factor}")
+    print(f"{'type':<8}{'bytes/vector':>14}{'recall@k':>10}{'re-ranked':>11}")
+    for row in storage_report(vectors, queries, args.k, args.rerank_factor, args.types):
+        print(f"{row['index_type']:<8}{row['bytes_per_vector']:>14.1f}{row['recall']:>10.3f}{row['recall_reranked']:>11.3f}")
+    print(f"Re-ranking reads {4 * vectors.shape[1]} bytes/vector of exact vectors from disk, not from RAM.")
+
+if __name__ == "__main__":
+    main()
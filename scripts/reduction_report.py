@@ -0,0 +1,30 @@
+import argparse
+from coderag.index import load_index, retrieve_vectors, index_stats
+from coderag.reduction import reduction_report, RECALL_K
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall of embedding reductions on the indexed vectors.")
+    parser.add_argument("--sample", type=int, default=20000, help="Number of indexed vectors to compare on")
+    parser.add_argument("--dims", nargs="+", type=int, default=[256, 384, 512, 768], help="Reduced dimensions")
+    parser.add_argument("--methods", nargs="+", default=["truncate", "pca"], choices=["truncate", "pca", "opq"])
+    args = parser.parse_args()
+
+    load_index()
+    reduction = index_stats()["reduction"]
+    if reduction is not None:
+        print(f"The index already stores vectors reduced with {reduction['method']} to {reduction['dim']} dimensions; "
+              "run the report on an index of full embeddings (EMBEDDING_REDUCTION=none).")
+        return
+    vectors = retrieve_vectors(args.sample)
+    if len(vectors) == 0:
+        print("The index is empty; index some files before running the report.")
+        return
+
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, recall@{RECALL_K} against the full vectors")
+    print(f"{'method':<10}{'dim':>6}{'bytes/vector':>14}{'recall@k':>10}{'delta':>8}")
+    for row in reduction_report(vectors, args.dims, args.methods):
+        print(f"{row['method']:<10}{row['dim']:>6}{row['bytes_per_vector']:>14}{row['recall']:>10.3f}"
+              f"{row['recall'] - 1.0:>+8.3f}")
+
+if __name__ == "__main__":
+    main()
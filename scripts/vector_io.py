@@ -0,0 +1,17 @@
+import argparse
+from coderag.index import load_index, export_vectors, import_vectors
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the indexed vectors to a file, or rebuild the index from one.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="Vector file: .npy (plus .ids.npy), .parquet or .arrow")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        load_index(mmap=False)  # Includes the changes still in the write-ahead log
+        export_vectors(args.path)
+    else:
+        import_vectors(args.path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import time
+import asyncio
+import numpy as np
+import coderag.embeddings as embeddings
+import coderag.embedding_cache as embedding_cache
+import coderag.async_embeddings as async_embeddings
+from coderag.async_embeddings import AsyncEmbedder, RateLimitedError, TokenBucket, _retry_after
+
+def _fake_embed(calls, active, rate_limit_first=0, retry_after=0.05):
+    """Coroutine embedding a text as [len(text), 1] that records batches and peak concurrency."""
+    state = {"rejected": 0}
+
+    async def embed(texts):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        try:
+            await asyncio.sleep(0.01)
+            if state["rejected"] < rate_limit_first:
+                state["rejected"] += 1
+                raise RateLimitedError(retry_after)
+            calls.append(list(texts))
+            return [[float(len(text)), 1.0] for text in texts]
+        finally:
+            active["now"] -= 1
+    return embed
+
+def test_token_bucket_spreads_requests_over_the_quota():
+    async def run():
+        bucket = TokenBucket(1200)  # 20 per second
+        await bucket.acquire(1200)  # Drains the burst
+        start = time.monotonic()
+        await bucket.acquire(4)
+        return time.monotonic() - start
+    assert 0.15 < asyncio.run(run()) < 1.0
+    asyncio.run(TokenBucket(0).acquire(10 ** 9))  # 0 disables the limit
+
+def test_token_bucket_reservations_queue_up_in_arrival_order():
+    now = [0.0]
+    bucket = TokenBucket(60, clock=lambda: now[0])
+    assert bucket.reserve(60) == 0  # A full minute's worth is available at once
+    assert bucket.reserve(1) == 1.0  # Then one per second
+    assert bucket.reserve(600) == 61.0  # More than the quota waits for a full bucket, after the earlier ones
+    now[0] = 62.0
+    assert bucket.reserve(1) == 0.0
+    assert TokenBucket(0).reserve(10 ** 9) == 0
+
+def test_in_flight_limit_and_order_are_kept():
+    calls, active = [], {"now": 0, "peak": 0}
+    batches = [[f"{'x' * i}"] for i in range(1, 13)]
+    embedder = AsyncEmbedder(_fake_embed(calls, active), max_in_flight=3, requests_per_minute=0, tokens_per_minute=0)
+    results = asyncio.run(embedder.embed_all(batches))
+    assert [r[0][0] for r in results] == list(range(1, 13))
+    assert active["peak"] == 3
+    assert len(calls) == 12
+
+def test_rate_limited_requests_back_off_and_retry():
+    calls, active = [], {"now": 0, "peak": 0}
+    embedder = AsyncEmbedder(_fake_embed(calls, active, rate_limit_first=2), max_in_flight=4,
+                             requests_per_minute=0, tokens_per_minute=0, max_retries=3)
+    start = time.monotonic()
+    results = asyncio.run(embedder.embed_all([["a"], ["bb"], ["ccc"], ["dddd"]]))
+    assert [r[0][0] for r in results] == [1, 2, 3, 4]
+    assert embedder.rate_limited == 2
+    assert time.monotonic() - start >= 0.05  # Honoured Retry-After
+
+def test_requests_that_stay_rate_limited_fail_their_texts():
+    calls, active = [], {"now": 0, "peak": 0}
+    embedder = AsyncEmbedder(_fake_embed(calls, active, rate_limit_first=10, retry_after=0.0), max_in_flight=2,
+                             requests_per_minute=0, tokens_per_minute=0, max_retries=1)
+    results = asyncio.run(embedder.embed_all([["a", "b"]]))
+    assert results == [[None, None]]  # Not split: splitting does not help against a quota
+
+def test_retry_after_headers():
+    assert _retry_after({"retry-after": "2"}) == 2.0
+    assert _retry_after({"retry-after-ms": "250"}) == 0.25
+    assert _retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+    assert _retry_after({}) is None and _retry_after({"retry-after": "soon"}) is None
+
+def test_batch_embedding_runs_requests_concurrently(monkeypatch):
+    calls, active = [], {"now": 0, "peak": 0}
+
+    def embed_batches(batches):
+        return asyncio.run(AsyncEmbedder(_fake_embed(calls, active), max_in_flight=4, requests_per_minute=0,
+                                         tokens_per_minute=0).embed_all(batches))
+
+    monkeypatch.setattr(async_embeddings, "embed_batches", embed_batches)
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_MAX_MB", 0)
+    monkeypatch.setattr(embeddings, "EMBEDDING_BATCH_SIZE", 2)
+    monkeypatch.setattr(embeddings, "EMBEDDING_MAX_IN_FLIGHT", 4)
+    texts = ["a" * i for i in range(1, 10)]
+    result, failed = embeddings.generate_embeddings_batch(texts)
+    assert failed == []
+    np.testing.assert_array_equal(result[:, 0], [len(text) for text in texts])
+    assert len(calls) == 5 and active["peak"] > 1
+
+def test_transient_failures_are_retried_until_the_breaker_opens(monkeypatch):
+    import requests
+    from coderag.resilience import CircuitBreaker
+    monkeypatch.setattr(async_embeddings, "backoff_delay", lambda attempt: 0)
+    calls = []
+
+    async def unreachable(texts):
+        calls.append(texts)
+        raise requests.ConnectionError("down")
+
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    embedder = AsyncEmbedder(unreachable, max_in_flight=1, requests_per_minute=0, tokens_per_minute=0,
+                             breaker=breaker, retries=5)
+    results = asyncio.run(embedder.embed_all([["a", "b"], ["c"]]))
+    assert results == [[None, None], [None]]
+    assert len(calls) == 3 and breaker.is_open  # The second batch failed fast
+
+def test_limiter_is_shared_across_calls_and_threads(monkeypatch):
+    import threading
+    calls, active = [], {"now": 0, "peak": 0}
+    limiter = async_embeddings.Limiter(max_in_flight=2, requests_per_minute=0, tokens_per_minute=0)
+    embed = _fake_embed(calls, active, rate_limit_first=1, retry_after=0.0)
+
+    def run(batches):
+        asyncio.run(AsyncEmbedder(embed, limiter=limiter).embed_all(batches))
+
+    threads = [threading.Thread(target=run, args=([[f"{t}{i}"] for i in range(6)],)) for t in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 18 and active["peak"] <= 2  # One in-flight limit for all event loops
+    assert limiter.rate_limited == 1
+
+    # The next call starts from the state the last one left behind
+    limiter.back_off(60.0, 0)
+    assert limiter.limit == 1 and limiter.resume_at > limiter.clock() + 59
+    monkeypatch.setattr(async_embeddings, "_limiters", {})
+    assert async_embeddings.rate_limiter("test") is async_embeddings.rate_limiter("test")
+
+def test_synchronous_requests_back_off_through_the_shared_limiter(monkeypatch):
+    from coderag.resilience import CircuitBreaker
+    limiter = async_embeddings.Limiter(max_in_flight=2, requests_per_minute=0, tokens_per_minute=0)
+    monkeypatch.setattr(async_embeddings, "_limiters", {embeddings.MODEL_PROVIDER.lower(): limiter})
+    monkeypatch.setattr(async_embeddings, "BACKOFF_BASE", 0.0)
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    monkeypatch.setattr(embeddings, "circuit_breaker", lambda name: breaker)
+    calls = []
+
+    class _Response:
+        status_code = 429
+        headers = {"retry-after": "0"}
+
+    class _HTTPError(Exception):
+        response = _Response()
+
+    def embed(texts):
+        calls.append(texts)
+        if len(calls) <= 2:
+            raise _HTTPError("HTTP 429")
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+    assert len(embeddings._embed_isolating_failures(embed, ["a", "b"])) == 2
+    assert len(calls) == 3 and limiter.rate_limited == 2 and limiter.in_flight == 0
+    assert breaker.failures == 0 and not breaker.is_open
+
+    monkeypatch.setattr(embeddings, "EMBEDDING_RATE_LIMIT_RETRIES", 1)
+    calls.clear()
+
+    def always_limited(texts):
+        calls.append(texts)
+        raise _HTTPError("HTTP 429")
+
+    assert embeddings._embed_isolating_failures(always_limited, ["a", "b"]) == [None, None]
+    assert calls == [["a", "b"]] * 2 and not breaker.is_open  # Not split, and not counted as a failure
+
+def test_embed_batches_reuses_one_client_per_provider(monkeypatch):
+    import threading
+    created, closed = [], []
+
+    class _Client:
+        def __init__(self):
+            created.append(self)
+
+        async def close(self):
+            closed.append(self)
+
+    def fake_embed(client):
+        async def embed(texts):
+            assert asyncio.get_running_loop() is async_embeddings._loop
+            return [[float(len(text)), 1.0] for text in texts]
+        return embed
+
+    monkeypatch.setattr(async_embeddings, "MODEL_PROVIDER", "openai")
+    monkeypatch.setattr(async_embeddings, "_openai_client", _Client)
+    monkeypatch.setattr(async_embeddings, "_openai_embed", fake_embed)
+    monkeypatch.setattr(async_embeddings, "_limiters", {})
+    monkeypatch.setattr(async_embeddings, "_clients", {})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(async_embeddings.embed_batches([["a"], ["bb"]])))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [[[[1.0, 1.0]], [[2.0, 1.0]]]] * 3
+    assert len(created) == 1
+
+    async_embeddings.close_clients()
+    assert closed == created and async_embeddings._loop is None
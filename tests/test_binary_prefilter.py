@@ -0,0 +1,39 @@
+import numpy as np
+import faiss
+from coderag.binary_prefilter import BinaryPrefilter, prefilter_exists, remove_prefilter_files
+
+def _clustered_vectors(n=2000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    return (centers[rng.integers(0, 20, n)] + rng.normal(scale=0.3, size=(n, dim))).astype(np.float32)
+
+def test_prefilter_candidates_contain_exact_neighbors():
+    vectors = _clustered_vectors()
+    queries = vectors[:50] + 0.05
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, 10)
+
+    for index_type in ("flat", "hnsw"):
+        for code_type in ("sign", "itq"):
+            prefilter = BinaryPrefilter(vectors.shape[1], index_type, code_type)
+            prefilter.train(vectors)
+            prefilter.add(np.arange(len(vectors)), vectors)
+            candidates = prefilter.search(queries, 200)
+            recall = np.mean([len(set(c) & set(t)) / 10 for c, t in zip(candidates, truth)])
+            assert recall > 0.9, (index_type, code_type, recall)
+
+def test_remove_range_and_persistence(tmp_path):
+    vectors = _clustered_vectors(200, 12)  # Not a multiple of 8 bits
+    prefilter = BinaryPrefilter(12, "flat", "itq")
+    prefilter.train(vectors)
+    prefilter.add(np.arange(200), vectors)
+    assert prefilter.remove_range(0, 100) == 100
+
+    base = str(tmp_path / "shard")
+    prefilter.save(base)
+    loaded = BinaryPrefilter.load(base)
+    assert loaded.ntotal == 100 and loaded.code_type == "itq"
+    assert np.array_equal(loaded.search(vectors[150:151], 1), prefilter.search(vectors[150:151], 1))
+    assert prefilter_exists(base)
+    assert len(remove_prefilter_files(base)) == 2
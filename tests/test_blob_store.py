@@ -0,0 +1,71 @@
+import os
+import coderag.blob_store as blob_store
+from coderag.blob_store import BlobStore, content_hash
+from coderag.metadata_store import MetadataStore
+
+def _open_store(tmp_path):
+    catalog = MetadataStore(str(tmp_path / "meta.sqlite"))
+    return BlobStore(str(tmp_path / "content.blobs"), catalog), catalog
+
+def test_identical_content_is_stored_once(tmp_path):
+    blobs, _ = _open_store(tmp_path)
+    first = blobs.put("def f():\n    return 1\n" * 50)
+    size = os.path.getsize(blobs.path)
+    second = blobs.put("def f():\n    return 1\n" * 50)
+    other = blobs.put("print('other')\n")
+
+    assert first == second == content_hash("def f():\n    return 1\n" * 50)
+    assert os.path.getsize(blobs.path) > size  # Only the new content was appended
+    assert blobs.get_many([other]) == {other: "print('other')\n"}
+
+def test_put_many_looks_up_a_batch_at_once(monkeypatch, tmp_path):
+    blobs, catalog = _open_store(tmp_path)
+    stored = blobs.put("x = 1\n")
+    lookups = []
+    blob_locations = catalog.blob_locations
+    monkeypatch.setattr(catalog, "blob_locations", lambda hashes: lookups.append(list(hashes)) or blob_locations(hashes))
+
+    hashes = blobs.put_many(["x = 1\n", "y = 2\n", "y = 2\n", "z = 3\n"])
+    assert hashes == [stored, content_hash("y = 2\n"), content_hash("y = 2\n"), content_hash("z = 3\n")]
+    assert len(lookups) == 1
+    monkeypatch.setattr(catalog, "blob_locations", blob_locations)
+    assert len(catalog.blob_locations(hashes)) == 3  # The repeat within the batch is written once
+    blobs.flush()
+    assert blobs.get_many(hashes[1:]) == {hashes[1]: "y = 2\n", hashes[3]: "z = 3\n"}
+
+def test_zlib_frames_without_zstandard(monkeypatch, tmp_path):
+    monkeypatch.setattr(blob_store, "zstandard", None)
+    blobs, catalog = _open_store(tmp_path)
+    digest = blobs.put("x = 1\n")
+    blobs.flush()
+    assert catalog.blob_locations([digest])[digest][3] == "zlib"
+    assert blobs.get_many([digest])[digest] == "x = 1\n"
+
+def test_compact_keeps_only_referenced_blobs(tmp_path):
+    blobs, catalog = _open_store(tmp_path)
+    kept = blobs.put("kept = True\n")
+    blobs.put("dropped = True\n" * 100)
+    catalog.upsert([(1, {"filepath": "a.py", "filename": "a.py", "content_hash": kept})])
+
+    bytes_before, bytes_after = blobs.compact()
+    assert bytes_after < bytes_before
+    assert blobs.get_many([kept]) == {kept: "kept = True\n"}
+
+def test_readers_keep_reading_while_blobs_are_compacted(tmp_path):
+    blobs, catalog = _open_store(tmp_path)
+    blobs.put("dropped = True\n" * 100)
+    kept = blobs.put("kept = True\n")
+    catalog.upsert([(1, {"filepath": "a.py", "filename": "a.py", "content_hash": kept})])
+    catalog.commit()
+    reader = BlobStore(str(tmp_path / "content.blobs"), MetadataStore(str(tmp_path / "meta.sqlite")))
+    assert reader.get_many([kept]) == {kept: "kept = True\n"}
+    old_path = blobs.path
+
+    blobs.compact()
+    assert blobs.path != old_path
+    assert reader.get_many([kept]) == {kept: "kept = True\n"}  # Old file and locations until the commit
+    catalog.commit()
+    blobs.remove_replaced()
+    assert not os.path.exists(old_path)
+    assert reader.get_many([kept]) == {kept: "kept = True\n"}
+    assert reader.path == blobs.path
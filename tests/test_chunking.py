@@ -0,0 +1,65 @@
+import textwrap
+import coderag.chunking as chunking
+from coderag.chunking import chunk_file
+
+SOURCE = textwrap.dedent('''\
+    """Module docstring."""
+    import os
+
+    LIMIT = 3
+
+
+    # Adds numbers
+    @staticmethod
+    def add(a, b):
+        return a + b
+
+
+    class Greeter:
+        """Says hello."""
+        greeting = "hello"
+
+        def greet(self, name):
+            return f"{self.greeting} {name}"
+
+        async def wait(self):
+            pass
+    ''')
+
+def _spans(chunks):
+    return [(chunk.start_line, chunk.end_line) for chunk in chunks]
+
+def test_python_files_are_split_by_definition():
+    chunks = chunk_file("example.py", SOURCE)
+    # Module statements, the function with its comment and decorator, the whole class
+    assert _spans(chunks) == [(1, 4), (7, 10), (13, 21)]
+    assert chunks[1].content.startswith("# Adds numbers\n@staticmethod\ndef add")
+    lines = SOURCE.splitlines(keepends=True)
+    for chunk in chunks:
+        assert chunk.content == "".join(lines[chunk.start_line - 1:chunk.end_line])
+
+def test_large_classes_are_split_into_header_and_methods(monkeypatch):
+    monkeypatch.setattr(chunking, "CHUNK_MAX_LINES", 5)
+    chunks = chunk_file("example.py", SOURCE)
+    assert _spans(chunks) == [(1, 4), (7, 10), (13, 15), (17, 18), (20, 21)]
+
+def test_oversized_definitions_and_other_files_use_overlapping_windows(monkeypatch):
+    monkeypatch.setattr(chunking, "CHUNK_MAX_LINES", 4)
+    monkeypatch.setattr(chunking, "CHUNK_OVERLAP_LINES", 1)
+    body = "".join(f"    x{i} = {i}\n" for i in range(8))
+    chunks = chunk_file("big.py", "def big():\n" + body)
+    assert _spans(chunks) == [(1, 4), (4, 7), (7, 9)]
+
+    text = "".join(f"line {i}\n" for i in range(10))
+    assert _spans(chunk_file("notes.md", text)) == [(1, 4), (4, 7), (7, 10)]
+    assert _spans(chunk_file("broken.py", "def (:\n" + text)) == [(1, 4), (4, 7), (7, 10), (10, 11)]
+
+def test_windows_respect_the_character_limit(monkeypatch):
+    monkeypatch.setattr(chunking, "CHUNK_MAX_CHARS", 25)
+    chunks = chunk_file("data.txt", "".join(f"{i:09d}\n" for i in range(5)))
+    assert all(len(chunk.content) <= 25 for chunk in chunks)
+    assert chunks[0].start_line == 1 and chunks[-1].end_line == 5
+
+def test_blank_files_have_no_chunks():
+    assert chunk_file("empty.py", "") == []
+    assert chunk_file("blank.py", "\n   \n") == []
@@ -0,0 +1,187 @@
+import json
+import base64
+from types import SimpleNamespace
+import pytest
+import numpy as np
+import requests
+import coderag.embeddings as embeddings
+import coderag.embedding_cache as embedding_cache
+import coderag.resilience as resilience
+import coderag.async_embeddings as async_embeddings
+from coderag.embedding_cache import EmbeddingCache
+from coderag.embedding_decoding import json_embeddings
+
+def _fake_provider(monkeypatch, fail_on=(), error=ValueError):
+    """Route requests to a fake provider that embeds a text as [len(text), 1] and records the batches."""
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        if any(text in fail_on for text in texts):
+            raise error("rejected")
+        return [[float(len(text)), 1.0] for text in texts]
+
+    monkeypatch.setattr(embeddings, "MODEL_PROVIDER", "openai")
+    monkeypatch.setattr(embeddings, "_openai_embed", embed)
+    monkeypatch.setattr(embeddings, "EMBEDDING_MAX_IN_FLIGHT", 1)  # Requests one after another
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_MAX_MB", 0)
+    monkeypatch.setattr(resilience, "PROVIDER_RETRIES", 0)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(async_embeddings, "_limiters", {})
+    return calls
+
+def test_texts_are_batched_by_count_and_token_budget(monkeypatch):
+    calls = _fake_provider(monkeypatch)
+    monkeypatch.setattr(embeddings, "EMBEDDING_BATCH_SIZE", 3)
+    monkeypatch.setattr(embeddings, "EMBEDDING_BATCH_TOKENS", 30)
+    texts = [letter * 8 for letter in "adef"] + ["b" * 200, "c"]
+
+    result, failed = embeddings.generate_embeddings_batch(texts)
+    assert failed == []
+    assert result.dtype == np.float32 and result.shape == (6, 2)
+    np.testing.assert_array_equal(result[:, 0], [len(text) for text in texts])
+    # Three short texts, then the fourth; the oversized text goes alone
+    assert [len(batch) for batch in calls] == [3, 1, 1, 1]
+
+def test_failures_are_mapped_to_their_positions(monkeypatch):
+    calls = _fake_provider(monkeypatch, fail_on={"bad"})
+    result, failed = embeddings.generate_embeddings_batch(["x", "bad", "yy", "zzz"])
+    assert failed == [1]
+    assert np.isnan(result[1]).all()
+    np.testing.assert_array_equal(result[[0, 2, 3], 0], [1, 2, 3])
+    assert calls[0] == ["x", "bad", "yy", "zzz"]  # One request, split only after it failed
+
+def test_unreachable_provider_fails_the_batch_without_splitting(monkeypatch):
+    calls = _fake_provider(monkeypatch, fail_on={"x"}, error=requests.ConnectionError)
+    _, failed = embeddings.generate_embeddings_batch(["x", "y", "z"])
+    assert failed == [0, 1, 2]
+    assert len(calls) == 1
+    assert embeddings.generate_embeddings("x") is None
+
+def test_identical_texts_are_embedded_once(monkeypatch):
+    calls = _fake_provider(monkeypatch)
+    result, failed = embeddings.generate_embeddings_batch(["x", "yy", "x"])
+    assert failed == [] and calls == [["x", "yy"]]
+    np.testing.assert_array_equal(result[:, 0], [1, 2, 1])
+
+def test_cached_embeddings_skip_the_provider(monkeypatch, tmp_path):
+    calls = _fake_provider(monkeypatch)
+    monkeypatch.setattr(embeddings, "EMBEDDING_DIM", 2)
+    monkeypatch.setattr(embedding_cache, "_cache", EmbeddingCache(str(tmp_path / "cache.sqlite"), 1 << 20))
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_MAX_MB", 1)
+
+    first, _ = embeddings.generate_embeddings_batch(["x", "yy"])
+    second, failed = embeddings.generate_embeddings_batch(["yy", "zzz", "x"])
+    assert failed == []
+    np.testing.assert_array_equal(second[[0, 2]], first[[1, 0]])
+    assert calls == [["x", "yy"], ["zzz"]]
+    stats = embedding_cache._cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (3, 2, 3)
+
+    # Another model does not see these entries
+    monkeypatch.setattr(embeddings, "OPENAI_EMBEDDING_MODEL", "other-model")
+    monkeypatch.setattr(embeddings, "embedding_model", lambda provider: "other-model")
+    embeddings.generate_embeddings_batch(["x"])
+    assert calls[-1] == ["x"]
+
+def test_only_cache_misses_are_charged_to_the_shared_quota(monkeypatch, tmp_path):
+    import threading
+    import time
+    calls = _fake_provider(monkeypatch)
+    monkeypatch.setattr(embeddings, "EMBEDDING_DIM", 2)
+    monkeypatch.setattr(embedding_cache, "_cache", EmbeddingCache(str(tmp_path / "cache.sqlite"), 1 << 20))
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_MAX_MB", 1)
+    limiter = async_embeddings.Limiter(max_in_flight=2, requests_per_minute=600, tokens_per_minute=0)
+    monkeypatch.setattr(async_embeddings, "_limiters", {"openai": limiter})
+    active = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def embed(texts):
+        with lock:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(0.01)
+        with lock:
+            active["now"] -= 1
+        calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    monkeypatch.setattr(embeddings, "_openai_embed", embed)
+    threads = [threading.Thread(target=embeddings.generate_embeddings_batch, args=([f"{t}-{i}" for i in range(3)],))
+               for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 4 and active["peak"] <= 2  # Synchronous requests of all threads share one limit
+    tokens = limiter.requests.tokens
+
+    # A fully cached run sends nothing and takes nothing from the quota
+    for t in range(4):
+        embeddings.generate_embeddings_batch([f"{t}-{i}" for i in range(3)])
+    assert len(calls) == 4 and limiter.requests.tokens >= tokens
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    vector = np.ones(4, dtype=np.float32)  # 16 bytes per entry
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_bytes=48)
+    cache.put_many("openai", "m", 4, [("a", vector), ("b", vector), ("c", vector)])
+    assert set(cache.get_many("openai", "m", 4, ["a"])) == {"a"}  # "b" is now the oldest
+    cache.put_many("openai", "m", 4, [("d", vector)])
+    assert set(cache.get_many("openai", "m", 4, ["a", "b", "c", "d"])) == {"a", "c", "d"}
+    cache.close()
+
+    reopened = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_bytes=48)
+    assert reopened.stats()["bytes"] == 48
+    np.testing.assert_array_equal(reopened.get_many("openai", "m", 4, ["a"])["a"], vector)
+
+def test_cache_counts_replaced_entries_once_and_defers_recency_updates(tmp_path):
+    import sqlite3
+    vector = np.ones(4, dtype=np.float32)
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_bytes=1 << 20)
+    cache.put_many("openai", "m", 4, [("a", vector), ("b", vector)])
+    cache.put_many("openai", "m", 4, [("a", vector * 2), ("a", vector * 3)])
+    assert cache.stats()["bytes"] == 32
+
+    observer = sqlite3.connect(str(tmp_path / "cache.sqlite"))
+    before = dict(observer.execute("SELECT hash, last_used FROM embeddings"))
+    cache.get_many("openai", "m", 4, ["b"])
+    assert dict(observer.execute("SELECT hash, last_used FROM embeddings")) == before  # Nothing committed
+    cache.close()
+    assert dict(observer.execute("SELECT hash, last_used FROM embeddings"))["b"] > before["b"]
+    observer.close()
+
+def test_file_chunks_are_embedded_together(monkeypatch):
+    calls = _fake_provider(monkeypatch, fail_on={"def bad():\n    pass\n"})
+    files = ["def ok():\n    pass\n\ndef bad():\n    pass\n", "", "x = 1\n"]
+    results = embeddings.embed_file_chunks(["a.py", "b.py", "c.py"], files)
+    assert len(calls[0]) == 3  # All chunks of all files in one request
+    (a_chunks, a_embeddings, a_failed), (b_chunks, b_embeddings, b_failed), (c_chunks, _, c_failed) = results
+    assert [c.start_line for c in a_chunks] == [1] and a_failed == 1 and a_embeddings.shape == (1, 2)
+    assert b_chunks == [] and b_embeddings is None and b_failed == 0
+    assert c_chunks[0].content == "x = 1\n" and c_failed == 0
+
+def test_openai_base64_embeddings_are_decoded_in_input_order(monkeypatch):
+    vectors = np.random.default_rng(0).random((3, 5), dtype=np.float32)
+    requests_sent = []
+
+    def create(**kwargs):
+        requests_sent.append(kwargs)
+        data = [SimpleNamespace(index=i, embedding=base64.b64encode(vectors[i].tobytes()).decode()) for i in (2, 0, 1)]
+        return SimpleNamespace(data=data)
+
+    client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    monkeypatch.setattr(embeddings, "openai_client", lambda: client)
+    decoded = embeddings._openai_embed(["a", "b", "c"])
+    assert requests_sent[0]["encoding_format"] == "base64"
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, vectors)
+
+def test_ollama_json_embeddings_are_decoded_to_float32(monkeypatch):
+    body = json.dumps({"model": "m", "embeddings": [[0.5, -1.25], [3.0, 1e-3]]}).encode()
+    response = SimpleNamespace(status_code=200, content=body, text=body.decode(), raise_for_status=lambda: None)
+    monkeypatch.setattr(embeddings, "ollama_post", lambda path, payload: response)
+    decoded = embeddings._ollama_embed(["a", "b"])
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, np.array([[0.5, -1.25], [3.0, 1e-3]], dtype=np.float32))
+    with pytest.raises(ValueError):
+        json_embeddings([[1.0, 2.0], [3.0]])
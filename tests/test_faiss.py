@@ -1,9 +1,17 @@
 import faiss
+import coderag.index as coderag_index
+import coderag.embeddings as coderag_embeddings
 from coderag.index import load_index, retrieve_vectors, inspect_metadata, add_to_index, save_index, clear_index
 from coderag.embeddings import generate_embeddings
 import os
 
-def test_faiss_index():
+def test_faiss_index(monkeypatch, tmp_path):
+    # Embed in-process with the local provider, into an index in a temporary directory
+    monkeypatch.setattr(coderag_embeddings, "MODEL_PROVIDER", "local")
+    monkeypatch.setattr(coderag_index, "MODEL_PROVIDER", "local")
+    monkeypatch.setattr(coderag_index, "FAISS_INDEX_FILE", str(tmp_path / "coderag_index.faiss"))
+    monkeypatch.setattr(coderag_index, "WATCHED_DIR", str(tmp_path))
+
     # Clear the index before testing
     clear_index()
 
@@ -12,9 +20,7 @@ def test_faiss_index():
 
     # Generate embeddings
     embeddings = generate_embeddings(example_text)
-    if embeddings is None:
-        print("Embedding generation failed.")
-        return
+    assert embeddings is not None, "Embedding generation failed."
 
     # Add to index
     add_to_index(embeddings, example_text, "test_file.py", "test_file.py")
@@ -35,4 +41,5 @@ def test_faiss_index():
     inspect_metadata(5)
 
 if __name__ == "__main__":
-    test_faiss_index()
+    import pytest
+    raise SystemExit(pytest.main([__file__]))
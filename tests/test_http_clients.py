@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+import coderag.http_clients as http_clients
+
+def test_threads_share_one_pooled_session(monkeypatch):
+    monkeypatch.setattr(http_clients, "HTTP_POOL_SIZE", 7)
+    http_clients.close_clients()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        sessions = set(map(id, pool.map(lambda _: http_clients.ollama_session(), range(32))))
+    assert len(sessions) == 1
+    adapter = http_clients.ollama_session().get_adapter("http://localhost:11434")
+    assert adapter._pool_maxsize == 7
+    http_clients.close_clients()
+
+def test_ollama_requests_use_configured_timeouts(monkeypatch):
+    sent = {}
+    monkeypatch.setattr(http_clients, "HTTP_CONNECT_TIMEOUT", 2.0)
+    monkeypatch.setattr(http_clients, "HTTP_READ_TIMEOUT", 30.0)
+    monkeypatch.setattr(http_clients, "OLLAMA_BASE_URL", "http://ollama:11434")
+    monkeypatch.setattr(http_clients.ollama_session(), "post", lambda url, **kwargs: sent.update(url=url, **kwargs))
+    http_clients.ollama_post("/api/embed", {"input": ["x"]})
+    assert sent == {"url": "http://ollama:11434/api/embed", "json": {"input": ["x"]}, "timeout": (2.0, 30.0)}
+    http_clients.close_clients()
@@ -0,0 +1,585 @@
+import os
+import json
+import pytest
+import numpy as np
+import coderag.index as coderag_index
+import coderag.index_factory as index_factory
+import coderag.namespaces as namespaces
+from coderag.index_factory import build_index, INDEX_TYPES
+from coderag.vector_io import read_vectors
+from coderag.chunking import chunk_file
+from coderag import reduction
+
+DIM = 16
+
+def _use_tmp_index(monkeypatch, tmp_path, index_type="flat"):
+    """Point the index module at a temporary directory and reset it."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(coderag_index, "FAISS_INDEX_FILE", str(tmp_path / "coderag_index.faiss"))
+    monkeypatch.setattr(coderag_index, "FAISS_INDEX_TYPE", index_type)
+    monkeypatch.setattr(coderag_index, "WATCHED_DIR", str(tmp_path))
+    monkeypatch.setattr(coderag_index, "EMBEDDING_DIM", DIM)
+    coderag_index.clear_index()
+
+def test_build_index_types(monkeypatch):
+    monkeypatch.setattr(index_factory, "FAISS_IVF_NLIST", 4)
+    monkeypatch.setattr(index_factory, "FAISS_PQ_M", 4)
+    vectors = np.random.default_rng(0).random((300, DIM), dtype=np.float32)
+    for index_type in INDEX_TYPES:
+        index = build_index(index_type, DIM)
+        index_factory.train_index(index, vectors)
+        index.add(vectors)
+        _, ids = index.search(vectors[:1], 1)
+        assert index.ntotal == len(vectors)
+        assert ids[0][0] != -1
+
+def test_ivf_index_is_trained_and_persisted(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_factory, "FAISS_IVF_NLIST", 2)
+    _use_tmp_index(monkeypatch, tmp_path, "ivf")
+    assert coderag_index.index.ntotal == 0
+
+    vectors = np.random.default_rng(1).random((100, DIM), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    assert coderag_index.shard_types == {"default": "ivf"}
+    coderag_index.save_index()
+
+    index = coderag_index.load_index()
+    assert coderag_index.shard_types == {"default": "ivf"}
+    assert index.ntotal == len(vectors)
+    # IVF indexes return vectors in inverted-list order, so compare column-wise sorted values
+    retrieved = coderag_index.retrieve_vectors(len(vectors))
+    np.testing.assert_allclose(np.sort(retrieved, axis=0), np.sort(vectors, axis=0), rtol=1e-5)
+
+def test_reindexing_a_file_replaces_its_vectors(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    rng = np.random.default_rng(2)
+    filepath = str(tmp_path / "a.py")
+
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "old", "a.py", filepath)
+    coderag_index.add_to_index(rng.random((2, DIM), dtype=np.float32), "new", "a.py", filepath)
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "other", "b.py", str(tmp_path / "b.py"))
+    assert coderag_index.index.ntotal == 3
+    assert sorted(m["content"] for m in coderag_index.get_metadata().values()) == ["new", "new", "other"]
+
+    assert coderag_index.remove_from_index(filepath) == 2
+    assert coderag_index.index.ntotal == 1
+    assert coderag_index.remove_from_index(filepath) == 0
+
+def test_chunks_keep_their_content_and_line_span(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    source = "import os\n\n\ndef f():\n    return 1\n\n\ndef g():\n    return 2\n"
+    chunks = chunk_file("a.py", source)
+    vectors = np.random.default_rng(12).random((len(chunks), DIM), dtype=np.float32)
+    coderag_index.add_to_index(vectors, source, "a.py", str(tmp_path / "a.py"), chunks=chunks)
+    coderag_index.commit_index()
+
+    metadata = coderag_index.get_metadata()
+    assert [(m["chunk"], m["start_line"], m["end_line"], m["content"]) for _, m in sorted(metadata.items())] == [
+        (0, 1, 1, "import os\n"), (1, 4, 5, "def f():\n    return 1\n"), (2, 8, 9, "def g():\n    return 2\n")
+    ]
+    with pytest.raises(ValueError):
+        coderag_index.add_to_index(vectors[:1], source, "a.py", str(tmp_path / "a.py"), chunks=chunks)
+
+def test_hnsw_search_skips_replaced_and_removed_vectors(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path, "hnsw")
+    rng = np.random.default_rng(11)
+    old, new, other = rng.random((3, DIM), dtype=np.float32)
+    coderag_index.add_to_index(old.reshape(1, -1), "old", "a.py", str(tmp_path / "a.py"))
+    coderag_index.add_to_index(other.reshape(1, -1), "b", "b.py", str(tmp_path / "b.py"))
+    coderag_index.add_to_index(new.reshape(1, -1), "new", "a.py", str(tmp_path / "a.py"))
+    coderag_index.remove_from_index(str(tmp_path / "b.py"))
+
+    distances, ids = coderag_index.index.search(old.reshape(1, -1), 3)
+    assert list(ids[0]) == [coderag_index.vector_id("a.py"), -1, -1]  # One live copy, none of b.py
+    assert np.isclose(distances[0][0], ((old - new) ** 2).sum(), rtol=1e-4)
+
+    coderag_index.save_index()
+    coderag_index.load_index(mmap=False)
+    assert list(coderag_index.index.search(other.reshape(1, -1), 2)[1][0]) == [coderag_index.vector_id("a.py"), -1]
+
+def test_compaction_deduplicates_legacy_index(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    import faiss
+    rng = np.random.default_rng(3)
+    vectors = rng.random((3, DIM), dtype=np.float32)
+    legacy_index = faiss.IndexFlatL2(DIM)
+    legacy_index.add(vectors)
+    faiss.write_index(legacy_index, coderag_index.FAISS_INDEX_FILE)
+    legacy_metadata = [{"content": c, "filename": "a.py", "filepath": "a.py"} for c in ("v1", "v2", "v3")]
+    np.save("metadata.npy", legacy_metadata)
+
+    assert coderag_index.compact_index() == (3, 1)
+    coderag_index.load_index()
+    (entry,) = coderag_index.get_metadata().values()
+    assert entry["content"] == "v3"
+    np.testing.assert_allclose(coderag_index.retrieve_vectors(1)[0], vectors[2])
+
+def test_mmap_load_is_read_only(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    vectors = np.random.default_rng(4).random((2, DIM), dtype=np.float32)
+    coderag_index.add_to_index(vectors, "content", "a.py", str(tmp_path / "a.py"))
+    coderag_index.save_index()
+
+    index = coderag_index.load_index(mmap=True, prefault=True)
+    _, ids = index.search(vectors[:1], 1)
+    assert ids[0][0] == coderag_index.vector_id("a.py")
+    with pytest.raises(RuntimeError):
+        coderag_index.add_to_index(vectors, "content", "a.py", str(tmp_path / "a.py"))
+
+def test_flat_shards_are_mapped_without_faiss_mmap_support(monkeypatch, tmp_path):
+    import faiss
+    rng = np.random.default_rng(6)
+    vectors, ids = rng.random((50, DIM), dtype=np.float32), np.arange(100, 150, dtype=np.int64)
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(DIM))
+    index.add_with_ids(vectors, ids)
+    faiss.write_index(index, str(tmp_path / "flat.faiss"))
+    monkeypatch.setattr(index_factory.MappedFlatIndex, "search_block", 16)
+    monkeypatch.delattr(faiss, "IO_FLAG_MMAP_IFC", raising=False)  # As in faiss < 1.10
+
+    mapped = index_factory.read_index_file(str(tmp_path / "flat.faiss"), mmap=True)
+    assert isinstance(mapped, index_factory.MappedFlatIndex) and isinstance(mapped.vectors, np.memmap)
+    expected_distances, expected_ids = index.search(vectors[:3], 5)
+    distances, found = mapped.search(vectors[:3], 5)
+    np.testing.assert_array_equal(found, expected_ids)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4, atol=1e-4)
+    np.testing.assert_array_equal(index_factory.get_ids(mapped), ids)
+    np.testing.assert_array_equal(index_factory.reconstruct_vectors(mapped, [120, 101]), vectors[[20, 1]])
+    assert index_factory.describe_index(mapped)["dim"] == DIM
+
+    hnsw = faiss.IndexIDMap2(faiss.IndexHNSWFlat(DIM, 8))
+    hnsw.add_with_ids(vectors, ids)
+    faiss.write_index(hnsw, str(tmp_path / "hnsw.faiss"))
+    assert index_factory.MappedFlatIndex.open(str(tmp_path / "hnsw.faiss")) is None  # Read by FAISS instead
+
+def test_committed_changes_are_replayed_from_the_log(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    rng = np.random.default_rng(5)
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "a", "a.py", str(tmp_path / "a.py"))
+    coderag_index.save_index()
+    generation = coderag_index._read_index_info()["generation"]
+
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "b", "b.py", str(tmp_path / "b.py"))
+    coderag_index.remove_from_index(str(tmp_path / "a.py"))
+    coderag_index.commit_index()
+    assert coderag_index._read_index_info()["generation"] == generation  # Snapshot was not rewritten
+
+    index = coderag_index.load_index(mmap=False)
+    _, ids = index.search(rng.random((1, DIM), dtype=np.float32), 2)
+    assert list(ids[0]) == [coderag_index.vector_id("b.py"), -1]
+
+def test_replaying_the_log_does_not_append_stored_vectors_again(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_factory, "SQ8_MIN_TRAINING_VECTORS", 20)
+    _use_tmp_index(monkeypatch, tmp_path, "sq8")
+    vectors = np.random.default_rng(6).random((25, DIM), dtype=np.float32)
+    for i, vector in enumerate(vectors[:-1]):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    coderag_index.save_index()
+    coderag_index.add_to_index(vectors[-1:], "last", "last.py", str(tmp_path / "last.py"))
+    coderag_index.commit_index()
+
+    sizes = []
+    for _ in range(3):
+        coderag_index.load_index(mmap=False)
+        sizes.append(coderag_index.vector_stores["default"].nbytes())
+    assert sizes[0] == sizes[1] == sizes[2]
+    stored = coderag_index.vector_stores["default"].get([coderag_index.vector_id("last.py")])
+    np.testing.assert_array_equal(stored, vectors[-1:])
+
+def test_sharded_search_merges_top_k_across_shards(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    monkeypatch.setattr(coderag_index, "INDEX_SHARD_BY", "top_dir")
+    rng = np.random.default_rng(6)
+    vectors = rng.random((6, DIM), dtype=np.float32)
+    paths = ["repo_a/x.py", "repo_a/y.py", "repo_b/x.py", "repo_b/y.py", "repo_c/x.py", "top.py"]
+    for path, vector in zip(paths, vectors):
+        coderag_index.add_to_index(vector.reshape(1, -1), path, os.path.basename(path), str(tmp_path / path))
+    coderag_index.save_index()
+
+    index = coderag_index.load_index(mmap=False)
+    assert sorted(coderag_index.shards) == ["_root", "repo_a", "repo_b", "repo_c"]
+    distances, ids = index.search(vectors[:2], 4)
+
+    # The merged result equals an exhaustive search over all vectors
+    expected_distances = ((vectors[:2, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+    expected_order = np.argsort(expected_distances, axis=1)[:, :4]
+    expected_ids = np.array([[coderag_index.vector_id(paths[j]) for j in row] for row in expected_order])
+    np.testing.assert_array_equal(ids, expected_ids)
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+    # A single shard can be rebuilt on its own; re-sharding happens on a full compaction
+    assert coderag_index.compact_index("repo_b") == (2, 2)
+    monkeypatch.setattr(coderag_index, "INDEX_SHARD_BY", "none")
+    assert coderag_index.compact_index() == (6, 6)
+    assert list(coderag_index.shards) == ["default"]
+    assert os.listdir(tmp_path) and not [f for f in os.listdir(tmp_path) if ".shard-" in f]
+
+def test_sq8_search_is_reranked_with_exact_vectors(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_factory, "SQ8_MIN_TRAINING_VECTORS", 50)
+    monkeypatch.setattr(coderag_index, "FAISS_RERANK_FACTOR", 4)
+    monkeypatch.setattr(coderag_index.index, "rerank_factor", 4)
+    _use_tmp_index(monkeypatch, tmp_path, "sq8")
+
+    vectors = np.random.default_rng(5).random((80, DIM), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    assert coderag_index.shard_types == {"default": "sq8"}
+    coderag_index.save_index()
+
+    coderag_index.load_index(mmap=True)
+    assert set(coderag_index.vector_stores) == {"default"}
+    distances, ids = coderag_index.index.search(vectors[:3], 1)
+    expected = [coderag_index.vector_id(f"f{i}.py") for i in range(3)]
+    assert list(ids[:, 0]) == expected
+    assert np.allclose(distances[:, 0], 0)  # Exact distances, not quantized ones
+
+def test_storage_report_compares_recall():
+    rng = np.random.default_rng(6)
+    vectors = rng.random((500, DIM), dtype=np.float32)
+    report = {row["index_type"]: row for row in index_factory.storage_report(vectors, vectors[:20], k=5)}
+    assert report["flat"]["recall"] == 1.0
+    assert report["sq8"]["bytes_per_vector"] < report["fp16"]["bytes_per_vector"] < report["flat"]["bytes_per_vector"]
+    assert report["sq8"]["recall_reranked"] >= report["sq8"]["recall"]
+
+def test_binary_prefilter_is_built_and_reranked_exactly(monkeypatch, tmp_path):
+    monkeypatch.setattr(coderag_index, "FAISS_BINARY_PREFILTER", "flat")
+    monkeypatch.setattr(coderag_index, "FAISS_BINARY_MIN_VECTORS", 40)
+    _use_tmp_index(monkeypatch, tmp_path)
+
+    vectors = np.random.default_rng(7).random((60, DIM), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    assert coderag_index.binary_prefilters["default"].ntotal == 60
+    coderag_index.remove_from_index(str(tmp_path / "f0.py"))
+    coderag_index.save_index()
+
+    coderag_index.load_index()
+    assert coderag_index.binary_prefilters["default"].ntotal == 59
+    distances, ids = coderag_index.index.search(vectors[1:3], 2)
+    assert list(ids[:, 0]) == [coderag_index.vector_id("f1.py"), coderag_index.vector_id("f2.py")]
+    assert np.allclose(distances[:, 0], 0)
+
+def test_stale_prefilter_files_are_skipped_and_cleared(monkeypatch, tmp_path):
+    monkeypatch.setattr(coderag_index, "FAISS_BINARY_PREFILTER", "flat")
+    monkeypatch.setattr(coderag_index, "FAISS_BINARY_MIN_VECTORS", 40)
+    _use_tmp_index(monkeypatch, tmp_path)
+    vectors = np.random.default_rng(8).random((60, DIM), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    coderag_index.save_index()
+
+    # A manifest written before snapshot generations points at codes next to FAISS_INDEX_FILE
+    info = json.load(open(coderag_index._index_info_file()))
+    prefilter = info["shards"]["default"]["prefilter"]
+    legacy = str(tmp_path / "coderag_index.shard-default")
+    os.replace(prefilter + ".binary", legacy + ".binary")
+    os.replace(prefilter + ".binary.npz", legacy + ".binary.npz")
+    info["shards"]["default"].update(file=legacy + ".faiss", prefilter=legacy)
+    json.dump(info, open(coderag_index._index_info_file(), "w"))
+
+    coderag_index.clear_index()
+    assert not os.path.exists(legacy + ".binary") and not os.path.exists(legacy + ".binary.npz")
+
+    # A manifest naming codes that are gone loads without a prefilter instead of failing
+    for i, vector in enumerate(vectors):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    coderag_index.save_index()
+    prefilter = json.load(open(coderag_index._index_info_file()))["shards"]["default"]["prefilter"]
+    os.remove(prefilter + ".binary")
+    coderag_index.load_index()
+    assert "default" not in coderag_index.binary_prefilters
+
+@pytest.mark.parametrize("extension", [".npy", ".parquet", ".arrow"])
+def test_vectors_round_trip_through_export_and_import(monkeypatch, tmp_path, extension):
+    if extension != ".npy":
+        pytest.importorskip("pyarrow")
+    _use_tmp_index(monkeypatch, tmp_path, "hnsw")
+    vectors = np.random.default_rng(8).random((20, DIM), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    coderag_index.add_to_index(vectors[:1] + 1, "content 0 edited", "f0.py", str(tmp_path / "f0.py"))
+    coderag_index.remove_from_index(str(tmp_path / "f1.py"))
+    coderag_index.save_index()
+
+    export_path = str(tmp_path / f"vectors{extension}")
+    assert coderag_index.export_vectors(export_path) == 19  # Stale HNSW vectors are not exported
+    ids, exported = read_vectors(export_path)
+    by_id = dict(zip(ids.tolist(), exported))
+    assert np.allclose(by_id[coderag_index.vector_id("f0.py")], vectors[0] + 1)
+
+    # Migrate to another index type without computing the embeddings again
+    monkeypatch.setattr(coderag_index, "FAISS_INDEX_TYPE", "flat")
+    coderag_index._reset_shards()
+    assert coderag_index.import_vectors(export_path) == 19
+    assert coderag_index.shard_types == {"default": "flat"}
+    _, found = coderag_index.index.search(vectors[2:3], 1)
+    assert found[0][0] == coderag_index.vector_id("f2.py")
+
+def test_readers_swap_to_new_generations_without_blocking(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    monkeypatch.setattr(coderag_index, "_reader_snapshot", None)
+    rng = np.random.default_rng(9)
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "a", "a.py", str(tmp_path / "a.py"))
+    coderag_index.save_index()
+
+    first = coderag_index.current_index(mmap=False)
+    assert first.ntotal == 1
+    assert coderag_index.current_index(mmap=False) is first  # Unchanged manifest, no reload
+
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "b", "b.py", str(tmp_path / "b.py"))
+    coderag_index.save_index()
+    # While another thread is loading the new generation, queries keep using the current one
+    with coderag_index._reader_reload_lock:
+        assert coderag_index.current_index(mmap=False) is first
+    second = coderag_index.current_index(mmap=False)
+    assert second.ntotal == 2 and first.ntotal == 1
+
+    coderag_index.save_index()
+    assert sorted(os.listdir(coderag_index._snapshot_dir())) == ["gen-00000002", "gen-00000003"]
+
+def test_readers_see_committed_changes_before_the_next_checkpoint(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    monkeypatch.setattr(coderag_index, "_reader_snapshot", None)
+    rng = np.random.default_rng(12)
+    a, b, a2 = rng.random((3, DIM), dtype=np.float32)
+    coderag_index.add_to_index(a.reshape(1, -1), "a", "a.py", str(tmp_path / "a.py"))
+    coderag_index.add_to_index(b.reshape(1, -1), "b", "b.py", str(tmp_path / "b.py"))
+    coderag_index.save_index()
+    reader = coderag_index.current_index(mmap=True)
+
+    coderag_index.add_to_index(a2.reshape(1, -1), "a2", "a.py", str(tmp_path / "a.py"))  # Edited
+    coderag_index.remove_from_index(str(tmp_path / "b.py"))  # Deleted
+    coderag_index.commit_index()
+    assert coderag_index.current_index(mmap=True) is reader  # Same generation, with the log applied
+
+    distances, ids = reader.search(a.reshape(1, -1), 3)
+    assert list(ids[0]) == [coderag_index.vector_id("a.py"), -1, -1]
+    assert np.isclose(distances[0][0], ((a - a2) ** 2).sum(), rtol=1e-4)  # The edited vector, not the old one
+
+def test_files_saved_again_are_hidden_once_from_readers(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    monkeypatch.setattr(coderag_index, "_reader_snapshot", None)
+    rng = np.random.default_rng(13)
+    coderag_index.add_to_index(rng.random((4, DIM), dtype=np.float32), "a", "a.py", str(tmp_path / "a.py"))
+    coderag_index.add_to_index(rng.random((2, DIM), dtype=np.float32), "b", "b.py", str(tmp_path / "b.py"))
+    coderag_index.save_index()
+    get_ids = coderag_index.get_ids
+    gathered = []
+    monkeypatch.setattr(coderag_index, "get_ids", lambda shard: gathered.append(shard) or get_ids(shard))
+    reader = coderag_index.current_index(mmap=False)
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "c", "c.py", str(tmp_path / "c.py"))
+    coderag_index.commit_index()
+    coderag_index.current_index(mmap=False)
+    assert gathered == []  # Snapshot ids are not read until the log removes something
+
+    for _ in range(2):  # The same file removed twice
+        coderag_index.add_to_index(rng.random((4, DIM), dtype=np.float32), "a", "a.py", str(tmp_path / "a.py"))
+        coderag_index.commit_index()
+        coderag_index.current_index(mmap=False)
+        assert reader.overlay.hidden == 4
+    coderag_index.remove_from_index(str(tmp_path / "a.py"))
+    coderag_index.remove_from_index(str(tmp_path / "b.py"))
+    coderag_index.commit_index()
+    coderag_index.current_index(mmap=False)
+    assert reader.overlay.hidden == 6 and len(reader.overlay.removed) == 2
+    assert list(reader.search(rng.random((1, DIM), dtype=np.float32), 2)[1][0]) == [coderag_index.vector_id("c.py"), -1]
+
+def test_adopting_an_unnamespaced_index_leaves_other_files_alone(monkeypatch, tmp_path):
+    import faiss
+    _use_tmp_index(monkeypatch, tmp_path)
+    legacy = faiss.IndexIDMap2(faiss.IndexFlatL2(DIM))
+    legacy.add_with_ids(np.ones((3, DIM), dtype=np.float32), np.arange(3, dtype=np.int64))
+    faiss.write_index(legacy, coderag_index.FAISS_INDEX_FILE)
+    cache = tmp_path / "coderag_index.embeddings.sqlite"
+    notes = tmp_path / "coderag_index.notes.txt"
+    cache.write_bytes(b"cache")
+    notes.write_text("mine")
+
+    assert coderag_index.load_index(mmap=False).ntotal == 3
+    assert not os.path.exists(coderag_index.FAISS_INDEX_FILE)
+    assert cache.read_bytes() == b"cache" and notes.read_text() == "mine"
+
+def test_each_embedding_model_keeps_its_own_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(coderag_index, "MODEL_PROVIDER", "ollama")
+    monkeypatch.setattr(namespaces, "OLLAMA_EMBEDDING_MODEL", "model-a")
+    _use_tmp_index(monkeypatch, tmp_path)
+    rng = np.random.default_rng(10)
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "a", "a.py", str(tmp_path / "a.py"))
+    coderag_index.save_index()
+
+    # Switching the model starts an empty namespace and leaves the other one untouched
+    monkeypatch.setattr(namespaces, "OLLAMA_EMBEDDING_MODEL", "model-b")
+    assert coderag_index.load_index().ntotal == 0
+    coderag_index.add_to_index(rng.random((2, DIM), dtype=np.float32), "b", "b.py", str(tmp_path / "b.py"))
+    coderag_index.save_index()
+
+    monkeypatch.setattr(namespaces, "OLLAMA_EMBEDDING_MODEL", "model-a")
+    assert coderag_index.load_index().ntotal == 1
+    assert list(coderag_index.get_metadata()) == [coderag_index.vector_id("a.py")]
+    listed = namespaces.list_namespaces(coderag_index.FAISS_INDEX_FILE)
+    assert [(n["model"], n["dim"]) for n in listed] == [("model-a", DIM), ("model-b", DIM)]
+
+def test_index_stats_account_for_stale_vectors(monkeypatch, tmp_path):
+    monkeypatch.setattr(coderag_index, "_reader_snapshot", None)
+    _use_tmp_index(monkeypatch, tmp_path, "hnsw")
+    rng = np.random.default_rng(11)
+    coderag_index.add_to_index(rng.random((3, DIM), dtype=np.float32), "a", "a.py", str(tmp_path / "a.py"))
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "b", "b.py", str(tmp_path / "b.py"))
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "b2", "b.py", str(tmp_path / "b.py"))
+    coderag_index.save_index()
+
+    stats = coderag_index.index_stats(top_files=1)
+    assert stats["ntotal"] == 5 and stats["live_vectors"] == 4
+    assert stats["stale_fraction"] == pytest.approx(0.2)
+    assert stats["vectors_per_file"] == 2.0
+    assert stats["largest_files"] == [("a.py", 3)]
+    assert stats["bytes_per_vector"] > DIM * 4  # Full vectors plus ids and graph links
+    assert stats["shards"]["default"]["params"]["class"] == "IndexHNSWFlat"
+    assert "stale or duplicate" in coderag_index.format_stats(stats)
+    json.dumps(stats)  # Serializable for a health endpoint
+
+def test_index_stats_describe_the_served_snapshot(monkeypatch, tmp_path):
+    monkeypatch.setattr(coderag_index, "_reader_snapshot", None)
+    _use_tmp_index(monkeypatch, tmp_path)
+    rng = np.random.default_rng(12)
+    coderag_index.add_to_index(rng.random((2, DIM), dtype=np.float32), "a", "a.py", str(tmp_path / "a.py"))
+    coderag_index.save_index()
+    coderag_index.add_to_index(rng.random((1, DIM), dtype=np.float32), "b", "b.py", str(tmp_path / "b.py"))
+    coderag_index.commit_index()
+
+    # The indexer reports its own index, without waiting for the writer lock or loading a reader copy
+    import threading
+    results = []
+    reporter = threading.Thread(target=lambda: results.append(coderag_index.index_stats()))
+    with coderag_index._lock:
+        reporter.start()
+        reporter.join(5)
+    stats, = results
+    assert stats["ntotal"] == 3 and stats["log_vectors"] == 0 and stats["shards"]["default"]["ntotal"] == 3
+    assert coderag_index._reader_snapshot is None
+
+    # A query process serves the published generation without loading the index into the module
+    monkeypatch.setattr(coderag_index, "_index_loaded", False)
+    coderag_index._reset_shards()
+    stats = coderag_index.index_stats()
+    assert stats["generation"] == coderag_index._read_index_info()["generation"]
+    assert stats["ntotal"] == 3 and stats["log_vectors"] == 1 and stats["live_vectors"] == 3
+    assert stats["shards"]["default"]["ntotal"] == 2
+
+def _low_rank_vectors(n, seed, rank=4):
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=(n, rank)) @ rng.normal(size=(rank, DIM))).astype(np.float32)
+
+def test_pca_reduction_is_trained_persisted_and_applied_to_queries(monkeypatch, tmp_path):
+    monkeypatch.setattr(coderag_index, "EMBEDDING_REDUCTION", "pca")
+    monkeypatch.setattr(coderag_index, "EMBEDDING_REDUCED_DIM", 8)
+    monkeypatch.setattr(coderag_index, "EMBEDDING_REDUCTION_MIN_VECTORS", 50)
+    monkeypatch.setattr(coderag_index, "_reader_snapshot", None)
+    _use_tmp_index(monkeypatch, tmp_path)
+
+    vectors = _low_rank_vectors(60, 13)
+    for i, vector in enumerate(vectors[:49]):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    assert coderag_index.index.d == DIM  # Full embeddings until the reduction can be trained
+    for i, vector in enumerate(vectors[49:], start=49):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    assert coderag_index.index.d == 8 and coderag_index.index.ntotal == 60
+    manifest = coderag_index._read_index_info()
+    assert manifest["dim"] == 8 and manifest["reduction"]["method"] == "pca"
+    assert manifest["reduction"]["recall"] > 0.9  # The vectors span only 4 dimensions
+
+    # Queries are full embeddings, reduced by the published index
+    _, ids = coderag_index.current_index(mmap=False).search(vectors[5:6], 1)
+    assert ids[0][0] == coderag_index.vector_id("f5.py")
+
+    coderag_index.load_index()
+    assert coderag_index.index.d == 8 and coderag_index.reducer.is_trained
+    coderag_index.add_to_index(vectors[:1] * 2, "edited", "f0.py", str(tmp_path / "f0.py"))
+    with pytest.raises(ValueError):
+        coderag_index.add_to_index(np.zeros((1, 8), dtype=np.float32), "reduced", "g.py", str(tmp_path / "g.py"))
+    assert "Reduction: pca, 16 -> 8 dimensions" in coderag_index.format_stats(coderag_index.index_stats())
+
+def test_truncation_reduces_embeddings_from_the_start(monkeypatch, tmp_path):
+    monkeypatch.setattr(coderag_index, "EMBEDDING_REDUCTION", "truncate")
+    monkeypatch.setattr(coderag_index, "EMBEDDING_REDUCED_DIM", 4)
+    _use_tmp_index(monkeypatch, tmp_path)
+    vectors = np.random.default_rng(14).random((10, DIM), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        coderag_index.add_to_index(vector.reshape(1, -1), f"content {i}", f"f{i}.py", str(tmp_path / f"f{i}.py"))
+    coderag_index.save_index()
+
+    stored = coderag_index.retrieve_vectors(1)
+    assert stored.shape == (1, 4)
+    assert np.isclose(np.linalg.norm(stored[0]), np.linalg.norm(vectors[0]), rtol=1e-5)
+    assert coderag_index._read_index_info()["reduction"]["method"] == "truncate"
+    _, ids = coderag_index.index.search(vectors[3:4], 1)
+    assert ids[0][0] == coderag_index.vector_id("f3.py")
+
+def test_reduction_report_compares_recall():
+    report = reduction.reduction_report(_low_rank_vectors(300, 15), dims=[4, 8], methods=("truncate", "pca"))
+    by_key = {(row["method"], row["dim"]): row for row in report}
+    assert by_key[("none", DIM)]["recall"] == 1.0
+    assert by_key[("pca", 4)]["recall"] > 0.9
+    assert by_key[("pca", 8)]["bytes_per_vector"] == 32
+
+def _index_file(path, content, rng):
+    path.write_text(content)
+    stat = os.stat(path)
+    chunks = chunk_file(str(path), content)
+    coderag_index.add_to_index(rng.random((len(chunks), DIM), dtype=np.float32), content, path.name, str(path),
+                               chunks=chunks, file_stat=stat)
+
+def test_file_manifest_finds_new_changed_and_removed_files(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    rng = np.random.default_rng(9)
+    same, touched, edited, deleted = (tmp_path / name for name in ("same.py", "touched.py", "edited.py", "deleted.py"))
+    for path in (same, touched, edited, deleted):
+        _index_file(path, f"# {path.name}\n", rng)
+    coderag_index.save_index()
+    coderag_index.load_index(mmap=False)
+
+    os.utime(touched, ns=(0, 10 ** 9))  # Same content, other mtime
+    edited.write_text("# edited, and longer\n")
+    deleted.unlink()
+    new = tmp_path / "new.py"
+    new.write_text("# new\n")
+
+    paths = [str(path) for path in (same, touched, edited, new)]
+    changed, removed = coderag_index.diff_files(paths)
+    assert changed == [str(edited), str(new)]
+    assert removed == [str(deleted)]
+    assert coderag_index._metadata_store().files()["touched.py"]["mtime_ns"] == 10 ** 9
+
+    coderag_index.remove_from_index(str(deleted))
+    assert "deleted.py" not in coderag_index._metadata_store().files()
+    assert coderag_index.diff_files(paths)[1] == []
+
+def test_files_without_chunks_stay_in_the_manifest(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    rng = np.random.default_rng(10)
+    emptied, blank = tmp_path / "emptied.py", tmp_path / "blank.py"
+    _index_file(emptied, "x = 1\n", rng)
+    emptied.write_text("")
+    blank.write_text("")
+    for path in (emptied, blank):
+        assert chunk_file(str(path), "") == []
+        coderag_index.remove_from_index(str(path), "", os.stat(path))
+    coderag_index.commit_index()
+
+    manifest = coderag_index._metadata_store().files()
+    assert manifest["emptied.py"]["chunks"] == manifest["blank.py"]["chunks"] == 0
+    assert coderag_index.get_metadata() == {}
+    assert coderag_index.diff_files([str(emptied), str(blank)]) == ([], [])  # Not read again
+
+def test_files_chunked_with_other_settings_are_reindexed(monkeypatch, tmp_path):
+    _use_tmp_index(monkeypatch, tmp_path)
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+    coderag_index.add_to_index(np.ones((1, DIM), dtype=np.float32), "x = 1\n", "a.py", str(path),
+                               file_stat=os.stat(path))
+    assert coderag_index.diff_files([str(path)]) == ([str(path)], [])  # Indexed as a whole file
+
+    _index_file(path, "x = 1\n", np.random.default_rng(10))
+    assert coderag_index.diff_files([str(path)]) == ([], [])
+    monkeypatch.setattr(coderag_index, "chunking_signature", lambda: "ast-v1:other")
+    assert coderag_index.diff_files([str(path)]) == ([str(path)], [])
@@ -0,0 +1,66 @@
+import os
+import sys
+import subprocess
+import numpy as np
+import coderag.embeddings as embeddings
+from coderag.local_embeddings import embed_texts, local_embeddings
+from coderag.namespaces import embedding_model
+
+DIM = 256
+TEXTS = ["def load_index(path):\n    return read_index(path)", "loadIndex = readIndex(path)",
+         "totally unrelated prose about cats", "", "naïve = 'ünïcode'"]
+
+def test_vectors_are_normalized_and_similar_for_shared_identifiers():
+    vectors = embed_texts(TEXTS, DIM)
+    assert vectors.dtype == np.float32 and vectors.shape == (len(TEXTS), DIM)
+    np.testing.assert_allclose(np.linalg.norm(vectors[[0, 1, 2, 4]], axis=1), 1, rtol=1e-5)
+    assert not vectors[3].any()  # Nothing to hash in an empty text
+    assert vectors[0] @ vectors[1] > 0.3 > abs(vectors[0] @ vectors[2])
+
+def test_embeddings_do_not_depend_on_the_batch_or_the_process(tmp_path):
+    vectors = embed_texts(TEXTS, DIM)
+    np.testing.assert_array_equal(embed_texts(TEXTS[1:2], DIM)[0], vectors[1])
+
+    # Python's str hash is salted per process; the embedder must not depend on it
+    script = "import sys, numpy as np; from coderag.local_embeddings import embed_texts; " \
+             f"np.save(sys.argv[1], embed_texts({TEXTS!r}, {DIM}))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONHASHSEED="123", PYTHONPATH=root)
+    subprocess.run([sys.executable, "-c", script, str(tmp_path / "v.npy")], check=True, env=env)
+    np.testing.assert_array_equal(np.load(tmp_path / "v.npy"), vectors)
+
+def test_process_pool_matches_in_process(monkeypatch):
+    import coderag.local_embeddings as local
+    monkeypatch.setattr(local, "WORKER_TEXTS", 2)
+    np.testing.assert_array_equal(local_embeddings(TEXTS, DIM, workers=2), embed_texts(TEXTS, DIM))
+
+def test_threads_share_the_power_tables_safely(monkeypatch):
+    import threading
+    import coderag.local_embeddings as local
+    texts = [f"def f{i}():\n    return {'x' * i}" * (i + 1) for i in range(0, 400, 7)]
+    expected = [embed_texts([text], DIM) for text in texts]
+    errors = []
+
+    def embed(order):
+        try:
+            for i in order:
+                np.testing.assert_array_equal(embed_texts([texts[i]], DIM), expected[i])
+        except Exception as e:
+            errors.append(e)
+
+    for _ in range(5):
+        # Start from empty tables, so the threads keep growing them while others read them
+        monkeypatch.setattr(local, "_tables", (np.ones(1, dtype=np.uint64), np.ones(1, dtype=np.uint64)))
+        threads = [threading.Thread(target=embed, args=(range(len(texts))[offset::2],)) for offset in (0, 1, 0, 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert errors == []
+
+def test_local_provider_needs_no_server(monkeypatch):
+    monkeypatch.setattr(embeddings, "MODEL_PROVIDER", "local")
+    monkeypatch.setattr(embeddings, "EMBEDDING_DIM", DIM)
+    result, failed = embeddings.generate_embeddings_batch(TEXTS)
+    assert failed == [] and result.shape == (len(TEXTS), DIM)
+    assert embedding_model("local") == "feature-hashing-v1"
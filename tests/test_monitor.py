@@ -0,0 +1,30 @@
+import numpy as np
+import coderag.monitor as monitor
+from coderag.chunking import Chunk
+
+def test_files_are_requeued_while_the_provider_is_unavailable(monkeypatch, tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+    state = {"unavailable": False, "added": []}
+
+    def embed_file_chunks(paths, contents):
+        state["unavailable"] = True  # The provider goes down during this flush
+        return [([], None, 1) for _ in paths]
+
+    monkeypatch.setattr(monitor, "embed_file_chunks", embed_file_chunks)
+    monkeypatch.setattr(monitor, "provider_unavailable", lambda: state["unavailable"])
+    monkeypatch.setattr(monitor, "add_to_index", lambda *args, **kwargs: state["added"].append(args[3]))
+    monkeypatch.setattr(monitor, "commit_index", lambda: None)
+
+    handler = monitor.CodeChangeHandler()
+    handler._queue(str(path), "index")
+    assert handler.flush() == 0
+    assert handler._pending == {str(path): "index"}  # Requeued
+    assert handler.flush() == 0 and handler._pending  # Paused while the breaker is open
+
+    state["unavailable"] = False
+    monkeypatch.setattr(monitor, "embed_file_chunks", lambda paths, contents: [
+        ([Chunk(content, 1, 1)], np.zeros((1, 2), dtype=np.float32), 0) for content in contents
+    ])
+    assert handler.flush() == 1
+    assert state["added"] == [str(path)] and handler._pending == {}
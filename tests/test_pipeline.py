@@ -0,0 +1,59 @@
+import threading
+import numpy as np
+import coderag.pipeline as pipeline
+
+def _embed_chunks(file_chunks):
+    return [(chunks, np.ones((len(chunks), 2), dtype=np.float32), 0) for chunks in file_chunks]
+
+def _fake_index(monkeypatch):
+    state = {"added": {}, "removed": [], "commits": 0, "writers": set()}
+
+    def add_to_index(embeddings, content, filename, filepath, chunks=None, file_stat=None):
+        state["writers"].add(threading.current_thread())
+        state["added"][filepath] = file_stat
+
+    monkeypatch.setattr(pipeline, "add_to_index", add_to_index)
+    monkeypatch.setattr(pipeline, "remove_from_index",
+                        lambda filepath, content=None, file_stat=None: state["removed"].append((filepath, file_stat)))
+    monkeypatch.setattr(pipeline, "commit_index", lambda: state.__setitem__("commits", state["commits"] + 1))
+    monkeypatch.setattr(pipeline, "provider_unavailable", lambda: False)
+    return state
+
+def test_pipeline_indexes_every_file_from_a_single_writer(monkeypatch, tmp_path):
+    state = _fake_index(monkeypatch)
+    monkeypatch.setattr(pipeline, "embed_chunks", _embed_chunks)
+    paths = []
+    for i in range(40):
+        path = tmp_path / f"f{i}.py"
+        path.write_text(f"x = {i}\n")
+        paths.append(str(path))
+    (tmp_path / "blank.py").write_text("")
+
+    # Queues of one item keep every stage waiting on the next
+    indexed = pipeline.index_files(iter(paths + [str(tmp_path / "blank.py"), str(tmp_path / "missing.py")]),
+                                   readers=3, embed_workers=2, queue_size=1, commit_files=10)
+    assert indexed == 40
+    assert sorted(state["added"]) == sorted(paths)
+    assert all(stat is not None for stat in state["added"].values())
+    assert [(filepath, stat is not None) for filepath, stat in state["removed"]] == [(str(tmp_path / "blank.py"), True)]
+    assert state["commits"] == 4
+    assert state["writers"] == {threading.current_thread()}
+
+def test_files_are_embedded_again_once_the_provider_is_back(monkeypatch, tmp_path):
+    state = _fake_index(monkeypatch)
+    calls = []
+
+    def embed_chunks(file_chunks):
+        calls.append(len(file_chunks))
+        if len(calls) == 1:  # The provider goes down during the first request
+            monkeypatch.setattr(pipeline, "provider_unavailable", lambda: len(calls) == 1)
+            return [([], None, len(chunks)) for chunks in file_chunks]
+        return _embed_chunks(file_chunks)
+
+    monkeypatch.setattr(pipeline, "embed_chunks", embed_chunks)
+    monkeypatch.setattr(pipeline, "embedding_retry_in", lambda: 0)
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+    assert pipeline.index_files([str(path)], embed_workers=1) == 1
+    assert calls == [1, 1]
+    assert list(state["added"]) == [str(path)]
@@ -0,0 +1,51 @@
+import numpy as np
+import coderag.search as search
+import coderag.query_cache as query_cache_module
+from coderag.query_cache import QueryCache, normalize_query
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_and_least_recently_used_are_evicted():
+    clock = _Clock()
+    cache = QueryCache(max_entries=2, ttl=10, clock=clock)
+    cache.put("a", np.zeros((1, 2), dtype=np.float32))
+    cache.put("b", np.ones((1, 2), dtype=np.float32))
+    assert cache.get("a") is not None  # "b" is now least recently used
+    cache.put("c", np.ones((1, 2), dtype=np.float32))
+    assert cache.get("b") is None and cache.get("c") is not None
+
+    clock.now = 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expired"], stats["evictions"]) == (2, 2, 1, 1)
+    assert stats["entries"] == 1
+
+def test_cached_embeddings_are_read_only():
+    cache = QueryCache(max_entries=4, ttl=0)
+    embedding = np.zeros((1, 2), dtype=np.float32)
+    cache.put("q", embedding)
+    embedding[0, 0] = 1  # The caller's array is copied
+    cached = cache.get("q")
+    assert cached[0, 0] == 0 and not cached.flags.writeable
+
+def test_near_identical_queries_share_one_embedding(monkeypatch):
+    calls = []
+
+    def generate_embeddings(text):
+        calls.append(text)
+        return np.array([[float(len(text)), 1.0]], dtype=np.float32)
+
+    monkeypatch.setattr(search, "generate_embeddings", generate_embeddings)
+    monkeypatch.setattr(query_cache_module, "_cache", QueryCache(max_entries=8, ttl=60))
+    assert normalize_query("  where is\tthe   index\nsaved ") == "where is the index saved"
+
+    first = search.query_embedding_for("where is the index saved")
+    second = search.query_embedding_for("  where is\tthe   index\nsaved ")
+    np.testing.assert_array_equal(first, second)
+    assert calls == ["where is the index saved"]
+    assert query_cache_module.query_cache().stats()["hits"] == 1
@@ -0,0 +1,80 @@
+import pytest
+import requests
+import coderag.resilience as resilience
+from coderag.resilience import CircuitBreaker, CircuitOpenError, call_with_retries, is_transient_error
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class _HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def _flaky(failures, error=requests.ConnectionError):
+    """Callable failing with error for its first `failures` calls."""
+    calls = []
+
+    def call():
+        calls.append(None)
+        if len(calls) <= failures:
+            raise error("down")
+        return "ok"
+    return call, calls
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+    call, calls = _flaky(2)
+    breaker = CircuitBreaker("test", failure_threshold=5)
+    assert call_with_retries(call, breaker, retries=3) == "ok"
+    assert len(calls) == 3 and breaker.failures == 0
+
+    rejected, calls = _flaky(1, error=ValueError)
+    with pytest.raises(ValueError):
+        call_with_retries(rejected, breaker, retries=3)
+    assert len(calls) == 1  # Rejected requests are not retried
+
+def test_breaker_fails_fast_and_recovers_after_a_trial_call(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+    clock = _Clock()
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30, clock=clock)
+    call, calls = _flaky(4)
+    with pytest.raises(requests.ConnectionError):
+        call_with_retries(call, breaker, retries=5)
+    assert len(calls) == 3 and breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(call, breaker)
+    assert len(calls) == 3
+
+    clock.now = 31  # Half-open: one trial call, which fails and reopens the breaker
+    with pytest.raises(requests.ConnectionError):
+        call_with_retries(call, breaker, retries=0)
+    assert breaker.is_open and breaker.retry_in() == 30
+    clock.now = 62
+    assert call_with_retries(call, breaker, retries=0) == "ok"
+    assert not breaker.is_open and breaker.retry_in() == 0
+
+def test_transient_error_classification():
+    assert is_transient_error(requests.Timeout())
+    assert is_transient_error(_HTTPError(503)) and is_transient_error(_HTTPError(429))
+    assert not is_transient_error(_HTTPError(500)) and not is_transient_error(_HTTPError(400))
+    assert not is_transient_error(ValueError())
+
+def test_rate_limited_calls_are_retried_without_counting_as_failures(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    call, calls = _flaky(3, error=lambda message: _HTTPError(429))
+    assert call_with_retries(call, breaker, retries=3) == "ok"
+    assert len(calls) == 4 and not breaker.is_open
+
+    # A RateLimitedError was already retried by a rate limiter
+    breaker.record_failure()
+    call, calls = _flaky(1, error=resilience.RateLimitedError)
+    with pytest.raises(resilience.RateLimitedError):
+        call_with_retries(call, breaker, retries=3)
+    assert len(calls) == 1 and breaker.failures == 1
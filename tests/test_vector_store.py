@@ -0,0 +1,21 @@
+import os
+import numpy as np
+from coderag.vector_store import VectorStore, remove_vector_store_files, vector_store_exists
+
+DIM = 4
+
+def test_rewrite_leaves_open_readers_on_their_generation(tmp_path):
+    base = str(tmp_path / "shard")
+    vectors = np.random.default_rng(0).random((6, DIM), dtype=np.float32)
+    writer = VectorStore(base, DIM)
+    writer.add(np.arange(6), vectors)
+    reader = VectorStore(base, DIM, read_only=True)
+
+    writer.rewrite(np.array([4, 5]), vectors[4:] + 1)
+    np.testing.assert_array_equal(reader.get([0, 5]), vectors[[0, 5]])  # Still the ids and rows it opened
+    np.testing.assert_array_equal(VectorStore(base, DIM, read_only=True).get([5]), vectors[5:] + 1)
+    assert np.isnan(writer.get([0])).all()
+
+    assert vector_store_exists(base)
+    assert len(remove_vector_store_files(base)) == 3  # Vectors and ids of the new generation, and its pointer
+    assert not vector_store_exists(base) and not os.listdir(tmp_path)
@@ -0,0 +1,29 @@
+import numpy as np
+from coderag.wal import WriteAheadLog, read_records, OP_ADD, OP_REMOVE_RANGE
+
+def test_records_round_trip_and_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "index.wal")
+    log = WriteAheadLog(path)
+    ids = np.array([7, 9], dtype=np.int64)
+    vectors = np.arange(8, dtype=np.float32).reshape(2, 4)
+    log.append_add("default", ids, vectors)
+    log.append_remove_range("src", 0, 8)
+    log.sync()
+    log.close()
+
+    # Simulate a crash in the middle of writing a third record
+    with open(path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00partial")
+
+    records = list(read_records(path))
+    assert [(lsn, op) for lsn, op, _ in records] == [(1, OP_ADD), (2, OP_REMOVE_RANGE)]
+    shard, logged_ids, logged_vectors = records[0][2]
+    assert shard == "default"
+    np.testing.assert_array_equal(logged_ids, ids)
+    np.testing.assert_array_equal(logged_vectors, vectors)
+    assert records[1][2] == ("src", 0, 8)
+    assert list(read_records(path, after_lsn=1))[0][0] == 2
+
+    reopened = WriteAheadLog(path)
+    assert reopened.last_lsn == 2
+    assert reopened.append_remove_range("src", 8, 16) == 3